@@ -21,22 +21,38 @@ See also: https://www.fullstackpython.com/blog/build-first-slack-bot-python.html
 ##########################################################################
 
 import os
-import re
-import json
 import time
+import errno
+import select
 import signal
-import schedule
+import threading
 
+from collections import Counter
 from .chat import *
 from .exceptions import *
 from .utils import memoized
-from .darksky import DarkSky
-from .zipcode import ZipCodeDB
+from .commands import registry
+from .cache import SqliteCache
+from .darksky import DarkSky, CACHE_TIMEOUT
+from .quota import Quota
+from .forecast import Forecast, FORECAST_FIELDS
+from .dispatch import Dispatcher
+from .outbox import Outbox
+from .prefetch import Prefetcher
+from .scheduler import Scheduler
+from .subscriptions import Subscriptions
+from .zipcode import ArrayZipCodeDB
 from slackclient import SlackClient
 
-# time to wait between websocket reads
+# time to wait between websocket reads if the websocket cannot be selected
 POLLING_INTERVAL = 1
 
+# maximum time to block waiting for a websocket frame or a scheduled job
+WAIT_TIMEOUT = 30
+
+# message subtypes that are never directed at the bot by a user
+IGNORED_SUBTYPES = frozenset(("bot_message", "message_changed", "message_deleted"))
+
 
 ##########################################################################
 ## Helper Functions
@@ -96,11 +112,92 @@ class Bot(object):
 
     zipcodes: string, environment: $ZIPCODE_DATABASE
         Path to the zip codes database CSV file.
+
+    forecast_grid: float, environment: $DARKSKY_CACHE_GRID
+        Size in degrees of the grid cells forecasts are cached by, or None to
+        cache forecasts by the exact coordinates of the zip code.
+
+    forecast_cache: string, environment: $DARKSKY_CACHE_DATABASE
+        Path to a Sqlite3 database to persist cached forecasts in so that they
+        survive restarts, or None to cache forecasts in memory.
+
+    forecast_size: int, environment: $DARKSKY_CACHE_SIZE
+        The maximum number of cached forecasts, by default 1024 in memory or
+        unbounded in the Sqlite3 database (expired forecasts are still purged).
+
+    forecast_stale: int, environment: $DARKSKY_CACHE_STALE
+        Seconds past their expiration that cached forecasts are served while
+        they are refreshed in the background, or None to always wait.
+
+    forecast_limit: int, environment: $DARKSKY_DAILY_LIMIT
+        The maximum number of Dark Sky API calls per UTC day.
+
+    forecast_quota: string, environment: $DARKSKY_QUOTA_DATABASE
+        Path to a Sqlite3 database to count Dark Sky API calls in so that the
+        daily limit is shared by every bot process on the host, or None to
+        count calls in memory.
+
+    forecast_burst: int, environment: $DARKSKY_QUOTA_BURST
+        The maximum number of Dark Sky API calls made at once if calls are
+        spread evenly over the day, or None to only enforce the daily limit.
+
+    prefetch: int, environment: $HANISH_PREFETCH_TOP
+        The number of most requested zipcodes whose forecasts are refreshed
+        before they expire while the bot is running, 0 to disable prefetching.
+
+    prefetch_share: float, environment: $HANISH_PREFETCH_SHARE
+        The maximum share of the daily limit of Dark Sky API calls to spend
+        prefetching forecasts.
+
+    subscriptions: string, environment: $HANISH_SUBSCRIPTIONS_DATABASE
+        Path to a Sqlite3 database to store the channel subscriptions to daily
+        weather broadcasts in so that they survive restarts, or None to keep
+        subscriptions in memory.
+
+    workers: int, environment: $HANISH_WORKERS
+        The number of threads that handle messages while the bot is running,
+        messages in the same channel are always handled in order.
+
+    registry: Registry, default: hanish.commands.registry
+        The commands the bot responds to and their handlers.
     """
 
     def __init__(self, **config):
-        # Holds the weather for yesterday to check if things have changed.
-        self.yesterday = None
+        # Channels subscribed to the daily weather for zipcodes, and the last
+        # forecast broadcast for each (channel, zipcode) to detect changes.
+        self.subscriptions = Subscriptions(environ_default(
+            config, "subscriptions", "HANISH_SUBSCRIPTIONS_DATABASE"
+        ))
+        self.yesterday = {}
+
+        # Shutdown flag and the self-pipe used to wake the run loop on stop,
+        # the lock keeps the pipe from being closed while it is written to
+        # (reentrant since stop is also called by the signal handler).
+        self.shutdown = False
+        self.wakeup = None
+        self.wakeup_lock = threading.RLock()
+
+        # Runs timed tasks from the run loop, waking it if one is added, and
+        # the job that broadcasts the weather when the next subscription is due
+        self.scheduler = Scheduler(wakeup=self.interrupt)
+        self.notice = None
+        self.notice_lock = threading.Lock()
+
+        # Dispatches messages to worker threads while running
+        self.workers = int(environ_default(config, "workers", "HANISH_WORKERS", 4))
+        self.dispatcher = None
+
+        # Posts responses in the background while running
+        self.outbox = None
+
+        # Fetch and post scheduled broadcasts in the background while running
+        self.broadcasters = []
+
+        # Counts the RTM events received, dropped by the filter and handled
+        self.events = Counter()
+
+        # The commands the bot responds to
+        self.registry = config.get("registry", registry)
 
         # NOTE: Normally PEP8 requires breaks at 78 chars, but longer here so
         # that I can more quickly see the configurations and variable names.
@@ -110,22 +207,59 @@ class Bot(object):
 
         # Create the zip codes database
         zipcodes = environ_default(config, "zipcodes", "ZIPCODE_DATABASE", "fixtures/ziplatlon.csv")
-        self.zipdb = ZipCodeDB.load(zipcodes)
+        self.zipdb = ArrayZipCodeDB.load(zipcodes)
 
         # Initialize the Dark Sky API
         darksky_api_key = environ_default(config, "darksky_api_key", "DARKSKY_ACCESS_TOKEN", required=True)
-        self.darksky = DarkSky(darksky_api_key)
+        forecast_grid = environ_default(config, "forecast_grid", "DARKSKY_CACHE_GRID")
+        forecast_cache = environ_default(config, "forecast_cache", "DARKSKY_CACHE_DATABASE")
+        forecast_stale = environ_default(config, "forecast_stale", "DARKSKY_CACHE_STALE")
+        forecast_stale = int(forecast_stale) if forecast_stale else None
+        forecast_size = environ_default(config, "forecast_size", "DARKSKY_CACHE_SIZE")
+        forecast_size = int(forecast_size) if forecast_size else None
+        forecast_limit = int(environ_default(config, "forecast_limit", "DARKSKY_DAILY_LIMIT", 1000))
+        forecast_quota = environ_default(config, "forecast_quota", "DARKSKY_QUOTA_DATABASE")
+        forecast_burst = environ_default(config, "forecast_burst", "DARKSKY_QUOTA_BURST")
+        forecast_burst = int(forecast_burst) if forecast_burst else None
+
+        # Persisted responses are kept until they are too stale to serve, and
+        # converted to forecasts once per process (see DarkSky backend).
+        forecast_backend = None
+        if forecast_cache:
+            forecast_backend = SqliteCache(
+                forecast_cache, ttl=CACHE_TIMEOUT + (forecast_stale or 0),
+                maxsize=forecast_size,
+            )
+
+        self.darksky = DarkSky(
+            darksky_api_key,
+            limit=forecast_limit,
+            quota=Quota(forecast_limit, path=forecast_quota, burst=forecast_burst),
+            grid=float(forecast_grid) if forecast_grid else None,
+            backend=forecast_backend,
+            cache_size=forecast_size or 1024,
+            stale=forecast_stale,
+            parse=Forecast.from_json,
+            fields=FORECAST_FIELDS,
+        )
+
+        # Keep the forecasts of the most requested zipcodes fresh
+        self.prefetcher = Prefetcher(
+            self.darksky,
+            top=int(environ_default(config, "prefetch", "HANISH_PREFETCH_TOP", 10)),
+            share=float(environ_default(config, "prefetch_share", "HANISH_PREFETCH_SHARE", 0.25)),
+        )
 
         # Initialize the Slack API
         slack_api_key = environ_default(config, "slack_api_key", "SLACK_ACCESS_TOKEN", required=True)
         self.slack  = SlackClient(slack_api_key)
 
-    @memoized
+    @property
     def commands(self):
         """
-        This property compiles regular expressions for the commands that are
-        parsed from messages that are @ mentioned to the bot. Currently
-        implemented commands are:
+        The router for the commands that are parsed from messages that are @
+        mentioned to the bot, see hanish.commands. Currently implemented
+        commands are:
 
             - weather (now|tomorrow)
             - weather in (zipcode)
@@ -137,13 +271,7 @@ class Bot(object):
 
         All commands are case insensitive.
         """
-        # TODO: Refactor commands into their own module since I decoupled the
-        # command from the @botid string (which is why it was here originally)
-        return {
-            'weather': re.compile(r'weather\s+(now|tomorrow)', re.I),
-            'location': re.compile(r'weather\s+in\s+(\d{5})', re.I),
-            'darksky': re.compile(r'darksky\s+limit', re.I),
-        }
+        return self.registry.router
 
     @memoized
     def botid(self):
@@ -165,50 +293,72 @@ class Bot(object):
         )
 
     @memoized
-    def atbotid(self):
+    def mentions(self):
         """
-        Computes and memoizes the @botid regular expression for directed
-        messages that may contain commands. E.g. the pattern for <@botid>.
+        The forms of an @botid mention in the text of a message, either
+        <@botid> or <@botid|name> with the name of the bot.
         """
-        return re.compile(
-            re.escape("<@{}>".format(self.botid)), re.I
-        )
+        return ("<@{}>".format(self.botid), "<@{}|".format(self.botid))
 
     def run(self):
         """
-        Connects to the Slack real-time messaging API, polling every second
-        for messages
+        Connects to the Slack real-time messaging API, blocking until a frame
+        arrives on the websocket or the next scheduled task is due so that
+        messages are handled as soon as they are received.
         """
         # Set up the signal handlers
-        # TODO: use threads to better manage communication
         self.shutdown = False
         signal.signal(signal.SIGINT, lambda signal, frame: self.stop())
 
         # Fetch and cache the current weather at startup
-        self.weather()
+        weather = self.weather()
 
-        # Schedule timed events
-        self.set_schedule()
+        # Schedule timed events in the timezone of the default zipcode
+        self.set_schedule(weather.timezone)
 
         # Connect to the real time message API
         if self.slack.rtm_connect():
             # TODO: add better chat logging
             print("slackbot named {} ({}) is connected".format(self.name, self.botid))
 
-            while True:
-
-                # Check if we're shutdown
-                if self.shutdown:
-                    break
-
-                # Check to see if anything has come through the channel
-                self.read_rtm_channel()
-
-                # Run any scheduled tasks
-                schedule.run_pending()
-
-                # Sleep for a bit until the next time we read the channel
-                time.sleep(POLLING_INTERVAL)
+            # Create the self-pipe that stop writes to in order to wake us
+            self.wakeup = os.pipe()
+
+            # Post responses in the background so handlers return immediately
+            self.outbox = Outbox(self.send)
+            self.outbox.start()
+
+            # Handle messages on worker threads so slow commands don't block
+            self.dispatcher = Dispatcher(self.handle_message, workers=self.workers)
+            self.dispatcher.start()
+
+            try:
+                while not self.shutdown:
+                    # Wait for a frame, then check what came through the channel
+                    if self.wait(self.timeout()):
+                        self.read_rtm_channel()
+
+                    # Run any scheduled tasks
+                    self.scheduler.run_pending()
+            finally:
+                # Finish handling the messages that have already been read
+                self.dispatcher.stop()
+                self.dispatcher = None
+
+                # Finish the broadcasts in progress, if any
+                for broadcaster in self.broadcasters:
+                    broadcaster.join(WAIT_TIMEOUT)
+                self.broadcasters = []
+
+                # Send the responses that are still queued
+                self.outbox.close(timeout=WAIT_TIMEOUT)
+                self.outbox = None
+
+                # Detach the pipe before closing it so it is not written to
+                with self.wakeup_lock:
+                    wakeup, self.wakeup = self.wakeup, None
+                    for fd in wakeup:
+                        os.close(fd)
 
         else:
             raise SlackException(
@@ -221,29 +371,106 @@ class Bot(object):
 
     def stop(self):
         """
-        Set the shutdown semaphore
+        Set the shutdown semaphore and wake the run loop if it is waiting
         """
         self.shutdown = True
+        self.interrupt()
+
+    def interrupt(self):
+        """
+        Wakes the run loop if it is waiting, e.g. to recompute its timeout.
+        """
+        with self.wakeup_lock:
+            if self.wakeup is not None:
+                os.write(self.wakeup[1], b"\0")
+
+    def timeout(self):
+        """
+        Returns the number of seconds until the next scheduled task is due,
+        no more than the WAIT_TIMEOUT, e.g. how long the run loop can block.
+        """
+        idle = self.scheduler.idle_seconds()
+        if idle is None:
+            return WAIT_TIMEOUT
+        return max(0, min(idle, WAIT_TIMEOUT))
+
+    def wait(self, timeout):
+        """
+        Blocks until a frame arrives on the RTM websocket, the bot is stopped
+        or the timeout in seconds elapses. Returns True if the channel should
+        be read, e.g. if a frame has arrived.
+        """
+        # Fall back to polling if the websocket is not connected
+        websocket = getattr(self.slack.server, "websocket", None)
+        sock = getattr(websocket, "sock", None)
+        if sock is None:
+            time.sleep(min(timeout, POLLING_INTERVAL))
+            return not self.shutdown
+
+        # SSL may have already decrypted data that select cannot see
+        if hasattr(sock, "pending") and sock.pending():
+            return True
+
+        try:
+            readable, _, _ = select.select([sock, self.wakeup[0]], [], [], timeout)
+        except (select.error, OSError) as e:
+            # Python 2 raises rather than retrying if a signal, e.g. the
+            # SIGINT that stops the bot, interrupts the select.
+            if e.args[0] != errno.EINTR:
+                raise
+            return False
+
+        if self.wakeup[0] in readable:
+            os.read(self.wakeup[0], 512)
+        return sock in readable
 
     def read_rtm_channel(self):
         """
         Reads the RTM channel, parses output, filters messages based on type
         and if they are directed at the bot. If so, passes those messages on
-        to the message handler command.
+        to the message handler command (on a worker thread while running).
         """
 
         # Check for messages on the wire
         # TODO: as soon as we connect, the last message comes through.
         messages = self.slack.rtm_read()
         if messages and len(messages) > 0:
-            # If there are messages, begin filtering and parsing.
+            # If there are messages, drop any not directed at the bot.
             for msg in messages:
-                # Filter only messages from other users
-                if msg["type"] == "message":
-                    # Check if an @botid appears in the message
-                    if self.atbotid.search(msg.get("text", "")):
-                        # Handle the atbotid message
-                        self.handle_message(msg)
+                self.events["received"] += 1
+                if not self.directed(msg):
+                    self.events["dropped"] += 1
+                    continue
+
+                # Handle the directed message, blocking if the workers for
+                # the channel are backed up.
+                self.events["handled"] += 1
+                if self.dispatcher is not None:
+                    self.dispatcher.submit(msg["channel"], msg)
+                else:
+                    self.handle_message(msg)
+
+    def directed(self, msg):
+        """
+        Filters RTM events with cheap checks, returning True only for
+        messages from users (including file shares, thread broadcasts and
+        /me messages, but not edits, deletions or bot messages) that are
+        either direct messages to the bot or that mention the @botid.
+        """
+        # Filter only messages from other users
+        if msg.get("type") != "message" or msg.get("subtype") in IGNORED_SUBTYPES:
+            return False
+
+        if "text" not in msg or msg.get("user") == self.botid:
+            return False
+
+        # Direct message channel ids start with a D
+        if msg.get("channel", "").startswith("D"):
+            return True
+
+        # Check if an @botid appears in the message
+        text = msg["text"]
+        return any(mention in text for mention in self.mentions)
 
     def handle_message(self, msg):
         """
@@ -256,74 +483,25 @@ class Bot(object):
         # Track if an unknown command has occurred
         unknown = True
 
-        # Determine if the message matches any commands
-        for name, command in self.commands.items():
-            match = command.search(msg["text"])
-            if match is not None:
-                unknown = False # We've found at least one command match.
-
-                # Get the method that handles this command
-                handler = getattr(self, "handle_{}_command".format(name), None)
-                if handler is None:
-                    raise NotImplementedError(
-                        "{} command not yet handled".format(name)
-                    )
-
-                try:
-                    # Handle the command
-                    handler(msg)
-                except HanishException as e:
-                    # Respond with hanish exceptions
-                    response = "Sorry, there was a problem with your request: {}".format(e)
-                    self.post(msg['channel'], response)
-                except Exception as e:
-                    # Fatal exception has occurred
-                    self.post(msg['channel'], "A fatal exception has occurred!")
+        # Find all commands and their handlers in a single pass of the text
+        for handler, name, matches in self.registry.dispatch(msg["text"]):
+            unknown = False # We've found at least one command match.
+
+            try:
+                # Handle the command
+                handler(self, msg, matches)
+            except HanishException as e:
+                # Respond with hanish exceptions
+                response = "Sorry, there was a problem with your request: {}".format(e)
+                self.post(msg['channel'], response)
+            except Exception as e:
+                # Fatal exception has occurred
+                self.post(msg['channel'], "A fatal exception has occurred!")
 
         # Handle any unknown commands
         if unknown:
             self.handle_unknown_command(msg)
 
-    def handle_weather_command(self, msg):
-        """
-        Have the chatbot respond to the weather command.
-        """
-        # Parse the weather command arguments
-        # NOTE: only the first weather command will be matched
-        # TODO: handle all unique weather commands/arguments
-        match  = self.commands['weather'].search(msg['text'])
-        period = match.group(1).lower()
-        weather = self.weather()
-
-        if period == "now":
-            response = weather_currently(weather)
-
-        if period == "tomorrow":
-            response = weather_tomorrow(weather)
-
-        self.post(msg['channel'], response)
-
-    def handle_location_command(self, msg):
-        """
-        Have the chatbot respond to the location command.
-        """
-        # Parse the location command arguments
-        for match in self.commands['location'].finditer(msg['text']):
-            zipcode = match.group(1)
-            weather = self.weather(zipcode)
-
-            response = weather_currently(weather)
-            self.post(msg['channel'], response)
-
-    def handle_darksky_command(self, msg):
-        """
-        Have the chatbot respond to the darksky command.
-        """
-        response = "I have made {} Dark Sky API calls today.".format(
-            self.darksky.n_api_calls
-        )
-        self.post(msg['channel'], response)
-
     def handle_unknown_command(self, msg):
         """
         Have the chatbot respond when an unknown command is sent.
@@ -335,21 +513,64 @@ class Bot(object):
 
         self.post(msg['channel'], response)
 
-    def post(self, channel, response):
+    def post(self, channel, response, thread=None):
+        """
+        Helper function to post a message as the slackbot. While running, the
+        message is queued and responses to the same channel are coalesced,
+        otherwise the message is sent immediately.
+        """
+        if self.outbox is not None:
+            self.outbox.post(channel, response, thread)
+        else:
+            self.send(channel, response, thread)
+
+    def send(self, channel, response, thread=None):
         """
-        Helper function to post a message as the slackbot.
+        Posts a message as the slackbot (to the thread, if given) and returns
+        the response from the Slack API.
         """
-        self.slack.api_call(
-            "chat.postMessage", channel=channel, text=response, as_user=True
+        kwargs = {"thread_ts": thread} if thread else {}
+        return self.slack.api_call(
+            "chat.postMessage", channel=channel, text=response, as_user=True, **kwargs
         )
 
-    def set_schedule(self):
+    def set_schedule(self, timezone=None):
+        """
+        Sets the schedule to do tasks on demand. The weather for the default
+        zipcode is broadcast every morning in the timezone, e.g. the timezone
+        of its forecast, or in the local time of the host if None.
         """
-        Sets the schedule to do tasks on demand.
+        # Broadcast the weather for the default zipcode every morning, unless
+        # the default was changed or removed since the first run, and wake
+        # when the next subscription is due.
+        try:
+            self.subscriptions.subscribe_default("#general", self.zipcode, "9:00", timezone)
+        except HanishValueError:
+            self.subscriptions.subscribe_default("#general", self.zipcode, "9:00")
+        self.schedule_notice()
+
+        # Check for popular forecasts to refresh twice per lead time, with
+        # jitter so that several bots sharing a quota don't refresh at once.
+        if self.prefetcher.top > 0:
+            lead = self.prefetcher.lead
+            self.scheduler.every(lead // 2, self.prefetcher.tick, jitter=lead // 10)
+
+    def schedule_notice(self):
         """
-        schedule.every().day.at("9:00").do(self.weather_notice)
+        Schedules the weather notice to run once when the next subscription
+        is due, replacing the notice that was scheduled before. Call whenever
+        the subscriptions change, e.g. from the subscribe command.
+        """
+        with self.notice_lock:
+            if self.notice is not None:
+                self.scheduler.cancel(self.notice)
+                self.notice = None
+
+            due = self.subscriptions.next()
+            if due is not None:
+                self.notice = self.scheduler.at(due, self.weather_notice)
 
-    def weather(self, zipcode=None):
+    def weather(self, zipcode=None, coords=None):
         """
         Quick lookup of the current weather for a given zipcode. If no zipcode
         is supplied, then will look up the weather for the default zipcode.
@@ -359,51 +580,105 @@ class Bot(object):
         zipcode: string, default None
             Zip Code to lookup weather for or None for the default
 
+        coords: tuple, default None
+            The (latitude, longitude) of the zipcode if already resolved, e.g.
+            by a batch lookup, otherwise it is looked up from the zipcode.
+
         Returns
         -------
-        data: json
-            Prints a nicely idented summary of the weather
-
-        msg: string
-            Returns a string of the number of dark sky api calls made.
+        forecast: Forecast
+            The forecast for the zipcode with the number of Dark Sky API
+            calls made, a copy that does not modify the cached forecast.
         """
         # Resolve the latitutde and longitude from the zipcode and query
         # weather. NOTE: this will utilize cacheing on the API if available.
         zipcode  = zipcode or self.zipcode
-        lat, lon = self.zipdb.lookup(zipcode)
-        forecast = self.darksky.forecast(lat, lon)
+        lat, lon = coords or self.zipdb.lookup(zipcode)
+        self.prefetcher.record(zipcode, (lat, lon))
+        return self.localize(zipcode, self.darksky.forecast(lat, lon))
 
-        # Add additional information and return
-        forecast['zipcode'] = zipcode
-        forecast['api_calls'] = self.darksky.n_api_calls
-        return forecast
+    def localize(self, zipcode, forecast):
+        """
+        Returns a copy of the forecast looked up for the zipcode with the
+        zipcode and the number of Dark Sky API calls made.
+        """
+        return forecast.replace(
+            zipcode=zipcode, api_calls=self.darksky.n_api_calls
+        )
 
     def weather_notice(self):
         """
-        Detects if there is any material change in the weather and alerts the
-        channel. This method is scheduled to run every day at 9:00am
+        Broadcasts the weather to every channel whose subscription is due.
+        This method is scheduled to run once when the next subscription is
+        due (see schedule_notice), then schedules itself for the subscription
+        after that; subscriptions are due daily, by default at 9:00am. While
+        running, the forecasts are fetched and posted on a background thread
+        so that the run loop keeps reading messages during a large broadcast.
         """
-        # Keep track if we should alert or not, and get the current weather.
-        alert   = False
-        weather = self.weather()
+        due = self.subscriptions.due()
+        self.schedule_notice()
+        if not due:
+            return
+
+        if self.dispatcher is not None:
+            # Broadcasts may overlap if one takes longer than the next is due
+            self.broadcasters = [
+                broadcaster for broadcaster in self.broadcasters
+                if broadcaster.is_alive()
+            ]
+
+            broadcaster = threading.Thread(
+                target=self.broadcast, args=(due,), name="hanish-broadcast"
+            )
+            broadcaster.daemon = True
+            broadcaster.start()
+            self.broadcasters.append(broadcaster)
+        else:
+            self.broadcast(due)
 
-        if self.yesterday:
-            # Fetch weather for yesterday and today
-            current = weather['hourly']['summary']
-            yesterday = self.yesterday['hourly']['summary']
+    def broadcast(self, due):
+        """
+        Posts the weather to the channels of the due subscriptions if there
+        is any material change in the weather since the last broadcast. The
+        forecast for each unique zipcode is fetched once no matter how many
+        channels are subscribed to it, and the forecasts are fetched
+        concurrently (see DarkSky.forecast_many).
+        """
+        # Fetch the forecast of every unique zipcode that is due in one batch
+        coords, unknown = self.zipdb.lookup_many(sub.zipcode for sub in due)
+        if unknown:
+            # TODO: change to standardized logging functionality
+            print("could not find zipcode(s) {}".format(", ".join(unknown)))
 
-            # Detect if there has been a change
-            # TODO: Define material change and update accordingly
-            if current != yeseterday:
-                alert = True
-        else:
-            alert = True
+        for zipcode, coord in coords.items():
+            self.prefetcher.record(zipcode, coord)
+
+        results, errors = self.darksky.forecast_many(coords.values())
+
+        forecasts = {}
+        for zipcode, coord in coords.items():
+            if coord in errors:
+                # TODO: change to standardized logging functionality
+                print("could not fetch the weather for {}: {}".format(
+                    zipcode, errors[coord]
+                ))
+                continue
 
-        # If alert, post a message.
-        if alert:
-            msg = "Good morning, @channel! A quick update on the weather. "
-            msg += weather_currently(weather)
-            self.post("#general", msg)
+            forecasts[zipcode] = self.localize(zipcode, results[coord])
 
-        # Save today's weather for tomorrow
-        self.yesterday = weather
+        for sub in due:
+            weather = forecasts.get(sub.zipcode)
+            if weather is None:
+                continue
+
+            # Detect if there has been a change since the last broadcast
+            # TODO: Define material change and update accordingly
+            key = (sub.channel, sub.zipcode)
+            yesterday = self.yesterday.get(key)
+            if yesterday is None or weather.hourly_summary != yesterday.hourly_summary:
+                msg = "Good morning, @channel! A quick update on the weather. "
+                msg += weather_currently(weather)
+                self.post(sub.channel, msg)
+
+            # Save today's weather for tomorrow
+            self.yesterday[key] = weather
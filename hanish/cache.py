@@ -0,0 +1,517 @@
+# hanish.cache
+# Cache data structures for API responses and lookups.
+#
+# Author:   Benjamin Bengfort <benjamin@bengfort.com>
+# Created:  Sat Oct 17 11:02:17 2026 -0400
+#
+# Copyright (C) 2016 Bengfort.com
+# For license information, see LICENSE.txt
+#
+# ID: cache.py [] benjamin@bengfort.com $
+
+"""
+Cache data structures for API responses and lookups. The caches implement
+the subset of the dict interface used by the Dark Sky API (get, item access,
+pop, len, and contains) so they can be used interchangeably, and count their
+hits, misses, evictions and expirations.
+"""
+
+##########################################################################
+## Imports
+##########################################################################
+
+import json
+import time
+import sqlite3
+import threading
+
+from collections import OrderedDict
+from .exceptions import DatabaseError
+
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS cache ("
+        "key TEXT PRIMARY KEY, "
+        "value TEXT NOT NULL, "
+        "created REAL NOT NULL, "
+        "accessed REAL NOT NULL"
+    ")"
+)
+
+INDICES = (
+    "CREATE INDEX IF NOT EXISTS cache_created ON cache (created)",
+    "CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)",
+)
+
+
+##########################################################################
+## TTLCache
+##########################################################################
+
+class TTLCache(object):
+    """
+    An in-memory cache with independent size and age policies: entries
+    expire after the ttl, and when the cache holds more than maxsize entries
+    the least recently used entry is evicted. Gets and sets are O(1).
+
+    Entries are kept in two ordered dictionaries, one in order of use for LRU
+    eviction and one of creation times in order of insertion for expiration
+    (and to report the age of entries, see get_with_age). Because every
+    entry lives for the same ttl, the insertion order is also the expiration
+    order so sweeping only visits the entries that have expired. Expired
+    entries are removed lazily when accessed and swept on every write (at
+    most once per sweep interval) so that memory is reclaimed for keys that
+    are never accessed again.
+
+    The cache is thread-safe and counts hits, misses, evictions and expired
+    entries in its stats.
+
+    Usage:
+
+        # Store a value for five minutes
+        cache = TTLCache(maxsize=1024, ttl=300)
+        cache[(38.9, -77.0)] = {'currently': {'temperature': 54.4}}
+
+        # Fetch the value
+        cache.get((38.9, -77.0))
+
+    Parameters
+    ----------
+    maxsize: int or None, default = 1024
+        The maximum number of entries in the cache, or None for no limit.
+
+    ttl: time in seconds or None, default = 300
+        The maximum age of entries in the cache, or None to never expire.
+
+    sweep: time in seconds, default = 60
+        The minimum interval between sweeps of expired entries on writes.
+
+    timer: callable, default = time.time
+        Returns the current time in seconds.
+    """
+
+    def __init__(self, maxsize=1024, ttl=300, sweep=60, timer=time.time):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.sweep_interval = sweep
+        self.timer = timer
+        self.lock = threading.RLock()
+
+        self.data = OrderedDict()     # key -> value in least recently used order
+        self.created = OrderedDict()  # key -> creation time in insertion order
+        self.last_sweep = timer()
+
+        # Cache statistics
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expired = 0
+
+    def get(self, key, default=None):
+        """
+        Returns the value for the key if it is in the cache and not expired,
+        otherwise returns the default.
+        """
+        return self.get_with_age(key, default)[0]
+
+    def get_with_age(self, key, default=None):
+        """
+        Returns a tuple of the value for the key and the number of seconds
+        since it was set if it is in the cache and not expired, otherwise
+        returns the default and None.
+        """
+        with self.lock:
+            if key not in self.data:
+                self.misses += 1
+                return default, None
+
+            # Lazily remove the entry if it has expired
+            age = self.timer() - self.created[key]
+            if self.ttl is not None and age >= self.ttl:
+                self.remove(key)
+                self.expired += 1
+                self.misses += 1
+                return default, None
+
+            # Mark the entry as most recently used
+            value = self.data.pop(key)
+            self.data[key] = value
+            self.hits += 1
+            return value, age
+
+    def peek(self, key, default=None):
+        """
+        Like get_with_age but does not count a hit or miss, mark the entry as
+        recently used or remove it if expired, e.g. to inspect the cache.
+        """
+        with self.lock:
+            if key not in self.data:
+                return default, None
+
+            age = self.timer() - self.created[key]
+            if self.ttl is not None and age >= self.ttl:
+                return default, None
+            return self.data[key], age
+
+    def __getitem__(self, key):
+        value = self.get(key, KeyError)
+        if value is KeyError:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.set(key, value)
+
+    def set(self, key, value, age=0):
+        """
+        Sets the value for the key as though it was set age seconds ago, e.g.
+        to hold a value read from another cache until it would expire there.
+        Note that entries set with an age may outlive the sweep of the
+        entries set before them, but are still expired when accessed.
+        """
+        with self.lock:
+            now = self.timer()
+
+            # Reinsert the key so that it is the newest and most recently used
+            if key in self.data:
+                self.remove(key)
+
+            self.data[key] = value
+            self.created[key] = now - age
+
+            # Sweep expired entries, then evict least recently used entries
+            if now - self.last_sweep >= self.sweep_interval:
+                self.sweep()
+
+            while self.maxsize is not None and len(self.data) > self.maxsize:
+                self.remove(next(iter(self.data)))
+                self.evictions += 1
+
+    def __delitem__(self, key):
+        with self.lock:
+            if key not in self.data:
+                raise KeyError(key)
+            self.remove(key)
+
+    def __contains__(self, key):
+        with self.lock:
+            if key not in self.data:
+                return False
+            return self.ttl is None or self.timer() - self.created[key] < self.ttl
+
+    def __len__(self):
+        with self.lock:
+            self.sweep()
+            return len(self.data)
+
+    def pop(self, key, *default):
+        """
+        Removes the key from the cache and returns its value, or the default
+        if given and the key is not in the cache (otherwise raises KeyError).
+        """
+        with self.lock:
+            if key not in self:
+                if default: return default[0]
+                raise KeyError(key)
+
+            value = self.data[key]
+            self.remove(key)
+            return value
+
+    def clear(self):
+        """
+        Removes all entries from the cache.
+        """
+        with self.lock:
+            self.data.clear()
+            self.created.clear()
+
+    def remove(self, key):
+        """
+        Removes the key from the cache without updating any statistics.
+        """
+        del self.data[key]
+        del self.created[key]
+
+    def sweep(self):
+        """
+        Removes expired entries from the oldest until an unexpired entry is
+        found, returning the number of entries that were removed.
+        """
+        with self.lock:
+            now = self.timer()
+            self.last_sweep = now
+
+            if self.ttl is None:
+                return 0
+
+            count = 0
+            while self.created:
+                key = next(iter(self.created))
+                if now - self.created[key] < self.ttl:
+                    break
+                self.remove(key)
+                count += 1
+
+            self.expired += count
+            return count
+
+    def stats(self):
+        """
+        Returns a dictionary of the cache statistics and current size.
+        """
+        with self.lock:
+            return {
+                "size": len(self.data),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expired": self.expired,
+            }
+
+
+##########################################################################
+## SqliteCache
+##########################################################################
+
+class SqliteCache(object):
+    """
+    A persistent cache stored in a Sqlite3 database on disk so that cached
+    values survive restarts and are shared by all processes that use the same
+    database file. Each entry records when it was created, expired entries are
+    removed when they are accessed and purged on writes (at most once per
+    sweep interval) so that entries for keys that are never accessed again
+    do not accumulate on disk, and if the cache has a maximum size then the
+    least recently accessed entries are evicted when it is exceeded.
+
+    Keys and values must be JSON serializable; keys are serialized so tuples
+    and lists with the same items are the same key.
+
+    Usage:
+
+        # Open the cache and store a value for five minutes
+        cache = SqliteCache('forecasts.db', ttl=300)
+        cache[(38.9, -77.0)] = {'currently': {'temperature': 54.4}}
+
+        # Fetch the value, even from a different process
+        cache.get((38.9, -77.0))
+
+        # When done, close the cache
+        cache.close()
+
+    Parameters
+    ----------
+    path: string
+        Path to the Sqlite3 database file, created if it does not exist.
+
+    ttl: time in seconds or None, default = 300
+        The maximum age of entries in the cache, or None to never expire.
+
+    maxsize: int or None, default = None
+        The maximum number of entries in the cache, or None for no limit.
+
+    sweep: time in seconds, default = 60
+        The minimum interval between purges of expired entries on writes.
+    """
+
+    def __init__(self, path, ttl=300, maxsize=None, sweep=60):
+        self.path = path
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.sweep_interval = sweep
+        self.last_sweep = time.time()
+
+        # Cache statistics (of this process only)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expired = 0
+
+        # Connect to the database, shared between threads behind a lock
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+
+        # Create the table(s) from the schema
+        with self.conn:
+            self.conn.execute(SCHEMA)
+            for index in INDICES:
+                self.conn.execute(index)
+
+    def close(self):
+        """
+        Close the connection to the database, the cached values remain on disk
+        but no further accesses are allowed (otherwise an exception is raised).
+        """
+        with self.lock:
+            self.conn.close()
+            self.conn = None
+
+    def execute(self, sql, *args, **kwargs):
+        """
+        Helper function that executes a single SQL statement in a transaction
+        and returns the cursor to read the results of the query.
+        """
+        # Check the connection
+        if self.conn is None:
+            raise DatabaseError("cache database has been closed")
+
+        with self.conn:
+            return self.conn.execute(sql, *args, **kwargs)
+
+    def get(self, key, default=None):
+        """
+        Returns the value for the key if it is in the cache and not expired,
+        otherwise returns the default.
+        """
+        return self.get_with_age(key, default)[0]
+
+    def get_with_age(self, key, default=None):
+        """
+        Returns a tuple of the value for the key and the number of seconds
+        since it was set if it is in the cache and not expired, otherwise
+        returns the default and None.
+        """
+        now = time.time()
+        key = json.dumps(key)
+
+        with self.lock:
+            row = self.execute(
+                "SELECT value, created FROM cache WHERE key=?", (key,)
+            ).fetchone()
+
+            if row is None:
+                self.misses += 1
+                return default, None
+
+            # Lazily delete the entry if it has expired
+            age = now - row[1]
+            if self.ttl is not None and age >= self.ttl:
+                self.execute("DELETE FROM cache WHERE key=?", (key,))
+                self.expired += 1
+                self.misses += 1
+                return default, None
+
+            # Mark the entry as recently accessed, only needed for eviction
+            if self.maxsize is not None:
+                self.execute("UPDATE cache SET accessed=? WHERE key=?", (now, key))
+            self.hits += 1
+            return json.loads(row[0]), age
+
+    def peek(self, key, default=None):
+        """
+        Like get_with_age but does not count a hit or miss, mark the entry as
+        recently accessed or delete it if expired, so it never writes.
+        """
+        with self.lock:
+            row = self.execute(
+                "SELECT value, created FROM cache WHERE key=?", (json.dumps(key),)
+            ).fetchone()
+
+        if row is None:
+            return default, None
+
+        age = time.time() - row[1]
+        if self.ttl is not None and age >= self.ttl:
+            return default, None
+        return json.loads(row[0]), age
+
+    def __getitem__(self, key):
+        value = self.get(key, KeyError)
+        if value is KeyError:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        now = time.time()
+
+        with self.lock:
+            self.execute(
+                "INSERT OR REPLACE INTO cache VALUES (?,?,?,?)",
+                (json.dumps(key), json.dumps(value), now, now)
+            )
+
+            if self.maxsize is not None or now - self.last_sweep >= self.sweep_interval:
+                self.evict()
+
+    def __delitem__(self, key):
+        with self.lock:
+            cursor = self.execute(
+                "DELETE FROM cache WHERE key=?", (json.dumps(key),)
+            )
+
+            if cursor.rowcount == 0:
+                raise KeyError(key)
+
+    def __contains__(self, key):
+        return self.get(key, KeyError) is not KeyError
+
+    def __len__(self):
+        with self.lock:
+            if self.ttl is None:
+                cursor = self.execute("SELECT count(key) FROM cache")
+            else:
+                cursor = self.execute(
+                    "SELECT count(key) FROM cache WHERE created > ?",
+                    (time.time() - self.ttl,)
+                )
+            return cursor.fetchone()[0]
+
+    def pop(self, key, *default):
+        """
+        Removes the key from the cache and returns its value, or the default
+        if given and the key is not in the cache (otherwise raises KeyError).
+        """
+        with self.lock:
+            value = self.get(key, KeyError)
+            if value is KeyError:
+                if default: return default[0]
+                raise KeyError(key)
+
+            self.execute("DELETE FROM cache WHERE key=?", (json.dumps(key),))
+            return value
+
+    def clear(self):
+        """
+        Removes all entries from the cache.
+        """
+        with self.lock:
+            self.execute("DELETE FROM cache")
+
+    def evict(self):
+        """
+        Removes all expired entries and then, if the cache is still larger
+        than its maximum size, the least recently accessed entries.
+        """
+        with self.lock:
+            now = time.time()
+            self.last_sweep = now
+
+            if self.ttl is not None:
+                cursor = self.execute(
+                    "DELETE FROM cache WHERE created <= ?", (now - self.ttl,)
+                )
+                self.expired += cursor.rowcount
+
+            if self.maxsize is None:
+                return
+
+            count = self.execute("SELECT count(key) FROM cache").fetchone()[0]
+            if count > self.maxsize:
+                cursor = self.execute(
+                    "DELETE FROM cache WHERE key IN ("
+                    "SELECT key FROM cache ORDER BY accessed LIMIT ?)",
+                    (count - self.maxsize,)
+                )
+                self.evictions += cursor.rowcount
+
+    def stats(self):
+        """
+        Returns a dictionary of the cache statistics and current size.
+        """
+        return {
+            "size": len(self),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expired": self.expired,
+        }
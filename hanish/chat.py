@@ -17,23 +17,27 @@ Constructs responses to queries from data.
 ## Response formulations
 ##########################################################################
 
+def weather_conditions(weather):
+    """
+    Returns the current conditions that follow the zipcode in the response to
+    the current weather, which are rendered once per cached forecast (see
+    Forecast.conditions).
+    """
+    return u" it is {:0.1f}\u00b0F and {}. It will be {}".format(
+        weather.temperature, weather.summary.lower(),
+        weather.hourly_summary.lower(),
+    )
+
+
 def weather_currently(weather):
     """
     Returns a string representation of the current weather conditions.
     """
-    currently = weather['currently']
-    hourly = weather['hourly']
-    return (
-        u"Currently in {} it is {:0.1f}\u00b0F and {}. "
-        u"It will be {}"
-    ).format(
-        weather['zipcode'], currently['temperature'],
-        currently['summary'].lower(), hourly['summary'].lower(),
-    )
+    return u"Currently in {}{}".format(weather.zipcode, weather.conditions)
 
 
 def weather_tomorrow(weather):
     """
     Returns a string representation of the forecast for tomorrow.
     """
-    return weather['daily']['summary']
+    return weather.daily_summary
@@ -0,0 +1,367 @@
+# hanish.commands
+# Parses commands from messages directed at the bot.
+#
+# Author:   Benjamin Bengfort <benjamin@bengfort.com>
+# Created:  Sat Oct 17 15:10:08 2026 -0400
+#
+# Copyright (C) 2016 Bengfort.com
+# For license information, see LICENSE.txt
+#
+# ID: commands.py [] benjamin@bengfort.com $
+
+"""
+Parses commands from messages directed at the bot and registers the handlers
+that respond to them. Handlers are registered with the command decorator:
+
+    @command('ping', r'ping', help="ping")
+    def ping_command(bot, msg, matches):
+        bot.post(msg['channel'], "pong")
+"""
+
+##########################################################################
+## Imports
+##########################################################################
+
+import re
+
+from .chat import weather_currently, weather_tomorrow
+from .scheduler import parse_time, zone
+from .exceptions import HanishValueError
+from collections import OrderedDict, namedtuple
+
+
+# A registered command, see Registry.register
+Command = namedtuple("Command", "name pattern handler priority metadata")
+
+
+##########################################################################
+## Command Router
+##########################################################################
+
+class CommandRouter(object):
+    r"""
+    A CommandRouter compiles the patterns of all commands into a single
+    regular expression that is an alternation of one named group per command,
+    so that every command in a message is found in one scan of the text no
+    matter how many commands there are. The arguments captured by the groups
+    in each command's pattern are returned with the command, so that handlers
+    do not have to search the text again.
+
+    Commands are matched case insensitively and, where more than one command
+    pattern matches at the same position, the first command is preferred.
+
+    Usage:
+
+        router = CommandRouter([
+            ('weather', r'weather\s+(now|tomorrow)'),
+            ('darksky', r'darksky\s+limit'),
+        ])
+
+        router.route("weather now and weather tomorrow")
+        # OrderedDict([('weather', [('now',), ('tomorrow',)])])
+
+    Parameters
+    ----------
+    commands: list of (name, pattern) tuples
+        The name of each command and the regular expression that matches it;
+        names must be valid Python identifiers and patterns may only contain
+        numbered (not named) groups for their arguments.
+
+    flags: int, default = re.I
+        The regular expression flags to compile the commands with.
+    """
+
+    def __init__(self, commands, flags=re.I):
+        self.patterns = OrderedDict(commands)
+        self.flags = flags
+
+        # Compile each command individually, e.g. for testing a single command
+        self.commands = OrderedDict(
+            (name, re.compile(pattern, flags))
+            for name, pattern in self.patterns.items()
+        )
+
+        # Compile the alternation of all commands
+        self.regex = re.compile("|".join(
+            "(?P<{}>{})".format(name, pattern)
+            for name, pattern in self.patterns.items()
+        ), flags)
+
+        # Map the index of each command group to its name and argument groups
+        self.groups = {}
+        for name, command in self.commands.items():
+            idx = self.regex.groupindex[name]
+            self.groups[idx] = (name, idx + 1, idx + 1 + command.groups)
+
+    def scan(self, text):
+        """
+        Yields a (name, args) tuple for every command in the text in the
+        order that they appear, where args is a tuple of the captured groups.
+        """
+        for match in self.regex.finditer(text):
+            name, start, stop = self.groups[match.lastindex]
+            yield name, tuple(match.group(idx) for idx in range(start, stop))
+
+    def route(self, text):
+        """
+        Returns an ordered dictionary of the commands in the text, mapping
+        each command name to the list of args of every time it appears. The
+        commands are in the order they were given to the router.
+        """
+        found = {}
+        for name, args in self.scan(text):
+            found.setdefault(name, []).append(args)
+
+        return OrderedDict(
+            (name, found[name]) for name in self.patterns if name in found
+        )
+
+    def __getitem__(self, name):
+        return self.commands[name]
+
+    def __contains__(self, name):
+        return name in self.commands
+
+    def __iter__(self):
+        return iter(self.commands)
+
+    def __len__(self):
+        return len(self.commands)
+
+
+##########################################################################
+## Command Registry
+##########################################################################
+
+class Registry(object):
+    """
+    A Registry collects the commands the bot responds to, each with a pattern
+    and a handler that is called with the bot, the message and the args of
+    every time the command appears in the message. Commands are matched and
+    handled in order of priority (highest first) then of registration.
+
+    The router and the table that maps command names to handlers are built
+    when first used and rebuilt only if another command is registered, so
+    dispatching a message only requires one scan of its text and one
+    dictionary lookup per command found.
+
+    Usage:
+
+        registry = Registry()
+
+        @registry.register('ping', r'ping', help="ping")
+        def ping_command(bot, msg, matches):
+            bot.post(msg['channel'], "pong")
+    """
+
+    def __init__(self):
+        self.commands = OrderedDict()
+        self._router = None
+        self._table = None
+
+    def register(self, name, pattern, priority=0, **metadata):
+        """
+        Decorator that registers the function as the handler of the command,
+        replacing any command already registered with the same name.
+
+        Parameters
+        ----------
+        name: string
+            The name of the command, must be a valid Python identifier.
+
+        pattern: string
+            The regular expression that matches the command, with a numbered
+            group for each argument passed to the handler.
+
+        priority: int, default = 0
+            Commands with higher priority are matched and handled first.
+
+        metadata: dict
+            Additional information about the command, e.g. help text.
+        """
+        def decorator(handler):
+            self.add(name, pattern, handler, priority, **metadata)
+            return handler
+        return decorator
+
+    def add(self, name, pattern, handler, priority=0, **metadata):
+        """
+        Registers the handler of the command, see register.
+        """
+        self.commands.pop(name, None)
+        self.commands[name] = Command(name, pattern, handler, priority, metadata)
+        self._router = None
+        self._table = None
+
+    @property
+    def router(self):
+        """
+        The CommandRouter that matches all registered commands by priority.
+        """
+        if self._router is None:
+            commands = sorted(
+                self.commands.values(), key=lambda command: -command.priority
+            )
+            self._router = CommandRouter([
+                (command.name, command.pattern) for command in commands
+            ])
+        return self._router
+
+    @property
+    def table(self):
+        """
+        The dispatch table that maps command names to their handlers.
+        """
+        if self._table is None:
+            self._table = dict(
+                (command.name, command.handler)
+                for command in self.commands.values()
+            )
+        return self._table
+
+    def dispatch(self, text):
+        """
+        Returns a list of (handler, name, args) for every command in the text
+        in the order they should be handled, where args is a list of the
+        captured groups of every time the command appears in the text.
+        """
+        table = self.table
+        return [
+            (table[name], name, matches)
+            for name, matches in self.router.route(text).items()
+        ]
+
+    def __getitem__(self, name):
+        return self.commands[name]
+
+    def __contains__(self, name):
+        return name in self.commands
+
+    def __iter__(self):
+        return iter(self.commands)
+
+    def __len__(self):
+        return len(self.commands)
+
+
+# The default registry of the commands the bot responds to
+registry = Registry()
+command = registry.register
+
+
+##########################################################################
+## Commands
+##########################################################################
+
+@command('weather', r'weather\s+(now|tomorrow)', help="weather (now|tomorrow)")
+def weather_command(bot, msg, matches):
+    """
+    Have the chatbot respond to the weather command.
+    """
+    # Parse the weather command arguments
+    # NOTE: only the first weather command will be handled
+    # TODO: handle all unique weather commands/arguments
+    period = matches[0][0].lower()
+    weather = bot.weather()
+
+    if period == "now":
+        response = weather_currently(weather)
+
+    if period == "tomorrow":
+        response = weather_tomorrow(weather)
+
+    bot.post(msg['channel'], response)
+
+
+@command('location', r'weather\s+in\s+(\d{5})', help="weather in (zipcode)")
+def location_command(bot, msg, matches):
+    """
+    Have the chatbot respond to the location command.
+    """
+    # Resolve the zipcodes of the location commands in one batch
+    zipcodes = [args[0] for args in matches]
+    coords, unknown = bot.zipdb.lookup_many(zipcodes)
+
+    for zipcode in coords:
+        weather = bot.weather(zipcode, coords[zipcode])
+
+        response = weather_currently(weather)
+        bot.post(msg['channel'], response)
+
+    # Report any unknown zip codes after responding to the known ones
+    if unknown:
+        raise HanishValueError(
+            "could not find zipcode(s) {}".format(", ".join(unknown))
+        )
+
+
+@command('darksky', r'darksky\s+limit', help="darksky limit")
+def darksky_command(bot, msg, matches):
+    """
+    Have the chatbot respond to the darksky command.
+    """
+    # The quota counts the calls of every process sharing it, the header
+    # only those reported to this process since it started.
+    quota = bot.darksky.quota
+    if quota is None:
+        response = "I have made {} Dark Sky API calls today.".format(
+            bot.darksky.n_api_calls
+        )
+    else:
+        response = "I have made {} Dark Sky API calls today, {} remaining.".format(
+            quota.used, quota.remaining
+        )
+    bot.post(msg['channel'], response)
+
+
+@command('subscribe', r'subscribe\s+to\s+(\d{5})(?:\s+at\s+(\d{1,2}:\d{2}))?',
+         help="subscribe to (zipcode) [at (H:MM)]")
+def subscribe_command(bot, msg, matches):
+    """
+    Subscribe the channel to the daily weather for the zipcodes, at the time
+    of day in the timezone of the forecast for each zipcode.
+    """
+    # Invalid times of day are reported before subscribing to any zipcode
+    for _, at in matches:
+        parse_time(at or "9:00")
+
+    for zipcode, at in matches:
+        weather = bot.weather(zipcode)
+        timezone = weather.timezone
+        try:
+            zone(timezone)
+        except HanishValueError:
+            # Unknown timezones fall back to the local time of the host
+            timezone = None
+
+        sub = bot.subscriptions.subscribe(
+            msg['channel'], zipcode, at or "9:00", timezone
+        )
+
+        response = "I'll post the weather for {} here every day at {}:{:02d}".format(
+            sub.zipcode, sub.hour, sub.minute
+        )
+        if sub.timezone:
+            response += " ({})".format(sub.timezone)
+        response += "."
+        bot.post(msg['channel'], response)
+
+    # Broadcast when the earliest subscription is due
+    bot.schedule_notice()
+
+
+@command('unsubscribe', r'unsubscribe\s+from\s+(\d{5})',
+         help="unsubscribe from (zipcode)")
+def unsubscribe_command(bot, msg, matches):
+    """
+    Unsubscribe the channel from the daily weather for the zipcodes.
+    """
+    for args in matches:
+        zipcode = args[0]
+        bot.subscriptions.unsubscribe(msg['channel'], zipcode)
+        bot.yesterday.pop((msg['channel'], zipcode), None)
+
+        response = "I'll no longer post the weather for {} here.".format(zipcode)
+        bot.post(msg['channel'], response)
+
+    bot.schedule_notice()
@@ -18,24 +18,98 @@ Handlers and functionality for making Dark Sky API requests.
 ##########################################################################
 
 import requests
+import threading
 
 try:
     # Python 3
     from urllib.parse import urljoin
+    from queue import Queue, Empty
 except ImportError:
     # Python 2
     from urlparse import urljoin
+    from Queue import Queue, Empty
 
 
+from itertools import combinations
 from datetime import date, datetime
-from expiringdict import ExpiringDict
+from collections import OrderedDict
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
+from requests.packages.urllib3.exceptions import HTTPError as URLLibHTTPError
+from .cache import TTLCache
+from .quota import Quota
+from .utils import SingleFlight
+from .stream import ijson, parse, project, fieldtree, PARSE_ERRORS
 from .exceptions import HanishValueError
-from .exceptions import DarkSkyException
+from .exceptions import DarkSkyException, QuotaExceeded
 
 
 DARKSKY_API_URL  = "https://api.darksky.net"
 API_CALLS_HEADER = "X-Forecast-API-Calls"
 
+# Data blocks in forecast responses that can be excluded from the request
+DATA_BLOCKS = ("currently", "minutely", "hourly", "daily", "alerts", "flags")
+
+# HTTP status codes of responses that are retried with backoff
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Longest time in seconds to wait before a retry, whatever Retry-After says
+MAX_RETRY_AFTER = 10
+
+# Default number of seconds that forecasts are served from the cache
+CACHE_TIMEOUT = 300
+
+# Exceptions raised while reading the body of a response
+READ_ERRORS = (requests.RequestException, URLLibHTTPError, IOError)
+
+
+##########################################################################
+## Retries
+##########################################################################
+
+class CappedRetry(Retry):
+    """
+    Retries that respect the Retry-After header of rate limited and
+    unavailable responses but wait no longer than MAX_RETRY_AFTER seconds, so
+    that an upstream asking for a long wait never blocks the caller (and every
+    request coalesced with it) for that long.
+
+    If a quota is specified, every retry except those of connection errors,
+    which never reached the API, is counted against it as another request,
+    raising QuotaExceeded rather than retrying if the quota is exceeded.
+    """
+
+    def __init__(self, quota=None, **kwargs):
+        super(CappedRetry, self).__init__(**kwargs)
+        self.quota = quota
+
+    def new(self, **kwargs):
+        kwargs.setdefault("quota", self.quota)
+        return super(CappedRetry, self).new(**kwargs)
+
+    def increment(self, method=None, url=None, response=None, error=None,
+                  _pool=None, _stacktrace=None):
+        retry = super(CappedRetry, self).increment(
+            method, url, response, error, _pool, _stacktrace
+        )
+
+        if self.quota is not None:
+            if error is None or not self._is_connection_error(error):
+                try:
+                    self.quota.acquire()
+                except QuotaExceeded:
+                    if response is not None:
+                        response.release_conn()
+                    raise
+
+        return retry
+
+    def get_retry_after(self, response):
+        retry_after = super(CappedRetry, self).get_retry_after(response)
+        if retry_after is None:
+            return None
+        return min(retry_after, MAX_RETRY_AFTER)
+
 
 ##########################################################################
 ## DarkSky API
@@ -55,37 +129,155 @@ class DarkSky(object):
         The API key obtained from the Dark Sky developers service.
 
     limit: int or None, default = 1000
-        Set a limit to the number of requests made per day. The limit is
-        checked via the X-Forecast-API-Calls header made in API responses,
-        therefore a single request per process will always be made before the
-        limit can be observed.
+        Set a limit to the number of requests made per UTC day, requests that
+        would exceed the limit are refused before they are sent by raising
+        QuotaExceeded. The count is also updated from the X-Forecast-API-Calls
+        header of API responses. If None, requests are not limited.
 
-    cache: time in seconds or None, default = 300
+    cache: time in seconds or None, default = CACHE_TIMEOUT (300)
         Cache requests to a specific zipcode for a specific time limit, to
         reduce lookups and rate limit queries to the Dark Sky service.
+
+    grid: float or None, default = None
+        If specified, coordinates are snapped to the center of a grid cell of
+        this size in degrees before the cache lookup and request, so that all
+        locations in the same cell share a single cached forecast (0.1 degrees
+        is roughly 7 miles). The cache_hits and cache_misses totals help tune
+        the resolution.
+
+    backend: cache object or None, default = None
+        The cache to store responses in, e.g. a persistent SqliteCache so that
+        forecasts survive restarts. The backend must implement get_with_age,
+        peek and item assignment like the caches in hanish.cache, and is
+        responsible for expiring its own entries (after the cache time plus
+        the stale time if specified). If parse is specified, the backend
+        stores the parsed JSON of responses and the converted forecasts are
+        held in an in-memory TTLCache in front of it, so that each response is
+        converted once per process. If None, an in-memory TTLCache is used.
+
+    cache_size: int or None, default = 1024
+        The maximum number of forecasts held by the in-memory cache, the
+        least recently used forecasts are evicted when it is full.
+
+    stale: time in seconds or None, default = None
+        If specified, forecasts that are older than the cache time but not
+        older than the cache time plus the stale time are returned immediately
+        while the forecast is refreshed in the background (at most one refresh
+        per request at a time). Forecasts that are older than that are fetched
+        synchronously. If None, expired forecasts are always fetched.
+
+    pool_size: int, default = 10
+        The maximum number of keep-alive connections to the API that are kept
+        open for reuse, e.g. the number of concurrent requests without waiting.
+        This is also the number of threads used by forecast_many.
+
+    timeout: float or (connect, read) tuple, default = (3.05, 10)
+        The number of seconds to wait to connect to the API and to wait for
+        the API to send data before giving up and raising a DarkSkyException.
+
+    retries: int, default = 3
+        The number of times connection errors and responses that are rate
+        limited (429) or server errors (5xx) are retried before giving up.
+        Retries that reach the API are counted against the quota.
+
+    backoff: float, default = 0.5
+        The backoff factor between retries, the nth retry waits backoff * 2^n
+        seconds, or as long as the Retry-After header of the response says
+        up to MAX_RETRY_AFTER seconds.
+
+    parse: callable or None, default = None
+        If specified, called with the parsed JSON of every response to convert
+        it before it is cached in memory and returned, e.g. Forecast.from_json
+        to cache compact forecasts. Responses cannot be derived from cached
+        responses with fewer exclusions. If None, the parsed JSON is cached
+        and returned.
+
+    fields: list of strings or None, default = None
+        If specified, only these fields of responses are kept, as dotted paths
+        e.g. "currently" or "hourly.summary" (see hanish.stream). Data blocks
+        that are not excluded may therefore be missing some of their fields.
+        If None, responses are kept in full.
+
+    stream: bool, default = False
+        If True and fields are specified and the optional ijson library is
+        installed, responses are parsed incrementally as they are received so
+        that only the projected fields are built, which greatly reduces the
+        peak memory of large (e.g. extended) responses at some cost in CPU.
+
+    quota: Quota or None, default = None
+        The quota that counts requests against the limit, e.g. a Quota stored
+        in a database shared by several processes, or that spreads requests
+        over the day. If None, a Quota for the limit is kept in memory.
     """
 
-    def __init__(self, apikey, limit=1000, cache=300):
+    def __init__(self, apikey, limit=1000, cache=CACHE_TIMEOUT, grid=None,
+                 backend=None, cache_size=1024, stale=None, pool_size=10,
+                 timeout=(3.05, 10), retries=3, backoff=0.5, parse=None,
+                 fields=None, stream=False, quota=None):
         self.apikey      = apikey  # API Key included in each request
         self.limit       = limit   # Per-day limit (can be None)
         self.n_api_calls = 0       # Reported number of API queries made
         self.last_query  = None    # Datetime of the last query made
         self.cache_timeout = cache # Age in seconds of values in the cache
-
-        # TODO: Create a cache data structure that implements similar
-        # functionality to ``ExpiringDict`` as an internal utility that has no
-        # limit and deals with zip codes and method responses specificially.
-        # Cache is a third party utility, ExpiringDict, which we use here for
-        # speed of development, but should implement ourselves in the future.
-        self.cache = ExpiringDict(max_len=limit, max_age_seconds=cache or 0)
+        self.grid = grid           # Size of cache grid cells in degrees
+        self.stale = stale         # Max age in seconds past the cache timeout
+        self.cache_hits = 0        # Number of cache hits
+        self.cache_misses = 0      # Number of cache misses
+        self.parse = parse         # Converts responses before caching
+
+        # Counts requests against the per-day limit
+        if quota is None and limit is not None:
+            quota = Quota(limit)
+        self.quota = quota
+
+        # Projection of the fields kept from responses
+        self.fields = fieldtree(fields) if fields else None
+        self.stream = bool(stream and fields and ijson is not None)
+
+        # Background refreshes of stale forecasts by cache key
+        self.refreshing = {}
+        self.lock = threading.Lock()
+
+        # Concurrent requests for the same cache key share one API call
+        self.flights = SingleFlight()
+
+        # Requests reuse pooled keep-alive connections and retry with backoff
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.session = requests.Session()
+        self.session.headers['Accept-Encoding'] = 'gzip'
+        self.session.mount(DARKSKY_API_URL, HTTPAdapter(
+            pool_connections=1, pool_maxsize=pool_size, max_retries=CappedRetry(
+                total=retries, backoff_factor=backoff, quota=quota,
+                status_forcelist=RETRY_STATUSES, raise_on_status=False,
+            ),
+        ))
+
+        # Forecasts are cached in memory unless another backend is specified,
+        # converted forecasts are cached in memory in front of the backend.
+        self.cache = backend
+        self.backend = None
+        if backend is None or parse is not None:
+            self.cache = TTLCache(maxsize=cache_size, ttl=(cache or 0) + (stale or 0))
+            self.backend = backend
 
     def forecast(self, lat, lon,
                  exclude=None, extend=False, lang="en", units="auto"):
         """
         Performs a cached lookup of the forecast for the given latitude and
-        longitude. If the coordinates are in the cache and not expired, then
-        that value is returned. Otherwise a request is made to the Dark Sky
-        API. Note that changes in query arguments do not modify the cache.
+        longitude. If the request is in the cache and not expired, then
+        that value is returned (see stale for serving expired values).
+        Otherwise a request is made to the Dark Sky API. Responses are cached
+        by the coordinates and query arguments, a request that excludes data
+        blocks can also be served from a cached response for the same request
+        that did not exclude them.
+
+        If the grid is specified the coordinates are snapped to the center of
+        their grid cell, and the forecast is for the center of the cell.
+
+        Concurrent lookups that miss the cache for the same request wait on a
+        single API call and share its response or exception; the number of
+        calls saved this way is tracked in flights.collapsed.
 
         Parameters
         ----------
@@ -110,14 +302,118 @@ class DarkSky(object):
         Returns
         -------
         data: json
-            The parsed json response of the API query.
+            The parsed json response of the API query (converted by parse).
         """
-        # Use the cached response if it's available and timeout is specified.
+        # Normalize the request into the cache key, snapping to the grid
+        key = self.cache_key(lat, lon, exclude, extend, lang, units)
+
+        # Use the cached response if it's available and timeout is specified,
+        # or derive the response from a cached response with fewer exclusions.
         if self.cache_timeout:
-            data = self.cache.get((lat,lon))
-            if data is not None:
+            data, age = self.cached(key)
+            if data is not None and age < self.cache_timeout:
+                self.count(hit=True)
                 return data
 
+            # Serve stale responses while they are refreshed in the background
+            if data is not None and self.stale and age < self.cache_timeout + self.stale:
+                self.count(hit=True)
+                self.revalidate(key)
+                return data
+
+            self.count(hit=False)
+
+        # Concurrent misses for the same request wait on a single API call
+        return self.flights.do(key, self.fetch, key)
+
+    def forecast_many(self, coords, **kwargs):
+        """
+        Performs cached lookups of the forecasts for many locations on a pool
+        of up to pool_size threads, so that requests that miss the cache are
+        made concurrently. Every lookup goes through forecast, so the cache,
+        request coalescing and quota are shared with single lookups. Failed
+        lookups do not stop the others but are reported separately.
+
+        Usage:
+
+            forecasts, errors = api.forecast_many([(38.9, -77.0), ...])
+
+        Parameters
+        ----------
+        coords: iterable of (lat, lon) tuples
+            The geo-coordinates to get forecasts for, duplicates are ignored.
+
+        kwargs: dict
+            Query arguments for every forecast, see forecast.
+
+        Returns
+        -------
+        forecasts: OrderedDict
+            Maps (lat, lon) to the forecast in the order coords were given.
+
+        errors: OrderedDict
+            Maps (lat, lon) to the exception raised looking up its forecast.
+        """
+        coords = list(OrderedDict.fromkeys(tuple(coord) for coord in coords))
+
+        pending = Queue()
+        for coord in coords:
+            pending.put(coord)
+
+        # Each worker looks up forecasts until there are no more coordinates
+        results = {}
+        def work():
+            while True:
+                try:
+                    coord = pending.get_nowait()
+                except Empty:
+                    return
+
+                try:
+                    results[coord] = self.forecast(*coord, **kwargs), None
+                except Exception as e:
+                    results[coord] = None, e
+
+        workers = [
+            threading.Thread(target=work, name="hanish-forecast")
+            for _ in range(min(self.pool_size, len(coords)))
+        ]
+
+        for worker in workers:
+            worker.daemon = True
+            worker.start()
+
+        for worker in workers:
+            worker.join()
+
+        forecasts, errors = OrderedDict(), OrderedDict()
+        for coord in coords:
+            data, error = results[coord]
+            if error is not None:
+                errors[coord] = error
+            else:
+                forecasts[coord] = data
+
+        return forecasts, errors
+
+    def count(self, hit):
+        """
+        Counts a cache hit or miss, forecasts are requested from many threads.
+        """
+        with self.lock:
+            if hit:
+                self.cache_hits += 1
+            else:
+                self.cache_misses += 1
+
+    def fetch(self, key):
+        """
+        Performs the request to the Dark Sky API for the normalized request
+        in the cache key (see cache_key) and caches the response. Note that
+        this method does not check the cache or coalesce concurrent requests.
+        """
+        lat, lon, exclude, extend, lang, units = key
+
         # Create the query params
         query = {
             "lang": lang,
@@ -125,7 +421,7 @@ class DarkSky(object):
         }
 
         # Convert the exclude list into the correct format
-        if exclude is not None:
+        if exclude:
             query["exclude"] = ",".join(exclude)
 
         # Convert the extend bool into the correct format
@@ -137,23 +433,137 @@ class DarkSky(object):
         endpoint = "/forecast/{}/{},{}".format(self.apikey, lat, lon)
         data = self.request(endpoint, **query)
 
-        # Cache the result and return
+        # Cache the result, converted in memory if parsed, and return
+        if self.cache_timeout and self.backend is not None:
+            self.backend[key] = data
+
+        if self.parse is not None:
+            data = self.parse(data)
+
         if self.cache_timeout:
-            self.cache[(lat,lon)] = data
+            self.cache[key] = data
 
         return data
 
+    def revalidate(self, key):
+        """
+        Refreshes the cached response for the cache key in a background thread
+        unless a refresh for the key is already running.
+        """
+        with self.lock:
+            if key in self.refreshing:
+                return
+
+            thread = threading.Thread(target=self.refresh, args=(key,))
+            thread.daemon = True
+            self.refreshing[key] = thread
+
+        thread.start()
+
+    def refresh(self, key):
+        """
+        Fetches the response for the cache key, run by revalidate. Errors are
+        ignored since the stale response is served until it is too old, after
+        which the request is made synchronously and the error is raised.
+        """
+        try:
+            self.flights.do(key, self.fetch, key)
+        except Exception:
+            pass
+        finally:
+            with self.lock:
+                self.refreshing.pop(key, None)
+
+    def cache_key(self, lat, lon,
+                  exclude=None, extend=False, lang="en", units="auto"):
+        """
+        Returns the key used to cache forecasts for the normalized request:
+        (lat, lon, exclude, extend, lang, units) where exclude is a sorted
+        tuple of the unique excluded data blocks. If the grid is specified,
+        lat and lon are the center of the grid cell that contains the
+        coordinates, otherwise they are the coordinates themselves.
+        """
+        if self.grid:
+            # Round to remove floating point noise from the cell centers
+            lat, lon = (
+                round(round(coord / self.grid) * self.grid, 6)
+                for coord in (lat, lon)
+            )
+
+        # Normalize and validate the excluded data blocks
+        exclude = tuple(sorted(set(
+            block.strip().lower() for block in exclude or ()
+        )))
+
+        for block in exclude:
+            if block not in DATA_BLOCKS:
+                raise HanishValueError(
+                    "unknown data block '{}' cannot be excluded".format(block)
+                )
+
+        return (lat, lon, exclude, bool(extend), lang.lower(), units.lower())
+
+    def cached(self, key):
+        """
+        Returns the cached response for the cache key and its age, or if it is
+        not cached, derives the response from a cached response for the same
+        request that excludes fewer data blocks by removing the excluded
+        blocks from a copy of it. Returns None, None if no cached response can
+        satisfy the request.
+        """
+        data, age = self.cache.get_with_age(key)
+
+        # Convert responses stored by the backend once, holding them in memory
+        # until they would expire in the backend.
+        if data is None and self.backend is not None:
+            data, age = self.backend.get_with_age(key)
+            if data is not None:
+                data = self.parse(data)
+                self.cache.set(key, data, age)
+
+        if data is not None or not key[2] or self.parse is not None:
+            return data, age
+
+        # Look for a cached superset, from the fewest to the most exclusions
+        lat, lon, exclude, extend, lang, units = key
+        for size in range(len(exclude)):
+            for subset in combinations(exclude, size):
+                data, age = self.cache.get_with_age(
+                    (lat, lon, subset, extend, lang, units)
+                )
+                if data is not None:
+                    return dict(
+                        (block, value) for block, value in data.items()
+                        if block not in exclude
+                    ), age
+
+        return None, None
+
+    def peek(self, key):
+        """
+        Returns the cached response for the cache key and its age, or None,
+        None if it is not cached, without counting in the cache statistics or
+        keeping the entry from being evicted (see TTLCache.peek).
+        """
+        data, age = self.cache.peek(key)
+        if data is None and self.backend is not None:
+            data, age = self.backend.peek(key)
+        return data, age
+
     def request(self, endpoint, **query):
         """
         Performs a GET request by joining the provided endpoint with the API
         url and encoding and attatching the query params provided as generic
         keyword arguments. This function also tracks the number of calls made
         to the API as reported by the X-Forecast-API-Calls header from the
-        server, preventing additional requests if the limit is reached.
+        server, refusing requests that would exceed the quota before they are
+        sent by raising QuotaExceeded.
 
         Note: This method performs no cacheing and will always make a request
               if under the per-day limit. This method will also raise an
-              exception for the HTTP status (e.g. 404, 403, etc.)
+              exception for the HTTP status (e.g. 404, 403, etc.) once any
+              retries are exhausted, and a DarkSkyException if the API cannot
+              be reached or does not respond within the timeout.
 
         Parameters
         ----------
@@ -169,24 +579,55 @@ class DarkSky(object):
             The parsed json response of the API query.
         """
 
-        if self.limit is not None and self.n_api_calls > self.limit:
-            raise DarkSkyException(
-                "api query limit of {} requests reached".format(self.limit)
-            )
+        # Count the request against the quota, refusing it if exceeded
+        if self.quota is not None:
+            self.quota.acquire()
 
         # Join the endpoint with the URL
         url = urljoin(DARKSKY_API_URL, endpoint)
 
-        # Ensure that we'll accept compressed JSON to reduce bandwidth
-        headers = {'Accept-Encoding': 'gzip'}
+        # Perform the query on a pooled connection (the session accepts
+        # compressed JSON to reduce bandwidth), giving up after the timeout.
+        try:
+            r = self.session.get(
+                url, params=query, timeout=self.timeout, stream=self.stream
+            )
+        except (requests.Timeout, requests.ConnectionError) as e:
+            raise DarkSkyException(
+                "could not connect to the Dark Sky API: {}".format(e)
+            )
+
+        try:
+            # Raise an exception for non-200 status (after retries)
+            r.raise_for_status()
 
-        # Perform the query, raising an exception for non-200 status
-        r = requests.get(url, params=query, headers=headers)
-        r.raise_for_status()
+            # Get the X-Forecast-API-Calls header
+            if API_CALLS_HEADER in r.headers:
+                self.n_api_calls = int(r.headers[API_CALLS_HEADER])
+                if self.quota is not None:
+                    self.quota.report(self.n_api_calls)
 
-        # Get the X-Forecast-API-Calls header
-        if API_CALLS_HEADER in r.headers:
-            self.n_api_calls = int(r.headers[API_CALLS_HEADER])
+            # Return the parsed JSON data, projected to the fields if given
+            return self.read(r)
+        finally:
+            r.close()
 
-        # Return the parsed JSON data
-        return r.json()
+    def read(self, r):
+        """
+        Reads the parsed JSON data from the response, projected to the fields
+        if specified (incrementally if streaming), raising a DarkSkyException
+        if the response is malformed or cannot be read.
+        """
+        try:
+            if self.stream:
+                r.raw.decode_content = True
+                return parse(r.raw, self.fields)
+
+            data = r.json()
+            if self.fields:
+                data = project(data, self.fields)
+            return data
+        except PARSE_ERRORS + READ_ERRORS as e:
+            raise DarkSkyException(
+                "could not read the Dark Sky API response: {}".format(e)
+            )
@@ -0,0 +1,136 @@
+# hanish.dispatch
+# Dispatches messages to a pool of worker threads.
+#
+# Author:   Benjamin Bengfort <benjamin@bengfort.com>
+# Created:  Sat Oct 17 14:31:52 2026 -0400
+#
+# Copyright (C) 2016 Bengfort.com
+# For license information, see LICENSE.txt
+#
+# ID: dispatch.py [] benjamin@bengfort.com $
+
+"""
+Dispatches messages to a pool of worker threads so that slow handlers (e.g.
+those waiting on the Dark Sky API) do not block reading from Slack.
+"""
+
+##########################################################################
+## Imports
+##########################################################################
+
+import zlib
+import threading
+
+try:
+    # Python 3
+    from queue import Queue, Full
+except ImportError:
+    # Python 2
+    from Queue import Queue, Full
+
+
+# Marks the end of a worker's queue when the dispatcher is stopped
+SENTINEL = object()
+
+
+##########################################################################
+## Dispatcher
+##########################################################################
+
+class Dispatcher(object):
+    """
+    A Dispatcher hands items to a fixed pool of worker threads that call the
+    handler on each item. Every worker has its own bounded queue and items are
+    assigned to a worker by their key (e.g. the channel of a message), so
+    items with the same key are handled one at a time in the order they were
+    submitted while items with different keys are handled concurrently.
+
+    When a worker's queue is full, submit blocks (or raises Full if it is not
+    allowed to block) so that a slow handler pushes back on the reader rather
+    than queueing without bound. Stopping the dispatcher drains the queues:
+    every item submitted before stop is handled before the workers exit.
+
+    Usage:
+
+        dispatcher = Dispatcher(handler, workers=4)
+        dispatcher.start()
+        dispatcher.submit(msg['channel'], msg)
+        dispatcher.stop()
+
+    Parameters
+    ----------
+    handler: callable
+        Called with each item submitted to the dispatcher; exceptions raised
+        by the handler are reported but do not stop the worker.
+
+    workers: int, default = 4
+        The number of worker threads to handle items on.
+
+    maxsize: int, default = 64
+        The maximum number of items waiting on each worker.
+    """
+
+    def __init__(self, handler, workers=4, maxsize=64):
+        self.handler = handler
+        self.queues = [Queue(maxsize) for _ in range(workers)]
+        self.threads = []
+
+    def start(self):
+        """
+        Starts the worker threads.
+        """
+        for idx, queue in enumerate(self.queues):
+            thread = threading.Thread(
+                target=self.work, args=(queue,),
+                name="hanish-worker-{}".format(idx),
+            )
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self):
+        """
+        Signals the workers to exit once they have handled the items already
+        in their queues, then waits for them to finish.
+        """
+        for queue in self.queues:
+            queue.put(SENTINEL)
+
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+
+    def submit(self, key, item, block=True, timeout=None):
+        """
+        Queues the item on the worker for its key, waiting for space in the
+        queue if block is True (up to the timeout in seconds, if given).
+        Raises Full if the item could not be queued.
+        """
+        self.queues[self.shard(key)].put(item, block, timeout)
+
+    def shard(self, key):
+        """
+        Returns the index of the worker that handles items with the key, which
+        is stable across processes unlike the builtin hash of a string.
+        """
+        return zlib.crc32(str(key).encode("utf-8")) % len(self.queues)
+
+    def work(self, queue):
+        """
+        Handles items from the queue until the sentinel is reached.
+        """
+        while True:
+            item = queue.get()
+            try:
+                if item is SENTINEL:
+                    return
+
+                self.handler(item)
+            except Exception as e:
+                # TODO: change to standardized logging functionality
+                print("could not handle {!r}: {}".format(item, e))
+            finally:
+                queue.task_done()
+
+    def __len__(self):
+        return sum(queue.qsize() for queue in self.queues)
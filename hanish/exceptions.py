@@ -59,6 +59,13 @@ class DarkSkyException(HanishException):
     pass
 
 
+class QuotaExceeded(DarkSkyException):
+    """
+    A request to the Dark Sky API was refused because of the API quota.
+    """
+    pass
+
+
 class SlackException(HanishException):
     """
     Something went wrong with the Slack API.
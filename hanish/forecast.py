@@ -0,0 +1,270 @@
+# hanish.forecast
+# Compact, immutable representation of Dark Sky forecasts.
+#
+# Author:   Benjamin Bengfort <benjamin@bengfort.com>
+# Created:  Sat Oct 17 17:05:31 2026 -0400
+#
+# Copyright (C) 2016 Bengfort.com
+# For license information, see LICENSE.txt
+#
+# ID: forecast.py [] benjamin@bengfort.com $
+
+"""
+Compact, immutable representation of Dark Sky forecasts that keeps only the
+fields the bot responds with rather than the full JSON response, so that many
+more forecasts can be cached in the same amount of memory.
+"""
+
+##########################################################################
+## Imports
+##########################################################################
+
+from array import array
+from .chat import weather_conditions
+
+
+# Fields of a forecast that the current conditions are rendered from
+CONDITIONS_FIELDS = ("temperature", "summary", "hourly_summary")
+
+# Fields of the hourly and daily data points kept in columns
+HOURLY_FIELDS = ("time", "temperature", "precipProbability")
+DAILY_FIELDS = ("time", "temperatureMin", "temperatureMax", "precipProbability")
+
+# Fields of the Dark Sky response read by Forecast.from_json, e.g. to project
+# responses to (see hanish.stream), without and with the series.
+FORECAST_FIELDS = (
+    "latitude", "longitude", "timezone",
+    "currently.time", "currently.temperature", "currently.summary",
+    "hourly.summary", "daily.summary",
+)
+
+SERIES_FIELDS = FORECAST_FIELDS + tuple(
+    "hourly.data." + field for field in HOURLY_FIELDS
+) + tuple(
+    "daily.data." + field for field in DAILY_FIELDS
+)
+
+
+##########################################################################
+## Helpers
+##########################################################################
+
+def number(value):
+    """
+    Converts a value of a data point to a float, or NaN if missing or null.
+    """
+    if value is None:
+        return float("nan")
+    return float(value)
+
+
+def fieldnames(obj):
+    """
+    Returns the names of the fields of an immutable object, e.g. its slots
+    that are not private (private slots hold values derived from fields).
+    """
+    return tuple(name for name in obj.__slots__ if not name.startswith("_"))
+
+
+##########################################################################
+## Immutable Base
+##########################################################################
+
+class Immutable(object):
+    """
+    Base class for slotted objects whose attributes are set once by the
+    constructor and cannot be modified afterward. Private slots (with a
+    leading underscore) are not fields: they are set to None by the
+    constructor and are not copied by replace or compared.
+    """
+
+    __slots__ = ()
+
+    def __init__(self, **kwargs):
+        for name in self.__slots__:
+            value = None if name.startswith("_") else kwargs.pop(name, None)
+            object.__setattr__(self, name, value)
+
+        if kwargs:
+            raise TypeError("unknown field(s) {}".format(", ".join(kwargs)))
+
+    def __setattr__(self, name, value):
+        raise AttributeError(
+            "cannot set {} of immutable {}".format(name, self.__class__.__name__)
+        )
+
+    def __delattr__(self, name):
+        raise AttributeError(
+            "cannot delete {} of immutable {}".format(name, self.__class__.__name__)
+        )
+
+    def replace(self, **kwargs):
+        """
+        Returns a copy with the specified fields replaced by new values.
+        """
+        fields = dict((name, getattr(self, name)) for name in fieldnames(self))
+        fields.update(kwargs)
+        return self.__class__(**fields)
+
+    def __eq__(self, other):
+        if not isinstance(other, self.__class__):
+            return NotImplemented
+        return all(
+            getattr(self, name) == getattr(other, name)
+            for name in fieldnames(self)
+        )
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    __hash__ = None
+
+
+##########################################################################
+## Series
+##########################################################################
+
+class Series(Immutable):
+    """
+    A Series stores the data points of an hourly or daily data block as
+    parallel arrays of floats, one per field, rather than as a list of
+    dictionaries. Missing and null values are stored as NaN.
+
+    Parameters
+    ----------
+    fields: tuple of strings
+        The names of the fields stored in the series.
+
+    columns: tuple of arrays
+        An array('d') of the values of each field, in the order of fields.
+    """
+
+    __slots__ = ("fields", "columns")
+
+    @classmethod
+    def from_json(klass, block, fields):
+        """
+        Creates a series from the data points of a Dark Sky data block.
+        """
+        points = block.get("data", [])
+        return klass(fields=tuple(fields), columns=tuple(
+            array('d', (number(point.get(field)) for point in points))
+            for field in fields
+        ))
+
+    def __getitem__(self, field):
+        try:
+            return self.columns[self.fields.index(field)]
+        except ValueError:
+            raise KeyError(field)
+
+    def __iter__(self):
+        """
+        Yields a tuple of the values of the fields of every data point.
+        """
+        return iter(zip(*self.columns))
+
+    def __len__(self):
+        return len(self.columns[0]) if self.columns else 0
+
+
+##########################################################################
+## Forecast
+##########################################################################
+
+class Forecast(Immutable):
+    """
+    A Forecast holds the fields of a Dark Sky forecast that the bot responds
+    with: the location and time of the forecast, the current temperature and
+    summary, and the hourly and daily summaries. Optionally the hourly and
+    daily data points are kept as columns (see Series). Forecasts are
+    immutable so that they can be shared by every reader of the cache; use
+    replace to add the zipcode or number of API calls to a forecast.
+
+    The current conditions are rendered the first time they are used and
+    shared by the copies made with replace, so that responses to a cached
+    forecast only fill in the zipcode (see hanish.chat). Copies that replace
+    the fields the conditions are rendered from render them again.
+
+    Usage:
+
+        forecast = Forecast.from_json(darksky.forecast(lat, lon))
+        forecast = forecast.replace(zipcode="20001")
+    """
+
+    __slots__ = (
+        "latitude", "longitude", "timezone", "time", "temperature",
+        "summary", "hourly_summary", "daily_summary", "hourly", "daily",
+        "zipcode", "api_calls", "_conditions",
+    )
+
+    @classmethod
+    def from_json(klass, data, zipcode=None, api_calls=None, series=False):
+        """
+        Creates a forecast from the parsed JSON response of the Dark Sky API.
+
+        Parameters
+        ----------
+        data: dict
+            The parsed JSON response of a forecast request.
+
+        zipcode: string, default None
+            The zipcode the forecast was requested for.
+
+        api_calls: int, default None
+            The number of Dark Sky API calls made.
+
+        series: bool, default False
+            If True, keep the hourly and daily data points as columns.
+
+        Returns
+        -------
+        forecast: Forecast
+            The compact representation of the forecast.
+        """
+        currently = data.get("currently", {})
+        hourly = data.get("hourly", {})
+        daily = data.get("daily", {})
+
+        return klass(
+            latitude=data.get("latitude"),
+            longitude=data.get("longitude"),
+            timezone=data.get("timezone"),
+            time=currently.get("time"),
+            temperature=currently.get("temperature"),
+            summary=currently.get("summary"),
+            hourly_summary=hourly.get("summary"),
+            daily_summary=daily.get("summary"),
+            hourly=Series.from_json(hourly, HOURLY_FIELDS) if series and hourly else None,
+            daily=Series.from_json(daily, DAILY_FIELDS) if series and daily else None,
+            zipcode=zipcode,
+            api_calls=api_calls,
+        )
+
+    @property
+    def conditions(self):
+        """
+        The rendered current conditions, or None if the fields they are
+        rendered from are missing.
+        """
+        if self._conditions is None:
+            if any(getattr(self, name) is None for name in CONDITIONS_FIELDS):
+                return None
+            object.__setattr__(self, "_conditions", weather_conditions(self))
+        return self._conditions
+
+    def replace(self, **kwargs):
+        """
+        Returns a copy with the specified fields replaced by new values, that
+        shares the rendered conditions unless their fields are replaced.
+        """
+        forecast = super(Forecast, self).replace(**kwargs)
+        if not any(name in kwargs for name in CONDITIONS_FIELDS):
+            object.__setattr__(forecast, "_conditions", self.conditions)
+        return forecast
+
+    def __repr__(self):
+        return "<Forecast ({}, {}) at {}>".format(
+            self.latitude, self.longitude, self.time
+        )
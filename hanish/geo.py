@@ -0,0 +1,303 @@
+# hanish.geo
+# Geographic distance helpers and a spatial index over coordinates.
+#
+# Author:   Benjamin Bengfort <benjamin@bengfort.com>
+# Created:  Sat Oct 17 10:12:44 2026 -0400
+#
+# Copyright (C) 2016 Bengfort.com
+# For license information, see LICENSE.txt
+#
+# ID: geo.py [] benjamin@bengfort.com $
+
+"""
+Geographic distance helpers and a spatial index over coordinates, used to
+answer nearest neighbor and radius queries without scanning every point.
+"""
+
+##########################################################################
+## Imports
+##########################################################################
+
+import heapq
+
+from math import radians, sin, cos, asin, sqrt, floor
+
+
+# Mean radius of the Earth in miles
+EARTH_RADIUS = 3958.8
+
+# Number of rings of cells around a query point searched before the best-first
+# search of the occupied cells.
+RINGS = 2
+
+
+##########################################################################
+## Helper Functions
+##########################################################################
+
+def haversine(lat1, lon1, lat2, lon2):
+    """
+    Returns the great circle distance in miles between two points specified
+    by their latitude and longitude in decimal degrees.
+    """
+    dlat = radians(lat2 - lat1)
+    dlon = radians(lon2 - lon1)
+    a = sin(dlat / 2) ** 2 + cos(radians(lat1)) * cos(radians(lat2)) * sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS * asin(min(1.0, sqrt(a)))
+
+
+##########################################################################
+## GridIndex
+##########################################################################
+
+class GridIndex(object):
+    """
+    A GridIndex buckets points into square cells of a fixed size in degrees
+    so that nearest neighbor and radius queries only have to compute the
+    distance to points in the cells around the query point rather than to
+    every point. The index stores the row of each point in the latitude and
+    longitude columns it was built from, not the points themselves.
+
+    Queries first search a few rings of cells around the query point, which
+    answers them when the point is among the data. Otherwise the occupied
+    cells, grouped into square blocks, are visited best-first in order of a
+    lower bound on the distance to any point in them, so that empty cells are
+    never visited no matter how far the query point is from the data.
+    Distances and bounds wrap around the antimeridian.
+
+    Parameters
+    ----------
+    latitudes, longitudes: sequences of floats
+        Parallel columns of the coordinates to index in decimal degrees.
+
+    cell: float, default = 0.25
+        The size of the grid cells in degrees; smaller cells mean fewer
+        distance computations per query but more cells to visit.
+
+    block: int, default = 16
+        The number of cells along each side of a block.
+    """
+
+    def __init__(self, latitudes, longitudes, cell=0.25, block=16):
+        self.cell = cell
+        self.block = block
+        self.latitudes = latitudes
+        self.longitudes = longitudes
+        self.buckets = {}
+
+        for idx, (lat, lon) in enumerate(zip(latitudes, longitudes)):
+            self.buckets.setdefault(self.key(lat, lon), []).append(idx)
+
+        # Group the occupied cells into blocks, precomputing the boxes of both
+        blocks = {}
+        for row, col in self.buckets:
+            blocks.setdefault((row // block, col // block), []).append((row, col))
+
+        self.blocks = [
+            (self.box(brow, bcol, cell * block), cells)
+            for (brow, bcol), cells in blocks.items()
+        ]
+        self.boxes = dict(
+            (key, self.box(key[0], key[1], cell)) for key in self.buckets
+        )
+
+    def key(self, lat, lon):
+        """
+        Returns the (row, col) of the cell that contains the coordinates.
+        """
+        return int(floor(lat / self.cell)), int(floor(lon / self.cell))
+
+    @staticmethod
+    def box(row, col, size):
+        """
+        Returns the (south, north, west, width, cos) box of the square of the
+        size in degrees at (row, col), where cos is the smallest cosine of the
+        latitudes in the box.
+        """
+        south = max(-90.0, row * size)
+        north = min(90.0, (row + 1) * size)
+        poleward = min(90.0, max(abs(south), abs(north)))
+        return south, north, col * size, size, cos(radians(poleward))
+
+    @staticmethod
+    def bound(lat, lon, coslat, box):
+        """
+        Returns a lower bound in miles on the distance from the coordinates
+        (where coslat is the cosine of lat) to any point in the box, by
+        bounding each term of the haversine formula: the latitude difference
+        is at least the distance to the nearest parallel of the box and the
+        longitude difference at least the distance to its nearest meridian,
+        wrapping around the antimeridian.
+        """
+        south, north, west, width, cosmin = box
+
+        if lat < south:
+            dlat = south - lat
+        elif lat > north:
+            dlat = lat - north
+        else:
+            dlat = 0.0
+
+        offset = (lon - west) % 360.0
+        if offset <= width:
+            dlon = 0.0
+        else:
+            dlon = min(offset - width, 360.0 - offset)
+
+        a = sin(radians(dlat) / 2) ** 2 + coslat * cosmin * sin(radians(dlon) / 2) ** 2
+        return 2 * EARTH_RADIUS * asin(min(1.0, sqrt(a)))
+
+    def ring(self, row, col, r):
+        """
+        Yields the rows of the points in the cells that are exactly r cells
+        away from the cell at (row, col), e.g. the square ring of cells.
+        """
+        if r == 0:
+            cells = [(row, col)]
+        else:
+            cells = [(row - r, c) for c in range(col - r, col + r + 1)]
+            cells += [(row + r, c) for c in range(col - r, col + r + 1)]
+            cells += [(i, col - r) for i in range(row - r + 1, row + r)]
+            cells += [(i, col + r) for i in range(row - r + 1, row + r)]
+
+        for cell in cells:
+            for idx in self.buckets.get(cell, ()):
+                yield idx
+
+    def local(self, lon, r):
+        """
+        Returns True if the square of cells r cells away from the cell of the
+        longitude does not cross the antimeridian, e.g. if the rings around
+        the cell can be searched without wrapping.
+        """
+        col = self.key(0.0, lon)[1]
+        return (col - r) * self.cell >= -180.0 and (col + r + 1) * self.cell <= 180.0
+
+    def reach(self, lat, r):
+        """
+        Returns a lower bound in miles on the distance from a point at lat to
+        any point outside of the square of cells r cells away from its cell:
+        such points are either at least r cells away in latitude, or at least
+        r cells away in longitude at a latitude no more than r cells away.
+        """
+        delta = radians(r * self.cell)
+        poleward = radians(min(90.0, abs(lat) + (r + 1) * self.cell))
+        return min(
+            EARTH_RADIUS * delta,
+            2 * EARTH_RADIUS * asin(min(1.0, cos(poleward) * sin(delta / 2))),
+        )
+
+    def cells(self, lat, lon, limit=None):
+        """
+        Yields (bound, cell, rows) of the occupied cells in order of the lower
+        bound in miles on the distance from the coordinates to their points,
+        where rows are the rows of the points in the cell. If given, limit is
+        called when a block is expanded and returns the distance beyond which
+        cells are no longer of interest, so that they are not yielded.
+        """
+        coslat = cos(radians(lat))
+        bound = self.bound
+
+        heap = [
+            (bound(lat, lon, coslat, box), seq, cells)
+            for seq, (box, cells) in enumerate(self.blocks)
+        ]
+        heapq.heapify(heap)
+        seq = len(heap)
+
+        while heap:
+            dist, _, item = heapq.heappop(heap)
+            farthest = limit() if limit is not None else float("inf")
+            if dist >= farthest:
+                return
+
+            if isinstance(item, list):
+                # Expand the block into the cells that are still of interest
+                for key in item:
+                    dist = bound(lat, lon, coslat, self.boxes[key])
+                    if dist < farthest:
+                        seq += 1
+                        heapq.heappush(heap, (dist, seq, key))
+            else:
+                yield dist, item, self.buckets[item]
+
+    def nearest(self, lat, lon, k=1):
+        """
+        Returns a list of the k nearest points to the coordinates as (row,
+        distance in miles) tuples sorted by distance. Searches the rings of
+        cells around the coordinates, then visits the remaining cells
+        best-first, until no unvisited cell can hold a point that is closer.
+        """
+        if k < 1:
+            return []
+
+        lats, lons = self.latitudes, self.longitudes
+        row, col = self.key(lat, lon)
+
+        # Max-heap (by negated distance) of the k best candidates so far
+        best = []
+
+        def consider(rows):
+            for idx in rows:
+                dist = haversine(lat, lon, lats[idx], lons[idx])
+                if len(best) < k:
+                    heapq.heappush(best, (-dist, idx))
+                elif dist < -best[0][0]:
+                    heapq.heapreplace(best, (-dist, idx))
+
+        def farthest():
+            return -best[0][0] if len(best) == k else float("inf")
+
+        def result():
+            return sorted(((idx, -dist) for dist, idx in best), key=lambda p: p[1])
+
+        # Search the rings around the cell unless they wrap
+        rings = RINGS if self.local(lon, RINGS) else -1
+        for r in range(0, rings + 1):
+            consider(self.ring(row, col, r))
+            if len(best) == k and self.reach(lat, r) >= -best[0][0]:
+                return result()
+
+        for bound, (crow, ccol), rows in self.cells(lat, lon, farthest):
+            if len(best) == k and bound >= -best[0][0]:
+                break
+
+            # Skip the cells already searched in the rings
+            if max(abs(crow - row), abs(ccol - col)) <= rings:
+                continue
+            consider(rows)
+
+        return result()
+
+    def within(self, lat, lon, radius):
+        """
+        Returns a list of the points within the radius in miles of the
+        coordinates as (row, distance in miles) tuples sorted by distance,
+        only visiting the cells that can hold points within the radius.
+        """
+        lats, lons = self.latitudes, self.longitudes
+        row, col = self.key(lat, lon)
+
+        # Search the rings around the cell if they cover the radius
+        if self.local(lon, RINGS) and self.reach(lat, RINGS) >= radius:
+            cells = (
+                (0.0, None, self.ring(row, col, r)) for r in range(RINGS + 1)
+            )
+        else:
+            cells = self.cells(lat, lon, lambda: radius + 1e-9)
+
+        points = []
+        for bound, _, rows in cells:
+            if bound > radius:
+                break
+
+            for idx in rows:
+                dist = haversine(lat, lon, lats[idx], lons[idx])
+                if dist <= radius:
+                    points.append((idx, dist))
+
+        points.sort(key=lambda p: p[1])
+        return points
+
+    def __len__(self):
+        return len(self.latitudes)
@@ -0,0 +1,215 @@
+# hanish.outbox
+# Queues outbound messages to post to Slack in the background.
+#
+# Author:   Benjamin Bengfort <benjamin@bengfort.com>
+# Created:  Sat Oct 17 16:02:45 2026 -0400
+#
+# Copyright (C) 2016 Bengfort.com
+# For license information, see LICENSE.txt
+#
+# ID: outbox.py [] benjamin@bengfort.com $
+
+"""
+Queues outbound messages to post to Slack in the background, so that command
+handlers return immediately and responses stay within Slack's rate limits.
+"""
+
+##########################################################################
+## Imports
+##########################################################################
+
+import time
+import threading
+
+from collections import OrderedDict
+
+
+# Seconds to wait before retrying if Slack does not send a Retry-After
+RETRY_AFTER = 1
+
+
+##########################################################################
+## Helper Functions
+##########################################################################
+
+def retry_after(response):
+    """
+    Returns the number of seconds to wait if the response from the Slack API
+    is rate limited, otherwise returns None. The Retry-After header is read
+    from the headers that slackclient (1.1.3 or later) adds to the response.
+    """
+    if not response or response.get("ok") or response.get("error") != "ratelimited":
+        return None
+
+    headers = response.get("headers") or {}
+    for key, val in headers.items():
+        if key.lower() == "retry-after":
+            try:
+                return float(val)
+            except ValueError:
+                break
+    return RETRY_AFTER
+
+
+##########################################################################
+## Outbox
+##########################################################################
+
+class Outbox(object):
+    """
+    An Outbox posts messages to Slack on a background thread. Messages to the
+    same channel (and thread) that are queued within the linger interval of
+    each other are coalesced into a single message with one message per line,
+    so a handler that responds several times makes one API call.
+
+    If Slack responds that the bot is rate limited, no messages are sent
+    until the Retry-After interval has passed, and the messages that were
+    not sent are coalesced with any that were queued in the meantime.
+
+    Usage:
+
+        outbox = Outbox(send)
+        outbox.start()
+        outbox.post("#general", "Hello world!")
+        outbox.close()
+
+    Parameters
+    ----------
+    send: callable
+        Called with the channel, text and thread to post a message, returns
+        the response from the Slack API.
+
+    linger: time in seconds, default = 0.05
+        How long to wait for more messages to the same channel to coalesce.
+
+    timer: callable, default = time.time
+        Returns the current time in seconds.
+    """
+
+    def __init__(self, send, linger=0.05, timer=time.time):
+        self.send = send
+        self.linger = linger
+        self.timer = timer
+        self.cond = threading.Condition()
+        self.thread = None
+        self.closed = False
+
+        self.pending = OrderedDict() # (channel, thread) -> list of texts
+        self.queued = {}             # (channel, thread) -> time first queued
+        self.resume = 0              # time the rate limit expires
+
+        # Outbox statistics
+        self.posted = 0
+        self.sent = 0
+        self.ratelimited = 0
+        self.failed = 0
+
+    def start(self):
+        """
+        Starts the background thread that sends messages.
+        """
+        self.closed = False
+        self.thread = threading.Thread(target=self.work, name="hanish-outbox")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def close(self, timeout=None):
+        """
+        Sends all queued messages without lingering and waits up to the
+        timeout in seconds for the background thread to finish.
+        """
+        with self.cond:
+            self.closed = True
+            self.cond.notify()
+
+        if self.thread is not None:
+            self.thread.join(timeout)
+            self.thread = None
+
+    def post(self, channel, text, thread=None):
+        """
+        Queues the text to be posted to the channel (and thread, if given).
+        """
+        key = (channel, thread)
+        with self.cond:
+            if key not in self.pending:
+                self.pending[key] = []
+                self.queued[key] = self.timer()
+
+            self.pending[key].append(text)
+            self.posted += 1
+            self.cond.notify()
+
+    def take(self):
+        """
+        Blocks until a message is ready to send, then removes it from the
+        queue and returns its key and texts, or returns None when closed.
+        """
+        with self.cond:
+            while True:
+                if not self.pending:
+                    if self.closed:
+                        return None
+                    self.cond.wait()
+                    continue
+
+                # Wait for the rate limit to expire and, unless closing,
+                # for more messages to the oldest key to coalesce.
+                key = next(iter(self.pending))
+                ready = self.resume
+                if not self.closed:
+                    ready = max(ready, self.queued[key] + self.linger)
+
+                delay = ready - self.timer()
+                if delay > 0:
+                    self.cond.wait(delay)
+                    continue
+
+                del self.queued[key]
+                return key, self.pending.pop(key)
+
+    def requeue(self, key, texts, delay):
+        """
+        Puts the texts back at the front of the queue, ahead of any messages
+        queued for the key since, and pauses sending for the delay.
+        """
+        with self.cond:
+            texts = texts + self.pending.pop(key, [])
+            self.queued.pop(key, None)
+
+            pending = OrderedDict([(key, texts)])
+            pending.update(self.pending)
+            self.pending = pending
+            self.queued[key] = self.timer()
+
+            self.resume = self.timer() + delay
+            self.ratelimited += 1
+
+    def work(self):
+        """
+        Sends messages until the outbox is closed and empty.
+        """
+        while True:
+            item = self.take()
+            if item is None:
+                return
+
+            (channel, thread), texts = item
+            try:
+                response = self.send(channel, "\n".join(texts), thread)
+            except Exception as e:
+                # TODO: change to standardized logging functionality
+                print("could not post to {}: {}".format(channel, e))
+                self.failed += 1
+                continue
+
+            delay = retry_after(response)
+            if delay is not None:
+                self.requeue((channel, thread), texts, delay)
+                continue
+
+            self.sent += 1
+
+    def __len__(self):
+        with self.cond:
+            return sum(len(texts) for texts in self.pending.values())
@@ -0,0 +1,191 @@
+# hanish.prefetch
+# Keeps the forecasts of popular locations fresh in the cache.
+#
+# Author:   Benjamin Bengfort <benjamin@bengfort.com>
+# Created:  Sat Oct 17 20:05:47 2026 -0400
+#
+# Copyright (C) 2016 Bengfort.com
+# For license information, see LICENSE.txt
+#
+# ID: prefetch.py [] benjamin@bengfort.com $
+
+"""
+Keeps the forecasts of popular locations fresh in the cache by refreshing
+them in the background shortly before they expire.
+"""
+
+##########################################################################
+## Imports
+##########################################################################
+
+import time
+import heapq
+import threading
+
+from collections import Counter
+from .quota import Quota, DAY
+
+
+##########################################################################
+## Prefetcher
+##########################################################################
+
+class Prefetcher(object):
+    """
+    A Prefetcher counts how often the forecast for each zipcode is requested
+    and, every time it is ticked, refreshes the cached forecasts of the most
+    requested zipcodes in the background if they are missing or will expire
+    within the lead time, so that requests for popular zipcodes are always
+    served from the cache. The counts decay by half every halflife so that
+    zipcodes that are no longer requested cool down, and only zipcodes that
+    were requested within the last few cache timeouts are refreshed.
+
+    Prefetching spends at most a share of the daily limit of the Dark Sky
+    API calls each UTC day, leaving the rest for requests that miss the cache.
+    The share is released in proportion to the time elapsed in the UTC day,
+    like the token bucket of the Quota, so that it lasts the whole day.
+
+    Usage:
+
+        prefetcher = Prefetcher(darksky, top=10)
+        prefetcher.record("20001", (38.9, -77.0))
+        prefetcher.tick() # e.g. scheduled every lead / 2 seconds
+
+    Parameters
+    ----------
+    darksky: DarkSky
+        The Dark Sky API whose cached forecasts are refreshed.
+
+    top: int, default = 10
+        The number of most requested zipcodes to keep fresh.
+
+    share: float, default = 0.25
+        The maximum share of the daily limit of API calls to spend.
+
+    lead: time in seconds, default = 60
+        Refresh forecasts that will expire within this time.
+
+    halflife: time in seconds, default = 86400
+        The interval after which the request counts are halved.
+
+    recent: int, default = 3
+        Only refresh zipcodes requested within this many cache timeouts.
+
+    timer: callable, default = time.time
+        Returns the current time in seconds since the epoch.
+    """
+
+    def __init__(self, darksky, top=10, share=0.25, lead=60, halflife=86400,
+                 recent=3, timer=time.time):
+        self.darksky = darksky
+        self.top = top
+        self.share = share
+        self.lead = lead
+        self.halflife = halflife
+        self.recent = recent
+        self.timer = timer
+        self.lock = threading.Lock()
+
+        self.counts = Counter() # zipcode -> number of requests
+        self.coords = {}        # zipcode -> (lat, lon)
+        self.requested = {}     # zipcode -> time last requested
+        self.decayed = timer()  # time the counts were last halved
+
+        # Number of prefetches per UTC day
+        self.today = None
+        self.spent = 0
+
+    def record(self, zipcode, coords):
+        """
+        Counts a request for the forecast of the zipcode at the coordinates.
+        """
+        with self.lock:
+            self.counts[zipcode] += 1
+            self.coords[zipcode] = coords
+            self.requested[zipcode] = self.timer()
+
+    def hottest(self, since=None):
+        """
+        Returns a list of the top most requested (zipcode, count) tuples of
+        the zipcodes last requested at or after since (if given), breaking
+        ties by zipcode so the order doesn't depend on the dict.
+        """
+        with self.lock:
+            counts = self.counts.items()
+            if since is not None:
+                counts = [
+                    item for item in counts if self.requested[item[0]] >= since
+                ]
+
+            return heapq.nsmallest(
+                self.top, counts, key=lambda item: (-item[1], item[0])
+            )
+
+    def budget(self, now):
+        """
+        Returns the number of prefetches that can be made now: the share of
+        the daily limit released so far today less the prefetches made.
+        """
+        if self.darksky.limit is None:
+            return float("inf")
+
+        today, left = Quota.day(now)
+        if today != self.today:
+            self.today, self.spent = today, 0
+
+        released = self.share * self.darksky.limit * (DAY - left) / DAY
+        return max(0, int(released) - self.spent)
+
+    def decay(self, now):
+        """
+        Halves the request counts if the halflife has passed, forgetting the
+        zipcodes whose count falls to zero.
+        """
+        with self.lock:
+            if now - self.decayed < self.halflife:
+                return
+
+            self.decayed = now
+            for zipcode, count in list(self.counts.items()):
+                if count > 1:
+                    self.counts[zipcode] = count // 2
+                else:
+                    del self.counts[zipcode]
+                    del self.coords[zipcode]
+                    del self.requested[zipcode]
+
+    def tick(self):
+        """
+        Refreshes the forecasts of the hottest recently requested zipcodes
+        that are missing from the cache or will expire within the lead time,
+        within the budget. Returns the list of zipcodes that were refreshed.
+        """
+        now = self.timer()
+        self.decay(now)
+
+        timeout = self.darksky.cache_timeout
+        if not timeout:
+            return []
+
+        refreshed = []
+        budget = self.budget(now)
+        for zipcode, _ in self.hottest(since=now - self.recent * timeout):
+            if len(refreshed) >= budget:
+                break
+
+            lat, lon = self.coords[zipcode]
+            key = self.darksky.cache_key(lat, lon)
+            # Peek so that checking does not count in the cache statistics
+            # or keep the entry from being evicted.
+            _, age = self.darksky.peek(key)
+            if age is not None and age < timeout - self.lead:
+                continue
+
+            # Refresh in the background, once per key even if the grid maps
+            # several zipcodes to the same forecast.
+            if key not in self.darksky.refreshing:
+                self.darksky.revalidate(key)
+                refreshed.append(zipcode)
+
+        self.spent += len(refreshed)
+        return refreshed
@@ -0,0 +1,209 @@
+# hanish.quota
+# Accounting of the daily Dark Sky API quota.
+#
+# Author:   Benjamin Bengfort <benjamin@bengfort.com>
+# Created:  Sat Oct 17 19:12:06 2026 -0400
+#
+# Copyright (C) 2016 Bengfort.com
+# For license information, see LICENSE.txt
+#
+# ID: quota.py [] benjamin@bengfort.com $
+
+"""
+Accounting of the daily Dark Sky API quota, shared by every process on the
+host that uses the same quota database, so that requests are refused before
+they are sent rather than after the limit has been exceeded.
+"""
+
+##########################################################################
+## Imports
+##########################################################################
+
+import time
+import sqlite3
+import threading
+
+from .exceptions import QuotaExceeded, DatabaseError
+
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS quota ("
+        "day TEXT PRIMARY KEY, "
+        "used INTEGER NOT NULL, "
+        "tokens REAL NOT NULL, "
+        "updated REAL NOT NULL"
+    ")"
+)
+
+# Seconds in a day, the Dark Sky API quota resets at midnight UTC
+DAY = 86400
+
+
+##########################################################################
+## Quota
+##########################################################################
+
+class Quota(object):
+    """
+    A Quota counts the requests made to the Dark Sky API each UTC day, and
+    refuses (by raising QuotaExceeded) to acquire a request that would exceed
+    the daily limit. The count is stored in a Sqlite3 database, and each
+    acquisition is a write transaction, so processes that share the database
+    file share the quota. The count of calls reported by the API in the
+    X-Forecast-API-Calls header is authoritative, and replaces the count if
+    it is higher (e.g. if another host uses the same API key).
+
+    If burst is specified, requests are also spread over the day with a token
+    bucket that holds at most burst tokens, and refills at the rate that
+    would spend the remaining quota evenly over the rest of the day.
+
+    Usage:
+
+        quota = Quota(1000, path="quota.db")
+        quota.acquire() # raises QuotaExceeded if the limit is reached
+        quota.report(int(response.headers["X-Forecast-API-Calls"]))
+
+    Parameters
+    ----------
+    limit: int
+        The maximum number of requests per UTC day.
+
+    path: string or None, default = None
+        Path to the Sqlite3 database to share the quota in, created if it does
+        not exist. If None, the quota is kept in memory for this process only.
+
+    burst: int or None, default = None
+        The maximum number of requests that can be made at once if requests
+        are spread over the day, or None to only enforce the daily limit.
+
+    timer: callable, default = time.time
+        Returns the current time in seconds since the epoch.
+    """
+
+    def __init__(self, limit, path=None, burst=None, timer=time.time):
+        self.limit = limit
+        self.path = path
+        self.burst = burst
+        self.timer = timer
+
+        # Connect to the database, shared between threads behind a lock, and
+        # manage transactions explicitly to lock the database between reads
+        # and writes of the count.
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(
+            path or ":memory:", timeout=30, check_same_thread=False,
+            isolation_level=None,
+        )
+        self.conn.execute(SCHEMA)
+
+    def close(self):
+        """
+        Close the connection to the database, no further accesses are allowed
+        (otherwise an exception is raised).
+        """
+        with self.lock:
+            self.conn.close()
+            self.conn = None
+
+    @staticmethod
+    def day(now):
+        """
+        Returns the UTC day of the timestamp and the seconds left in it.
+        """
+        return time.strftime("%Y-%m-%d", time.gmtime(now)), DAY - (now % DAY)
+
+    def transact(self, func):
+        """
+        Calls func with the cursor, the current time and the state of today's
+        quota as a (used, tokens, updated) tuple in an immediate transaction,
+        which holds the write lock on the database until it completes. If func
+        returns a new state it is stored, and older days are removed.
+        """
+        with self.lock:
+            if self.conn is None:
+                raise DatabaseError("quota database has been closed")
+
+            cursor = self.conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                now = self.timer()
+                today, _ = self.day(now)
+                row = cursor.execute(
+                    "SELECT used, tokens, updated FROM quota WHERE day=?",
+                    (today,)
+                ).fetchone()
+
+                if row is None:
+                    row = (0, self.burst or 0, now)
+
+                state = func(now, row)
+                if state is not None:
+                    cursor.execute(
+                        "INSERT OR REPLACE INTO quota VALUES (?,?,?,?)",
+                        (today,) + tuple(state)
+                    )
+                    cursor.execute("DELETE FROM quota WHERE day != ?", (today,))
+
+                cursor.execute("COMMIT")
+                return row if state is None else state
+            except BaseException:
+                cursor.execute("ROLLBACK")
+                raise
+
+    def acquire(self):
+        """
+        Counts a request against the quota before it is made, raising
+        QuotaExceeded if the daily limit has been reached or, if requests are
+        spread over the day, if no token is available.
+        """
+        def acquire(now, state):
+            used, tokens, updated = state
+            if used >= self.limit:
+                raise QuotaExceeded(
+                    "api query limit of {} requests reached".format(self.limit)
+                )
+
+            if self.burst is not None:
+                # Refill at the rate that spends the rest of the quota evenly
+                _, left = self.day(now)
+                rate = float(self.limit - used) / left
+                tokens = min(self.burst, tokens + max(0, now - updated) * rate)
+
+                if tokens < 1:
+                    raise QuotaExceeded(
+                        "api query rate limited, try again in {:0.0f} seconds".format(
+                            (1 - tokens) / rate
+                        )
+                    )
+                tokens -= 1
+
+            return used + 1, tokens, now
+
+        self.transact(acquire)
+
+    def report(self, calls):
+        """
+        Records the number of calls made today as reported by the API, which
+        replaces the count if it is higher.
+        """
+        def report(now, state):
+            used, tokens, updated = state
+            if calls > used:
+                return calls, tokens, updated
+            return None
+
+        self.transact(report)
+
+    @property
+    def used(self):
+        """
+        The number of requests made today.
+        """
+        return self.transact(lambda now, state: None)[0]
+
+    @property
+    def remaining(self):
+        """
+        The number of requests that can still be made today.
+        """
+        return max(0, self.limit - self.used)
@@ -0,0 +1,344 @@
+# hanish.scheduler
+# Runs timed tasks from the bot's event loop.
+#
+# Author:   Benjamin Bengfort <benjamin@bengfort.com>
+# Created:  Sat Oct 17 21:41:09 2026 -0400
+#
+# Copyright (C) 2016 Bengfort.com
+# For license information, see LICENSE.txt
+#
+# ID: scheduler.py [] benjamin@bengfort.com $
+
+"""
+Runs timed tasks, e.g. every few seconds, every day at a time of day in a
+timezone or once at a given time, from the bot's event loop. Jobs are kept in
+a heap by the time they are next due so that the event loop can block until
+exactly then and checking for due jobs costs the same no matter how many jobs
+are scheduled.
+"""
+
+##########################################################################
+## Imports
+##########################################################################
+
+import re
+import time
+import heapq
+import random
+import calendar
+import threading
+
+from dateutil import tz as tzdb
+from datetime import datetime, timedelta
+from .exceptions import HanishValueError
+
+
+# Times of day that jobs are scheduled at, e.g. 9:00 or 17:30
+TIME_OF_DAY = re.compile(r'^(\d{1,2}):(\d{2})$')
+
+
+##########################################################################
+## Helper Functions
+##########################################################################
+
+def parse_time(at):
+    """
+    Returns the (hour, minute) of a time of day such as "9:00", or raises a
+    HanishValueError if it is not a valid time of day.
+    """
+    match = TIME_OF_DAY.match(at.strip())
+    if match is not None:
+        hour, minute = int(match.group(1)), int(match.group(2))
+        if hour < 24 and minute < 60:
+            return hour, minute
+
+    raise HanishValueError("'{}' is not a valid time of day".format(at))
+
+
+def zone(name):
+    """
+    Returns the tzinfo of the IANA timezone name, e.g. "America/New_York", or
+    None for the local time of the host. Raises a HanishValueError if the
+    timezone is unknown.
+    """
+    if name is None:
+        return None
+
+    tzinfo = tzdb.gettz(name) if name else None
+    if tzinfo is None:
+        raise HanishValueError("unknown timezone '{}'".format(name))
+    return tzinfo
+
+
+def next_daily(hour, minute, now, tz=None):
+    """
+    Returns the first time after now (in seconds since the epoch) that the
+    wall clock in the timezone reads hour:minute, in local time if tz is None.
+    """
+    if tz is None:
+        today = datetime.fromtimestamp(now)
+        due = today.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        if due <= today:
+            due += timedelta(days=1)
+        return time.mktime(due.timetuple())
+
+    # Arithmetic on aware datetimes keeps the wall clock time across DST
+    today = datetime.fromtimestamp(now, tz)
+    due = today.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if due <= today:
+        due += timedelta(days=1)
+    return calendar.timegm(due.utctimetuple())
+
+
+##########################################################################
+## Jobs
+##########################################################################
+
+class Job(object):
+    """
+    A Job is a function that is run by the scheduler when it is due, then
+    rescheduled unless it only runs once. Jobs are created by Scheduler.every,
+    Scheduler.daily and Scheduler.at.
+
+    Parameters
+    ----------
+    func: callable
+        The function to run, called with no arguments.
+
+    interval: time in seconds, default None
+        Run every interval seconds, if given.
+
+    at: (hour, minute) tuple, default None
+        Run every day at the time of day, if given.
+
+    tz: tzinfo, default None
+        The timezone of the time of day, None for the local time of the host.
+
+    when: time in seconds since the epoch, default None
+        Run once at the time, if given.
+
+    jitter: time in seconds, default 0
+        Delay each run by a random time up to the jitter, so that jobs that
+        are scheduled for the same time don't all run at once.
+    """
+
+    def __init__(self, func, interval=None, at=None, tz=None, jitter=0, when=None):
+        self.func = func
+        self.interval = interval
+        self.at = at
+        self.tz = tz
+        self.when = when
+        self.jitter = jitter
+        self.base = None # the time the job is next due without jitter
+        self.due = None  # the time the job is next due, None if cancelled
+
+    def reschedule(self, now):
+        """
+        Sets and returns the next time the job is due after now.
+        """
+        if self.when is not None:
+            base = self.when
+        elif self.at is not None:
+            base = next_daily(self.at[0], self.at[1], now, self.tz)
+        elif self.base is not None and self.base + self.interval > now:
+            # Keep to the interval from the last time to avoid drift
+            base = self.base + self.interval
+        else:
+            base = now + self.interval
+
+        self.base = base
+        self.due = base + random.uniform(0, self.jitter) if self.jitter else base
+        return self.due
+
+    @property
+    def once(self):
+        """
+        True if the job only runs once.
+        """
+        return self.when is not None
+
+    def __repr__(self):
+        if self.when is not None:
+            when = "once at {}".format(self.when)
+        elif self.at is not None:
+            when = "daily at {}:{:02d}".format(*self.at)
+            if self.tz is not None:
+                when += " {}".format(self.tz)
+        else:
+            when = "every {}s".format(self.interval)
+
+        name = getattr(self.func, "__name__", repr(self.func))
+        return "<Job {} {}>".format(name, when)
+
+
+##########################################################################
+## Scheduler
+##########################################################################
+
+class Scheduler(object):
+    """
+    A Scheduler keeps jobs in a heap by the time they are next due. Checking
+    for due jobs only inspects the top of the heap, so the event loop can run
+    the scheduler every time it wakes at a cost that does not depend on the
+    number of jobs, and idle_seconds tells it exactly how long it can block.
+    Cancelled jobs are discarded lazily when they reach the top of the heap.
+
+    Usage:
+
+        scheduler = Scheduler()
+        scheduler.every(30, prefetcher.tick, jitter=5)
+        scheduler.daily("9:00", notice, tz="America/New_York")
+        scheduler.at(time.time() + 3600, reminder)
+
+        while True:
+            time.sleep(scheduler.idle_seconds())
+            scheduler.run_pending()
+
+    Parameters
+    ----------
+    timer: callable, default = time.time
+        Returns the current time in seconds since the epoch.
+
+    wakeup: callable, default None
+        Called when a job is added that is due before every other job, e.g.
+        to wake an event loop that is blocked waiting for the previous one.
+    """
+
+    def __init__(self, timer=time.time, wakeup=None):
+        self.timer = timer
+        self.wakeup = wakeup
+        self.lock = threading.Lock()
+        self.heap = []  # (time due, sequence, job)
+        self.seq = 0
+        self.jobs = 0
+
+    def every(self, interval, func, jitter=0):
+        """
+        Schedules the function to run every interval seconds, first after one
+        interval has passed. Returns the job, which can be cancelled.
+        """
+        if interval <= 0:
+            raise HanishValueError("interval must be a positive number of seconds")
+        return self.add(Job(func, interval=interval, jitter=jitter))
+
+    def daily(self, at, func, tz=None, jitter=0):
+        """
+        Schedules the function to run every day at the time of day, e.g.
+        "9:00", in the timezone, e.g. "America/New_York" or None for the local
+        time of the host. Returns the job, which can be cancelled.
+        """
+        return self.add(Job(func, at=parse_time(at), tz=zone(tz), jitter=jitter))
+
+    def at(self, when, func):
+        """
+        Schedules the function to run once at the time in seconds since the
+        epoch, or as soon as possible if it has passed. Returns the job, which
+        can be cancelled.
+        """
+        return self.add(Job(func, when=when))
+
+    def add(self, job):
+        """
+        Adds the job to the schedule, due at its next time.
+        """
+        with self.lock:
+            if job.due is None:
+                self.jobs += 1
+
+            job.reschedule(self.timer())
+            earliest = not self.heap or job.due < self.heap[0][0]
+            self.push(job)
+
+        if earliest and self.wakeup is not None:
+            self.wakeup()
+        return job
+
+    def push(self, job):
+        self.seq += 1
+        heapq.heappush(self.heap, (job.due, self.seq, job))
+
+    def cancel(self, job):
+        """
+        Removes the job from the schedule.
+        """
+        with self.lock:
+            if job.due is not None:
+                job.base = job.due = None
+                self.jobs -= 1
+
+    def clear(self):
+        """
+        Removes every job from the schedule.
+        """
+        with self.lock:
+            for _, _, job in self.heap:
+                job.base = job.due = None
+            self.heap = []
+            self.jobs = 0
+
+    def pop_due(self, now):
+        """
+        Removes and returns the next job that is due at now, or None. Jobs
+        that were cancelled or rescheduled are discarded, and jobs that only
+        run once are removed from the schedule.
+        """
+        with self.lock:
+            while self.heap and self.heap[0][0] <= now:
+                due, _, job = heapq.heappop(self.heap)
+                if job.due != due:
+                    continue
+
+                if job.once:
+                    job.base = job.due = None
+                    self.jobs -= 1
+                else:
+                    job.reschedule(now)
+                    self.push(job)
+                return job
+        return None
+
+    def run_pending(self):
+        """
+        Runs every job that is due and returns the number of jobs that ran.
+        Jobs that are due again while running (e.g. after a long job) run on
+        the next call rather than this one.
+        """
+        now = self.timer()
+        ran = 0
+
+        while True:
+            job = self.pop_due(now)
+            if job is None:
+                return ran
+
+            try:
+                job.func()
+            except Exception as e:
+                # TODO: change to standardized logging functionality
+                print("scheduled job {!r} failed: {}".format(job, e))
+            ran += 1
+
+    def next_time(self):
+        """
+        Returns the time the next job is due, or None if there are no jobs.
+        """
+        with self.lock:
+            while self.heap:
+                due, _, job = self.heap[0]
+                if job.due == due:
+                    return due
+                heapq.heappop(self.heap)
+        return None
+
+    def idle_seconds(self):
+        """
+        Returns the number of seconds until the next job is due (negative if
+        it is overdue), or None if there are no jobs.
+        """
+        due = self.next_time()
+        if due is None:
+            return None
+        return due - self.timer()
+
+    def __len__(self):
+        return self.jobs
@@ -0,0 +1,172 @@
+# hanish.stream
+# Parses JSON responses keeping only a projection of their fields.
+#
+# Author:   Benjamin Bengfort <benjamin@bengfort.com>
+# Created:  Sat Oct 17 18:02:14 2026 -0400
+#
+# Copyright (C) 2016 Bengfort.com
+# For license information, see LICENSE.txt
+#
+# ID: stream.py [] benjamin@bengfort.com $
+
+"""
+Parses JSON responses keeping only a projection of their fields. If the
+optional ijson library is installed, responses can be decoded incrementally
+from the stream so that only the projected fields are ever built and the full
+response is never held in memory, otherwise the response is parsed in full
+and then projected. Note that incremental parsing trades CPU for memory: it
+is several times slower than the C json parser but has a far smaller peak.
+
+Fields are specified as dotted paths, e.g. "hourly.summary", where a path
+through an array applies to every item in it, e.g. "hourly.data.time".
+"""
+
+##########################################################################
+## Imports
+##########################################################################
+
+import json
+
+from decimal import Decimal
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+
+# Number of bytes read from the stream at a time by the incremental parser
+BUFFER_SIZE = 4096
+
+# Exceptions raised by parse for malformed or truncated JSON
+PARSE_ERRORS = (ValueError,) + ((ijson.JSONError,) if ijson else ())
+
+
+##########################################################################
+## Projection
+##########################################################################
+
+def fieldtree(fields):
+    """
+    Compiles a list of dotted field paths into a tree of nested dictionaries
+    whose leaves are True, e.g. ["a", "b.c"] becomes {"a": True, "b": {"c":
+    True}}. A path selects everything beneath it, so shorter paths win.
+    """
+    tree = {}
+    for field in fields:
+        node = tree
+        parts = field.split(".")
+        for part in parts[:-1]:
+            child = node.setdefault(part, {})
+            if child is True:
+                break
+            node = child
+        else:
+            node[parts[-1]] = True
+    return tree
+
+
+def project(data, fields):
+    """
+    Returns a copy of the parsed JSON data with only the fields in the list
+    of dotted paths (or compiled fieldtree). Objects that are not selected
+    are shared with the data rather than copied.
+    """
+    if not isinstance(fields, dict):
+        fields = fieldtree(fields)
+    return _project(data, fields)
+
+
+def _project(data, tree):
+    if tree is True:
+        return data
+
+    if isinstance(data, list):
+        return [_project(item, tree) for item in data]
+
+    if isinstance(data, dict):
+        return dict(
+            (key, _project(data[key], node))
+            for key, node in tree.items() if key in data
+        )
+
+    return data
+
+
+##########################################################################
+## Streaming Parse
+##########################################################################
+
+def parse(stream, fields, buf_size=BUFFER_SIZE):
+    """
+    Parses JSON from the file-like stream, returning only the fields in the
+    list of dotted paths (or compiled fieldtree). If ijson is installed, the
+    stream is parsed incrementally buf_size bytes at a time and only the
+    projected fields are built, otherwise it is read and parsed in full then
+    projected. Raises one of the PARSE_ERRORS if the JSON is malformed.
+    """
+    if not isinstance(fields, dict):
+        fields = fieldtree(fields)
+
+    if ijson is None:
+        return project(json.loads(stream.read().decode("utf-8")), fields)
+
+    return build(ijson.basic_parse(stream, buf_size=buf_size), fields)
+
+
+def build(events, tree):
+    """
+    Builds the projection of the fields tree from a stream of (event, value)
+    ijson basic_parse events, skipping (but still tokenizing) every value
+    that isn't selected.
+    """
+    root = None
+    stack = []  # [container or None if skipped, tree of the container, key]
+
+    for event, value in events:
+        if event == "map_key":
+            stack[-1][2] = value
+            continue
+
+        if event in ("end_map", "end_array"):
+            stack.pop()
+            continue
+
+        # Determine the tree of the value from its parent
+        if not stack:
+            node = tree
+        else:
+            parent, ptree, key = stack[-1]
+            if parent is None:
+                node = None
+            elif ptree is True or isinstance(parent, list):
+                node = ptree
+            else:
+                node = ptree.get(key)
+
+        # Build the value if it's selected
+        if event in ("start_map", "start_array"):
+            value = None if node is None else ({} if event == "start_map" else [])
+            stack.append([value, node, None])
+        elif isinstance(value, Decimal):
+            value = float(value)
+
+        if node is None:
+            continue
+
+        if not stack or (len(stack) == 1 and event in ("start_map", "start_array")):
+            root = value
+        elif event in ("start_map", "start_array"):
+            _attach(stack[-2], value)
+        else:
+            _attach(stack[-1], value)
+
+    return root
+
+
+def _attach(frame, value):
+    container, _, key = frame
+    if isinstance(container, list):
+        container.append(value)
+    else:
+        container[key] = value
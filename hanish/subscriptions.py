@@ -0,0 +1,276 @@
+# hanish.subscriptions
+# Channel subscriptions to scheduled weather broadcasts.
+#
+# Author:   Benjamin Bengfort <benjamin@bengfort.com>
+# Created:  Sat Oct 17 20:58:36 2026 -0400
+#
+# Copyright (C) 2016 Bengfort.com
+# For license information, see LICENSE.txt
+#
+# ID: subscriptions.py [] benjamin@bengfort.com $
+
+"""
+Channel subscriptions to scheduled weather broadcasts, e.g. the weather for a
+zipcode posted to a channel every morning, stored so that they survive bot
+restarts.
+"""
+
+##########################################################################
+## Imports
+##########################################################################
+
+import time
+import heapq
+import sqlite3
+import threading
+
+from collections import namedtuple
+from .exceptions import HanishValueError, DatabaseError
+from .scheduler import parse_time, next_daily, zone
+
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS subscriptions ("
+        "channel TEXT NOT NULL, "
+        "zipcode TEXT NOT NULL, "
+        "hour INTEGER NOT NULL, "
+        "minute INTEGER NOT NULL, "
+        "timezone TEXT, "
+        "PRIMARY KEY (channel, zipcode)"
+    ")"
+)
+
+# Default subscriptions that have been made, so they are only made once
+DEFAULTS = (
+    "CREATE TABLE IF NOT EXISTS defaults ("
+        "channel TEXT NOT NULL, "
+        "zipcode TEXT NOT NULL, "
+        "PRIMARY KEY (channel, zipcode)"
+    ")"
+)
+
+
+# A channel's subscription to the weather for a zipcode at a time of day in
+# a timezone, e.g. "America/New_York" or None for the local time of the host
+Subscription = namedtuple("Subscription", "channel zipcode hour minute timezone")
+Subscription.__new__.__defaults__ = (None,)
+
+
+##########################################################################
+## Subscriptions
+##########################################################################
+
+class Subscriptions(object):
+    """
+    Subscriptions maps channels to the zipcodes and times of day that the
+    weather is broadcast to them, and keeps a heap of the subscriptions by
+    the next time that they are due, so that finding the subscriptions that
+    are due only visits those subscriptions no matter how many there are.
+    Subscribing replaces any subscription of the channel to the zipcode, and
+    replaced or removed subscriptions are discarded lazily from the heap.
+
+    Times of day are in the timezone of the subscription, e.g. the timezone
+    of the forecast for the zipcode, or in the local time of the host.
+
+    Subscriptions are stored in a Sqlite3 database and the heap is rebuilt
+    from it when the subscriptions are created, so that channels stay
+    subscribed when the bot is restarted.
+
+    Usage:
+
+        subscriptions = Subscriptions("subscriptions.db")
+        subscriptions.subscribe("#general", "20001", "9:00")
+
+        for sub in subscriptions.due():
+            post(sub.channel, weather(sub.zipcode))
+
+    Parameters
+    ----------
+    path: string or None, default = None
+        Path to the Sqlite3 database to store the subscriptions in, created if
+        it does not exist. If None, subscriptions are kept in memory only.
+
+    timer: callable, default = time.time
+        Returns the current time in seconds since the epoch.
+    """
+
+    def __init__(self, path=None, timer=time.time):
+        self.path = path
+        self.timer = timer
+        self.lock = threading.Lock()
+        self.subscriptions = {} # (channel, zipcode) -> (subscription, sequence)
+        self.heap = []          # (next time, sequence, subscription)
+        self.seq = 0
+
+        # Connect to the database, shared between threads behind the lock
+        self.conn = sqlite3.connect(
+            path or ":memory:", timeout=30, check_same_thread=False
+        )
+
+        with self.conn:
+            self.conn.execute(SCHEMA)
+            self.conn.execute(DEFAULTS)
+
+        self.load()
+
+    def close(self):
+        """
+        Close the connection to the database, the subscriptions remain on disk
+        but no further changes are allowed (otherwise an exception is raised).
+        """
+        with self.lock:
+            self.conn.close()
+            self.conn = None
+
+    def execute(self, sql, *args, **kwargs):
+        """
+        Helper function that executes a single SQL statement in a transaction
+        and returns the cursor to read the results of the query.
+        """
+        if self.conn is None:
+            raise DatabaseError("subscriptions database has been closed")
+
+        with self.conn:
+            return self.conn.execute(sql, *args, **kwargs)
+
+    def load(self):
+        """
+        Schedules every subscription stored in the database.
+        """
+        with self.lock:
+            now = self.timer()
+            rows = self.execute(
+                "SELECT channel, zipcode, hour, minute, timezone FROM subscriptions"
+            ).fetchall()
+
+            for row in rows:
+                sub = Subscription(*row)
+                self.push(sub, self.next_time(sub, now))
+
+    def next_time(self, sub, now):
+        """
+        Returns the first time after now that the subscription is due.
+        """
+        return next_daily(sub.hour, sub.minute, now, zone(sub.timezone))
+
+    def subscribe(self, channel, zipcode, at="9:00", timezone=None):
+        """
+        Subscribes the channel to the weather for the zipcode every day at the
+        time of day in the timezone, returning the subscription. Raises a
+        HanishValueError if the time of day or the timezone is invalid.
+        """
+        hour, minute = parse_time(at)
+        sub = Subscription(channel, zipcode, hour, minute, timezone)
+        with self.lock:
+            due = self.next_time(sub, self.timer())
+            self.execute(
+                "INSERT OR REPLACE INTO subscriptions VALUES (?,?,?,?,?)", sub
+            )
+            self.push(sub, due)
+        return sub
+
+    def subscribe_default(self, channel, zipcode, at="9:00", timezone=None):
+        """
+        Subscribes the channel to the zipcode like subscribe, unless it has
+        been subscribed by default before, e.g. by an earlier run of the bot,
+        or is already subscribed. Returns the subscription or None if it was
+        not made, so that changes to or the removal of the subscription are
+        kept when the default is applied at every startup.
+        """
+        with self.lock:
+            made = self.execute(
+                "SELECT 1 FROM defaults WHERE channel=? AND zipcode=?",
+                (channel, zipcode)
+            ).fetchone() is not None
+            made = made or (channel, zipcode) in self.subscriptions
+
+        sub = None
+        if not made:
+            sub = self.subscribe(channel, zipcode, at, timezone)
+
+        with self.lock:
+            self.execute(
+                "INSERT OR IGNORE INTO defaults VALUES (?,?)", (channel, zipcode)
+            )
+        return sub
+
+    def push(self, sub, due):
+        """
+        Schedules the subscription at the due time, replacing any previous
+        entry of the channel and zipcode. Heap entries are identified by a
+        sequence number, which also breaks ties so subscriptions are never
+        compared.
+        """
+        self.seq += 1
+        self.subscriptions[(sub.channel, sub.zipcode)] = (sub, self.seq)
+        heapq.heappush(self.heap, (due, self.seq, sub))
+
+    def current(self, seq, sub):
+        """
+        Returns True if the heap entry is the latest of its subscription.
+        """
+        entry = self.subscriptions.get((sub.channel, sub.zipcode))
+        return entry is not None and entry[1] == seq
+
+    def unsubscribe(self, channel, zipcode):
+        """
+        Removes the subscription of the channel to the zipcode, raising a
+        HanishValueError if the channel is not subscribed to the zipcode.
+        """
+        with self.lock:
+            if self.subscriptions.pop((channel, zipcode), None) is None:
+                raise HanishValueError(
+                    "{} is not subscribed to {}".format(channel, zipcode)
+                )
+
+            self.execute(
+                "DELETE FROM subscriptions WHERE channel=? AND zipcode=?",
+                (channel, zipcode)
+            )
+
+    def due(self):
+        """
+        Removes and returns the list of subscriptions that are due, then
+        schedules each of them for the next day.
+        """
+        now = self.timer()
+        due = []
+
+        with self.lock:
+            while self.heap and self.heap[0][0] <= now:
+                _, seq, sub = heapq.heappop(self.heap)
+
+                # Discard entries of replaced or removed subscriptions
+                if self.current(seq, sub):
+                    due.append(sub)
+
+            # Push after popping so that subscriptions are due once per call
+            for sub in due:
+                self.push(sub, self.next_time(sub, now))
+
+        return due
+
+    def next(self):
+        """
+        Returns the next time that a subscription is due, or None.
+        """
+        with self.lock:
+            while self.heap:
+                when, seq, sub = self.heap[0]
+                if self.current(seq, sub):
+                    return when
+                heapq.heappop(self.heap)
+        return None
+
+    def channel(self, channel):
+        """
+        Returns the list of the subscriptions of the channel by zipcode.
+        """
+        with self.lock:
+            return sorted(
+                (sub for sub, _ in self.subscriptions.values() if sub.channel == channel),
+                key=lambda sub: sub.zipcode,
+            )
+
+    def __len__(self):
+        return len(self.subscriptions)
@@ -17,6 +17,8 @@ Decorators and package utilities.
 ## Imports
 ##########################################################################
 
+import threading
+
 from functools import wraps
 
 
@@ -40,3 +42,73 @@ def memoized(fget):
         return getattr(self, attr_name)
 
     return property(fget_memoized)
+
+
+##########################################################################
+## Concurrency
+##########################################################################
+
+class SingleFlight(object):
+    """
+    Deduplicates concurrent calls by key: while a call for a key is in
+    flight, other calls for the same key wait for it to complete and share
+    its result (or exception) rather than making the call again. Once the
+    call completes, the next call for the key is made again.
+
+    Usage:
+
+        flights = SingleFlight()
+        data = flights.do(key, api.fetch, key)
+
+    The number of calls made and the number of calls that were collapsed
+    into a call that was already in flight are tracked by the instance.
+    """
+
+    class Flight(object):
+        """
+        A call in flight, waiters block on the event until it completes.
+        """
+
+        def __init__(self):
+            self.event = threading.Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.flights = {}
+        self.calls = 0
+        self.collapsed = 0
+
+    def do(self, key, func, *args, **kwargs):
+        """
+        Calls func with the args and kwargs unless a call for the key is
+        already in flight, in which case waits for and returns its result.
+        """
+        with self.lock:
+            flight = self.flights.get(key)
+            leader = flight is None
+
+            if leader:
+                flight = self.flights[key] = self.Flight()
+                self.calls += 1
+            else:
+                self.collapsed += 1
+
+        # Wait for the call in flight and share its result or exception.
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = func(*args, **kwargs)
+            return flight.result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.flights[key]
+            flight.event.set()
@@ -12,18 +12,50 @@
 """
 Utility for mapping zip codes to latitude, longitude coords. Loads an
 in-memory sqlite database for quickly querying specific zip codes.
+
+The CSV source is compiled once into a binary index file that is memory
+mapped on open, so that the CSV only has to be parsed when it changes.
 """
 
 ##########################################################################
 ## Imports
 ##########################################################################
 
+import os
+import re
 import csv
+import sys
+import mmap
+import struct
+import bisect
 import sqlite3
-
+import hashlib
+import tempfile
+import warnings
+
+from array import array
+from collections import OrderedDict
+from .geo import GridIndex
+from .utils import memoized
 from .exceptions import DatabaseError, HanishValueError
 
 
+# Binary index format: a fixed header followed by the sorted zip code keys as
+# unsigned 32-bit ints and the latitude and longitude columns as float64s.
+INDEX_MAGIC   = b"HZIP"
+INDEX_VERSION = 1
+INDEX_EXT     = ".idx"
+INDEX_HEADER  = struct.Struct("<4sHcxIdQ20s")
+
+# Maximum number of zip codes per query in batch lookups (sqlite param limit).
+QUERY_CHUNK_SIZE = 500
+
+# Number of possible 5-digit zip codes, e.g. slots in the dense lookup table.
+ZIPCODE_SLOTS = 100000
+
+# Valid zip codes are exactly five ASCII digits (str.isdigit accepts others).
+ZIPCODE = re.compile(r'^[0-9]{5}\Z')
+
 SCHEMA = (
     "CREATE TABLE IF NOT EXISTS zipcodes ("
         "zipcode TEXT, "
@@ -33,6 +65,305 @@ SCHEMA = (
 )
 
 
+##########################################################################
+## Helper Functions
+##########################################################################
+
+def zipkey(zipcode):
+    """
+    Converts a 5-digit zip code string into the integer key used by the
+    compiled index, returning None if the string is not a valid zip code.
+    """
+    if ZIPCODE.match(zipcode) is None:
+        return None
+    return int(zipcode)
+
+
+def unique(zipcodes):
+    """
+    Returns a list of the zip codes with duplicates removed, preserving order.
+    """
+    seen = set()
+    return [
+        zipcode for zipcode in zipcodes
+        if not (zipcode in seen or seen.add(zipcode))
+    ]
+
+
+def partition(zipcodes, found):
+    """
+    Partitions the ordered zip codes into an OrderedDict of the zip codes in
+    found mapped to their coordinates and a list of the unknown zip codes.
+    """
+    coords, unknown = OrderedDict(), []
+    for zipcode in zipcodes:
+        if zipcode in found:
+            coords[zipcode] = found[zipcode]
+        else:
+            unknown.append(zipcode)
+    return coords, unknown
+
+
+def column(buf, typecode, start, stop):
+    """
+    Returns the values of the typecode in buf[start:stop] as a zero-copy
+    memoryview on Python 3, or as an array copied from the buffer on Python 2
+    where memory maps do not support the buffer protocol.
+    """
+    if hasattr(memoryview, "cast"):
+        return memoryview(buf)[start:stop].cast(typecode)
+
+    values = array(typecode)
+    values.fromstring(buf[start:stop])
+    return values
+
+
+def extend(values, col):
+    """
+    Appends the values of a column returned by column to the array.
+    """
+    if isinstance(col, array):
+        values.extend(col)
+    else:
+        values.frombytes(col.cast("B"))
+
+
+def checksum(path):
+    """
+    Returns the SHA1 digest of the file at the specified path.
+    """
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b""):
+            digest.update(chunk)
+    return digest.digest()
+
+
+##########################################################################
+## ZipCodeIndex
+##########################################################################
+
+class ZipCodeIndex(object):
+    """
+    A ZipCodeIndex is a compiled, read-only binary version of the zip code
+    CSV file. The index is a fixed header, that records the format version,
+    byte order, number of rows and the mtime, size and SHA1 digest of the
+    source CSV, followed by three packed columns: the sorted zip codes as
+    unsigned 32-bit integers and the latitudes and longitudes as float64s.
+
+    The index file is memory mapped when opened, and the columns are exposed
+    as memoryviews, so opening the index costs nearly nothing regardless of
+    the number of zip codes it contains.
+
+    Usage:
+
+        # Compile the index if needed and open it
+        index = ZipCodeIndex.open('fixtures/ziplatlon.csv')
+        lat, lon = index.lookup('20001')
+
+        # When done, close the index
+        index.close()
+
+    Parameters
+    ----------
+    path: string
+        Path to a compiled index file, normally created with compile.
+    """
+
+    @classmethod
+    def open(klass, source, path=None):
+        """
+        Opens the compiled index for the source CSV, compiling it first if
+        the index does not exist or if it is stale. The index is stale if the
+        mtime or size of the source has changed and its content hash no
+        longer matches, or if it was compiled with a different format.
+
+        By default the index is stored next to the source with an ".idx"
+        extension; if that location is not writable then the index is kept
+        in the system temporary directory instead.
+        """
+        paths = [path] if path else [
+            source + INDEX_EXT, klass.tmppath(source),
+        ]
+
+        for path in paths:
+            # Open the index if it is still fresh for the source.
+            if klass.isfresh(source, path):
+                return klass(path)
+
+            # Otherwise attempt to compile it to this location.
+            try:
+                return klass.compile(source, path)
+            except (IOError, OSError):
+                if path == paths[-1]: raise
+
+    @classmethod
+    def compile(klass, source, path=None):
+        """
+        Compiles the source CSV file into the binary index format, writing
+        the index atomically to the path (by default next to the source with
+        an ".idx" extension) and returning the opened index.
+        """
+        path = path or source + INDEX_EXT
+        stat = os.stat(source)
+
+        # Read the rows from the CSV file, keyed by their integer zip code.
+        rows = {}
+        with open(source, 'r') as f:
+            for row in csv.DictReader(f):
+                key = zipkey(row['ZIP'].strip())
+                if key is None:
+                    raise DatabaseError(
+                        "invalid zipcode '{}' in {}".format(row['ZIP'], source)
+                    )
+                rows[key] = (float(row['LAT']), float(row['LNG']))
+
+        # Pack the header and the sorted columns of the index.
+        keys = sorted(rows)
+        header = INDEX_HEADER.pack(
+            INDEX_MAGIC, INDEX_VERSION, sys.byteorder[0].encode('ascii'),
+            len(keys), stat.st_mtime, stat.st_size, checksum(source),
+        )
+
+        # Write to a temporary file and move into place so that concurrent
+        # readers never observe a partially written index.
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(header)
+                f.write(struct.pack("={}I".format(len(keys)), *keys))
+                f.write(klass.padding(len(keys)))
+                f.write(struct.pack(
+                    "={}d".format(len(keys)), *(rows[key][0] for key in keys)
+                ))
+                f.write(struct.pack(
+                    "={}d".format(len(keys)), *(rows[key][1] for key in keys)
+                ))
+            os.chmod(tmp, 0o644)
+            os.rename(tmp, path)
+        except:
+            os.remove(tmp)
+            raise
+
+        return klass(path)
+
+    @classmethod
+    def isfresh(klass, source, path):
+        """
+        Returns True if the index at path exists, has the current format and
+        byte order and was compiled from the current version of the source.
+        """
+        try:
+            with open(path, 'rb') as f:
+                header = f.read(INDEX_HEADER.size)
+            stat = os.stat(source)
+        except (IOError, OSError):
+            return False
+
+        if len(header) != INDEX_HEADER.size:
+            return False
+
+        magic, version, order, _, mtime, size, digest = INDEX_HEADER.unpack(header)
+        if magic != INDEX_MAGIC or version != INDEX_VERSION:
+            return False
+
+        if order != sys.byteorder[0].encode('ascii'):
+            return False
+
+        # Fast path: the source has not been touched since compilation.
+        if mtime == stat.st_mtime and size == stat.st_size:
+            return True
+
+        # Slow path: the source was touched, compare the content hashes.
+        return size == stat.st_size and digest == checksum(source)
+
+    @staticmethod
+    def tmppath(source):
+        """
+        Returns the fallback path of the index for the source in the system
+        temporary directory, unique to the absolute path of the source.
+        """
+        name = hashlib.sha1(os.path.abspath(source).encode('utf-8')).hexdigest()
+        return os.path.join(tempfile.gettempdir(), "hanish-{}{}".format(name, INDEX_EXT))
+
+    @staticmethod
+    def padding(count):
+        """
+        Returns the padding bytes that 8-byte align the float64 columns after
+        count unsigned 32-bit int keys.
+        """
+        return b"\x00" * ((count * 4) % 8)
+
+    def __init__(self, path):
+        self.path = path
+
+        # Memory map the index file
+        with open(path, 'rb') as f:
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        # Parse the header and compute the offsets of the columns
+        header = INDEX_HEADER.unpack_from(self.mmap, 0)
+        if header[0] != INDEX_MAGIC or header[1] != INDEX_VERSION:
+            self.mmap.close()
+            raise DatabaseError("{} is not a zip code index".format(path))
+
+        count = header[3]
+        lats  = INDEX_HEADER.size + count * 4 + len(self.padding(count))
+        lons  = lats + count * 8
+
+        # Expose the columns as zero-copy views of the memory map (copies on
+        # Python 2, see column).
+        self.keys = column(self.mmap, 'I', INDEX_HEADER.size, INDEX_HEADER.size+count*4)
+        self.latitudes = column(self.mmap, 'd', lats, lons)
+        self.longitudes = column(self.mmap, 'd', lons, lons+count*8)
+
+    def close(self):
+        """
+        Release the memory views and unmap the index file.
+        """
+        for view in (self.keys, self.latitudes, self.longitudes):
+            if isinstance(view, memoryview):
+                view.release()
+
+        self.mmap.close()
+        self.keys = self.latitudes = self.longitudes = None
+
+    def find(self, zipcode):
+        """
+        Returns the row of the zipcode in the index or None if not found.
+        """
+        key = zipkey(zipcode)
+        if key is None:
+            return None
+
+        idx = bisect.bisect_left(self.keys, key)
+        if idx < len(self.keys) and self.keys[idx] == key:
+            return idx
+        return None
+
+    def lookup(self, zipcode):
+        """
+        Returns the latitude and longitude of the zipcode or raises a
+        HanishValueError if the zipcode is not in the index.
+        """
+        idx = self.find(zipcode)
+        if idx is None:
+            raise HanishValueError(
+                u"could not find zipcode '{}'".format(zipcode)
+            )
+        return self.latitudes[idx], self.longitudes[idx]
+
+    def rows(self):
+        """
+        Returns an iterator of (zipcode, latitude, longitude) tuples in order.
+        """
+        zipcodes = ("{:05d}".format(key) for key in self.keys)
+        return zip(zipcodes, self.latitudes, self.longitudes)
+
+    def __len__(self):
+        return len(self.keys)
+
+
 ##########################################################################
 ## ZipCodeDB
 ##########################################################################
@@ -47,6 +378,9 @@ class ZipCodeDB(object):
 
     It is also included in the fixtures directory of the repository.
 
+    Deprecated: use the ArrayZipCodeDB, which is loaded from the compiled
+    index without inserting every row into a database.
+
     Usage:
 
         # Load the db and lookup coordinates
@@ -66,21 +400,31 @@ class ZipCodeDB(object):
 
             ZIP,LAT,LNG
 
+        The CSV file is compiled into a binary index (see ZipCodeIndex) the
+        first time it is loaded, the rows are then bulk inserted from the
+        index rather than being parsed from the CSV on every load.
+
         If the database is not initialized with load, then it will be empty.
+
+        Deprecated: loading still inserts every row into Sqlite3, use the
+        ArrayZipCodeDB, which loads directly from the compiled index, instead.
         """
+        warnings.warn(
+            "ZipCodeDB is deprecated, use ArrayZipCodeDB instead",
+            DeprecationWarning, stacklevel=2,
+        )
 
-        # Initialize the database and get a cursor
+        # Initialize the database and open the compiled index
         db = klass()
-        cursor = db.conn.cursor()
+        index = ZipCodeIndex.open(path)
 
-        # Read the data from the CSV file and insert into db
-        with open(path, 'r') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                args = (row['ZIP'], float(row['LAT']), float(row['LNG']))
-                cursor.execute(
-                    "INSERT INTO zipcodes VALUES (?,?,?)", args
-                )
+        # Bulk insert the rows from the index into the database
+        try:
+            db.conn.executemany(
+                "INSERT INTO zipcodes VALUES (?,?,?)", index.rows()
+            )
+        finally:
+            index.close()
 
         # Commit the database operations
         db.conn.commit()
@@ -150,11 +494,48 @@ class ZipCodeDB(object):
         value = cursor.fetchone()
         if value is None:
             raise HanishValueError(
-                "could not find zipcode '{}'".format(zipcode)
+                u"could not find zipcode '{}'".format(zipcode)
             )
 
         return value
 
+    def lookup_many(self, zipcodes):
+        """
+        Lookup the geographic coordinates for a batch of U.S. postal codes in
+        as few queries as possible. Unlike lookup, postal codes that are not
+        in the database do not raise an exception but are reported separately.
+
+        Parameters
+        ----------
+        zipcodes: iterable of strings
+            United States 5-digit postal codes, duplicates are ignored
+
+        Returns
+        -------
+        coords: OrderedDict
+            Maps each zip code that was found to its (latitude, longitude) in
+            the order the zip codes were given
+
+        unknown: list
+            The zip codes that were not found in the database, in order
+        """
+        zipcodes = unique(zipcodes)
+        found = {}
+
+        # Query the zip codes in chunks to stay under the sqlite param limit
+        for idx in range(0, len(zipcodes), QUERY_CHUNK_SIZE):
+            chunk = zipcodes[idx:idx+QUERY_CHUNK_SIZE]
+            cursor = self.execute(
+                "SELECT zipcode, latitude, longitude FROM zipcodes "
+                "WHERE zipcode IN ({})".format(",".join("?" * len(chunk))),
+                chunk
+            )
+
+            for zipcode, lat, lon in cursor:
+                found[zipcode] = (lat, lon)
+
+        return partition(zipcodes, found)
+
     def count(self):
         """
         Returns the number of zipcodes that are currently in the database.
@@ -166,3 +547,216 @@ class ZipCodeDB(object):
 
         # Fetch, validate and return the value
         return cursor.fetchone()[0]
+
+
+
+##########################################################################
+## ArrayZipCodeDB
+##########################################################################
+
+class ArrayZipCodeDB(object):
+    """
+    An ArrayZipCodeDB is an alternative to the ZipCodeDB that holds the zip
+    codes in memory in dense arrays rather than in a Sqlite3 database. Every
+    possible 5-digit zip code is a slot in a 100,000 element table that holds
+    the row of the zip code in the parallel latitude and longitude columns
+    (or -1 if it does not exist) so lookups are O(1) with no query overhead.
+
+    The arrays are copied directly from the compiled ZipCodeIndex so loading
+    the database does not require parsing the CSV file or inserting rows.
+
+    Usage:
+
+        # Load the db and lookup coordinates
+        zipdb = ArrayZipCodeDB.load('fixtures/ziplatlon.csv')
+        lat, lon = zipdb.lookup('20001')
+
+        # When done, close the db
+        zipdb.close()
+
+    Note: Zip Codes are strings, not numbers (becasuse of leading zeros).
+    """
+
+    @classmethod
+    def load(klass, path):
+        """
+        Load the zip code database from a CSV file that has three columns:
+
+            ZIP,LAT,LNG
+
+        The CSV file is compiled into a binary index (see ZipCodeIndex) the
+        first time it is loaded and the columns are copied from the index.
+
+        If the database is not initialized with load, then it will be empty.
+        """
+        db = klass()
+        index = ZipCodeIndex.open(path)
+
+        try:
+            # Copy the columns from the memory mapped index
+            extend(db.keys, index.keys)
+            extend(db.latitudes, index.latitudes)
+            extend(db.longitudes, index.longitudes)
+        finally:
+            index.close()
+
+        # Build the dense zip code to row lookup table
+        for idx, key in enumerate(db.keys):
+            db.slots[key] = idx
+
+        return db
+
+    def __init__(self):
+        self.slots = array('i', [-1]) * ZIPCODE_SLOTS
+        self.keys = array('I')
+        self.latitudes = array('d')
+        self.longitudes = array('d')
+
+    def close(self):
+        """
+        Release the arrays, removing data from memory and allowing no further
+        accesses (otherwise an exception will be raised).
+        """
+        self.slots = self.keys = self.latitudes = self.longitudes = None
+        if hasattr(self, '_spatial'): del self._spatial
+
+    def find(self, zipcode):
+        """
+        Returns the row of the zipcode in the columns or None if not found.
+        """
+        # Check the database
+        if self.slots is None:
+            raise DatabaseError(
+                "Zip Code database has been closed and removed from memory"
+            )
+
+        key = zipkey(zipcode)
+        if key is None or self.slots[key] < 0:
+            return None
+        return self.slots[key]
+
+    def lookup(self, zipcode):
+        """
+        Lookup the geographic coordinates for a given U.S. postal code. If the
+        postal code is not in the database, this method raises a ValueError.
+
+        Parameters
+        ----------
+        zipcode: string
+            A United States 5-digit postal code
+
+        Returns
+        -------
+        latitude: float
+            The latitude portion of the geo-coordinates for the zip code
+
+        longitude: float
+            The longitude portion of the geo-coordinates for the zip code
+        """
+        idx = self.find(zipcode)
+        if idx is None:
+            raise HanishValueError(
+                u"could not find zipcode '{}'".format(zipcode)
+            )
+
+        return self.latitudes[idx], self.longitudes[idx]
+
+    def lookup_many(self, zipcodes):
+        """
+        Lookup the geographic coordinates for a batch of U.S. postal codes in
+        a single pass over the lookup table. Unlike lookup, postal codes that
+        are not in the database do not raise an exception but are reported
+        separately.
+
+        Parameters
+        ----------
+        zipcodes: iterable of strings
+            United States 5-digit postal codes, duplicates are ignored
+
+        Returns
+        -------
+        coords: OrderedDict
+            Maps each zip code that was found to its (latitude, longitude) in
+            the order the zip codes were given
+
+        unknown: list
+            The zip codes that were not found in the database, in order
+        """
+        zipcodes = unique(zipcodes)
+        found = {}
+
+        # Bind the arrays locally to avoid attribute lookups in the loop
+        find, lats, lons = self.find, self.latitudes, self.longitudes
+        for zipcode in zipcodes:
+            idx = find(zipcode)
+            if idx is not None:
+                found[zipcode] = (lats[idx], lons[idx])
+
+        return partition(zipcodes, found)
+
+    @memoized
+    def spatial(self):
+        """
+        The grid index over the latitude and longitude columns used for
+        nearest and within queries, built on first access.
+        """
+        if self.keys is None:
+            raise DatabaseError(
+                "Zip Code database has been closed and removed from memory"
+            )
+        return GridIndex(self.latitudes, self.longitudes)
+
+    def nearest(self, lat, lon, k=1):
+        """
+        Reverse geocodes the coordinates to the k nearest zip codes.
+
+        Parameters
+        ----------
+        lat,lon: float
+            The geo-coordinates to find the nearest zip codes to.
+
+        k: int, default=1
+            The number of zip codes to return.
+
+        Returns
+        -------
+        zipcodes: list
+            A list of (zipcode, distance in miles) tuples sorted by distance.
+        """
+        return [
+            ("{:05d}".format(self.keys[idx]), dist)
+            for idx, dist in self.spatial.nearest(lat, lon, k)
+        ]
+
+    def within(self, lat, lon, radius):
+        """
+        Finds all of the zip codes within a radius of the coordinates, e.g.
+        to group zip codes that can share a single forecast.
+
+        Parameters
+        ----------
+        lat,lon: float
+            The geo-coordinates at the center of the search.
+
+        radius: float
+            The radius of the search in miles.
+
+        Returns
+        -------
+        zipcodes: list
+            A list of (zipcode, distance in miles) tuples sorted by distance.
+        """
+        return [
+            ("{:05d}".format(self.keys[idx]), dist)
+            for idx, dist in self.spatial.within(lat, lon, radius)
+        ]
+
+    def count(self):
+        """
+        Returns the number of zipcodes that are currently in the database.
+        """
+        if self.keys is None:
+            raise DatabaseError(
+                "Zip Code database has been closed and removed from memory"
+            )
+        return len(self.keys)
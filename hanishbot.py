@@ -83,8 +83,9 @@ if __name__ == '__main__':
 
     # Create the command line argument parser and subparsers
     parser = argparse.ArgumentParser(
-        description=DESCRIPTION, version=VERSION, epilog=EPILOG,
+        description=DESCRIPTION, epilog=EPILOG,
     )
+    parser.add_argument('-v', '--version', action='version', version=VERSION)
     subparsers = parser.add_subparsers(title="commands")
 
     # Add the chat command subparser
@@ -19,7 +19,14 @@ Tests the primary Bot interface for the hanish module.
 
 import os
 import json
+import errno
+import select
+import time
+import shutil
+import socket
+import tempfile
 import unittest
+import threading
 
 try:
     # Python 3
@@ -29,7 +36,14 @@ except ImportError:
     import mock
 
 from hanish.bot import *
+from hanish.commands import Registry
+from hanish.exceptions import DarkSkyException
+from hanish.forecast import Forecast
+from hanish.scheduler import Scheduler
+from hanish.subscriptions import Subscription
+from .test_cache import Clock
 from .test_darksky import WEATHER
+from .test_subscriptions import localtime
 from .test_zipcode import FIXTURES, ZIPCODES
 
 
@@ -138,12 +152,48 @@ class BotTests(unittest.TestCase):
         self.assertEqual(bot.slack.token, self.ENVIRON['SLACK_ACCESS_TOKEN'])
         self.assertEqual(bot.zipdb.count(), 33144)
 
+    def test_config_forecast_cache_size(self):
+        """
+        Test the size of the forecast cache is configurable
+        """
+        self.assertEqual(Bot(forecast_size="10").darksky.cache.maxsize, 10)
+
+        tmpdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmpdir, "forecasts.db")
+            bot = Bot(forecast_cache=path, forecast_size="10")
+            self.assertEqual(bot.darksky.cache.maxsize, 10)
+            self.assertEqual(bot.darksky.backend.maxsize, 10)
+            self.assertIsNone(Bot(forecast_cache=path).darksky.backend.maxsize)
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_config_forecast_quota(self):
+        """
+        Test the Dark Sky quota is configurable and reported
+        """
+        bot = Bot(forecast_limit="50", forecast_burst="5")
+        self.assertEqual(bot.darksky.quota.limit, 50)
+        self.assertEqual(bot.darksky.quota.burst, 5)
+        self.assertIsNone(Bot().darksky.quota.burst)
+
+        # The darksky command reports the calls counted by the quota
+        bot.darksky.quota.report(12)
+        bot.slack.api_call = mock.MagicMock()
+        bot.handle_message({
+            'ts': '1494357965.614957', 'channel': 'CTESTCHAN',
+            'text': '<@UTEST3210> darksky limit',
+        })
+        bot.slack.api_call.assert_called_once_with(
+            'chat.postMessage', channel='CTESTCHAN', as_user=True,
+            text="I have made 12 Dark Sky API calls today, 38 remaining.",
+        )
+
     def test_bot_commands_parsing(self):
         """
         Test the command parsing on a variety of correct command strings
         """
 
-        # TODO: Refactor commands into its own module and tests
         commands = Bot().commands
 
         # Closure that asserts the text matches the given command name.
@@ -186,7 +236,7 @@ class BotTests(unittest.TestCase):
 
     def test_botid_property(self):
         """
-        Test the botid search and atbotid filters
+        Test the botid search and @botid mentions
         """
         # Create the bot
         bot = Bot()
@@ -204,15 +254,19 @@ class BotTests(unittest.TestCase):
         self.assertEqual(bot.botid, 'UTEST3210')
         bot.slack.api_call.assert_called_once_with('users.list')
 
-        # Test atbotid filter
+        # Test @botid mentions
         table = (
-            "hello <@UTEST3210>!",
-            "<@UTEST3210> weather now",
-            "weather now <@UTEST3210>",
+            ("hello <@UTEST3210>!", True),
+            ("<@UTEST3210> weather now", True),
+            ("weather now <@UTEST3210>", True),
+            ("<@UTEST3210|hanishbot> weather now", True),
+            ("<@UTEST32101> weather now", False),
+            ("<@UTEST32101|otherbot> weather now", False),
         )
 
-        for msg in table:
-            self.assertIsNotNone(bot.atbotid.search(msg))
+        for text, directed in table:
+            msg = {"type": "message", "user": "ULWTEST32", "channel": "CTESTCHAN", "text": text}
+            self.assertEqual(bot.directed(msg), directed, text)
 
     def test_chat_handling_and_responses(self):
         """
@@ -227,7 +281,7 @@ class BotTests(unittest.TestCase):
             ]
 
         with open(WEATHER, 'r') as f:
-            weather = json.load(f)
+            weather = Forecast.from_json(json.load(f))
 
         # Create a bot and patch the slack client
         bot = Bot()
@@ -255,9 +309,459 @@ class BotTests(unittest.TestCase):
         bot.slack.api_call.assert_has_calls([
             make_call(u"Currently in 20001 it is 54.4\xb0F and mostly cloudy. It will be mostly cloudy throughout the day."),
             make_call(u"Light rain on Sunday and Monday, with temperatures rising to 62\xb0F on Wednesday."),
-            make_call("I have made 0 Dark Sky API calls today."),
+            make_call("I have made 0 Dark Sky API calls today, 1000 remaining."),
             make_call(u"Currently in 58054 it is 54.4\xb0F and mostly cloudy. It will be mostly cloudy throughout the day."),
             make_call(u"Currently in 90210 it is 54.4\xb0F and mostly cloudy. It will be mostly cloudy throughout the day."),
             make_call(u"Currently in 20742 it is 54.4\xb0F and mostly cloudy. It will be mostly cloudy throughout the day."),
             make_call("I'm happy to chat about the weather,  unfortunately I don't understand what you're asking."),
         ])
+
+    def test_location_unknown_zipcodes(self):
+        """
+        Test that known zipcodes are answered before unknown are reported.
+        """
+        with open(WEATHER, 'r') as f:
+            weather = Forecast.from_json(json.load(f))
+
+        # Create a bot and patch the slack client
+        bot = Bot()
+        bot.darksky.forecast = mock.MagicMock(return_value=weather)
+        bot.slack.api_call = mock.MagicMock()
+
+        # Handle a message with both known and unknown zipcodes
+        bot.handle_message({
+            'ts': '1494357965.614957', 'channel': 'CTESTCHAN',
+            'text': '<@UTEST3210> weather in 00000 and weather in 20742',
+        })
+
+        self.assertEqual(bot.darksky.forecast.call_count, 1)
+        self.assertEqual(len(bot.slack.api_call.mock_calls), 2)
+        bot.slack.api_call.assert_called_with(
+            'chat.postMessage', channel='CTESTCHAN', as_user=True,
+            text="Sorry, there was a problem with your request: could not find zipcode(s) 00000",
+        )
+
+    def test_wait_for_frames(self):
+        """
+        Test that the run loop wakes on websocket frames and on stop.
+        """
+        bot = Bot()
+        server, client = socket.socketpair()
+        bot.slack.server.websocket = mock.MagicMock(sock=client)
+        bot.wakeup = os.pipe()
+
+        try:
+            # Nothing to read, so the wait times out
+            self.assertFalse(bot.wait(0.01))
+
+            # A frame wakes the loop immediately
+            server.sendall(b"frame")
+            start = time.time()
+            self.assertTrue(bot.wait(5))
+            self.assertLess(time.time() - start, 1)
+            client.recv(512)
+
+            # Stopping from another thread (or a signal) wakes the loop
+            threading.Timer(0.05, bot.stop).start()
+            start = time.time()
+            self.assertFalse(bot.wait(5))
+            self.assertLess(time.time() - start, 1)
+            self.assertTrue(bot.shutdown)
+        finally:
+            server.close()
+            client.close()
+            for fd in bot.wakeup:
+                os.close(fd)
+
+    def test_wait_interrupted(self):
+        """
+        Test that a signal interrupting the wait does not crash the run loop.
+        """
+        bot = Bot()
+        server, client = socket.socketpair()
+        bot.slack.server.websocket = mock.MagicMock(sock=client)
+        bot.wakeup = os.pipe()
+
+        try:
+            interrupted = select.error(errno.EINTR, "Interrupted system call")
+            with mock.patch("hanish.bot.select.select", side_effect=interrupted):
+                self.assertFalse(bot.wait(5))
+
+            failed = select.error(errno.EBADF, "Bad file descriptor")
+            with mock.patch("hanish.bot.select.select", side_effect=failed):
+                with self.assertRaises(select.error):
+                    bot.wait(5)
+        finally:
+            server.close()
+            client.close()
+            for fd in bot.wakeup:
+                os.close(fd)
+
+    def test_schedule_timeout(self):
+        """
+        Test the run loop blocks until the next scheduled task is due.
+        """
+        bot = Bot()
+        self.assertEqual(bot.timeout(), WAIT_TIMEOUT)
+
+        bot.set_schedule("America/New_York")
+        self.assertEqual(len(bot.scheduler), 2)
+        self.assertLessEqual(bot.timeout(), 30)
+        self.assertEqual(bot.subscriptions.channel("#general")[0].timezone, "America/New_York")
+
+        # Adding an earlier task wakes the run loop to shorten its timeout
+        bot.wakeup = os.pipe()
+        try:
+            bot.scheduler.every(1, mock.MagicMock())
+            self.assertEqual(os.read(bot.wakeup[0], 512), b"\0")
+            self.assertLessEqual(bot.timeout(), 1)
+        finally:
+            for fd in bot.wakeup:
+                os.close(fd)
+
+    def test_schedule_restart(self):
+        """
+        Test the default subscription does not undo changes on restart.
+        """
+        tmpdir = tempfile.mkdtemp()
+        path = os.path.join(tmpdir, "subscriptions.db")
+
+        def restart():
+            bot = Bot(subscriptions=path)
+            bot.set_schedule("America/New_York")
+            return bot
+
+        try:
+            # The first run subscribes the default channel to the default zip
+            bot = restart()
+            self.assertEqual(bot.subscriptions.channel("#general"), [
+                Subscription("#general", "20001", 9, 0, "America/New_York"),
+            ])
+
+            # Custom times are kept when the bot is restarted
+            bot.subscriptions.subscribe("#general", "20001", "7:30", "America/New_York")
+            bot.subscriptions.close()
+
+            bot = restart()
+            self.assertEqual(bot.subscriptions.channel("#general"), [
+                Subscription("#general", "20001", 7, 30, "America/New_York"),
+            ])
+
+            # Unsubscribed channels stay unsubscribed
+            bot.subscriptions.unsubscribe("#general", "20001")
+            bot.subscriptions.close()
+
+            bot = restart()
+            self.assertEqual(bot.subscriptions.channel("#general"), [])
+            self.assertIsNone(bot.notice)
+            bot.subscriptions.close()
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_custom_registry(self):
+        """
+        Test that commands can be added without subclassing the bot.
+        """
+        commands = Registry()
+
+        @commands.register('ping', r'ping')
+        def ping(bot, msg, matches):
+            bot.post(msg['channel'], "pong")
+
+        bot = Bot(registry=commands)
+        bot.slack.api_call = mock.MagicMock()
+        bot.handle_message({
+            'ts': '1494357965.614957', 'channel': 'CTESTCHAN',
+            'text': '<@UTEST3210> ping',
+        })
+
+        bot.slack.api_call.assert_called_once_with(
+            'chat.postMessage', channel='CTESTCHAN', as_user=True, text="pong",
+        )
+
+    def test_directed_filter(self):
+        """
+        Test that RTM events not directed at the bot are dropped.
+        """
+        bot = Bot()
+        bot._botid = "UTEST3210"
+
+        table = (
+            ({"type": "user_typing", "user": "ULWTEST32", "channel": "CTESTCHAN"}, False),
+            ({"type": "message", "user": "ULWTEST32", "channel": "CTESTCHAN", "text": "weather now"}, False),
+            ({"type": "message", "user": "ULWTEST32", "channel": "CTESTCHAN", "text": "<@UTEST3210> weather now"}, True),
+            ({"type": "message", "user": "ULWTEST32", "channel": "CTESTCHAN", "text": "<@UTEST3210|hanishbot> weather now"}, True),
+            ({"type": "message", "user": "ULWTEST32", "channel": "DTESTCHAN", "text": "weather now"}, True),
+            ({"type": "message", "user": "UTEST3210", "channel": "DTESTCHAN", "text": "Currently in 20001"}, False),
+            ({"type": "message", "subtype": "bot_message", "channel": "CTESTCHAN", "text": "<@UTEST3210> weather now"}, False),
+            ({"type": "message", "subtype": "message_changed", "channel": "CTESTCHAN", "message": {}}, False),
+            ({"type": "message", "subtype": "message_deleted", "channel": "CTESTCHAN", "deleted_ts": "1494357965.614957"}, False),
+            ({"type": "message", "subtype": "file_share", "user": "ULWTEST32", "channel": "CTESTCHAN", "text": "<@UTEST3210> weather 20001"}, True),
+            ({"type": "message", "subtype": "thread_broadcast", "user": "ULWTEST32", "channel": "CTESTCHAN", "text": "<@UTEST3210> weather now"}, True),
+            ({"type": "message", "subtype": "me_message", "user": "ULWTEST32", "channel": "DTESTCHAN", "text": "wants the weather"}, True),
+            ({"type": "message", "subtype": "me_message", "user": "UTEST3210", "channel": "DTESTCHAN", "text": "checks the weather"}, False),
+        )
+
+        for msg, directed in table:
+            self.assertEqual(bot.directed(msg), directed, msg)
+
+    def test_event_counters(self):
+        """
+        Test that received, dropped and handled events are counted.
+        """
+        with open(RTM_MSG, 'r') as f:
+            messages = [json.loads(line.strip()) for line in f]
+
+        bot = Bot()
+        bot._botid = "UTEST3210"
+        bot.handle_message = mock.MagicMock()
+        bot.slack.rtm_read = mock.MagicMock(return_value=messages)
+        bot.read_rtm_channel()
+
+        self.assertEqual(bot.handle_message.call_count, 6)
+        self.assertEqual(bot.events, {
+            "received": len(messages), "dropped": len(messages) - 6, "handled": 6,
+        })
+
+    def test_subscription_commands(self):
+        """
+        Test that channels subscribe to and unsubscribe from zipcodes.
+        """
+        with open(WEATHER, 'r') as f:
+            weather = Forecast.from_json(json.load(f))
+
+        bot = Bot()
+        bot.darksky.forecast = mock.MagicMock(return_value=weather)
+        bot.slack.api_call = mock.MagicMock()
+        bot.handle_message({
+            'ts': '1494357965.614957', 'channel': 'CTESTCHAN',
+            'text': '<@UTEST3210> subscribe to 20001 and subscribe to 20742 at 7:30',
+        })
+
+        subs = bot.subscriptions.channel('CTESTCHAN')
+        self.assertEqual([(sub.zipcode, sub.hour, sub.minute, sub.timezone) for sub in subs], [
+            ('20001', 9, 0, 'America/New_York'), ('20742', 7, 30, 'America/New_York'),
+        ])
+        bot.slack.api_call.assert_called_with(
+            'chat.postMessage', channel='CTESTCHAN', as_user=True,
+            text="I'll post the weather for 20742 here every day at 7:30 (America/New_York).",
+        )
+
+        self.assertEqual(bot.scheduler.next_time(), bot.subscriptions.next())
+
+        bot.handle_message({
+            'ts': '1494357965.614957', 'channel': 'CTESTCHAN',
+            'text': '<@UTEST3210> unsubscribe from 20001',
+        })
+        self.assertEqual(len(bot.subscriptions.channel('CTESTCHAN')), 1)
+        self.assertEqual(len(bot.scheduler), 1)
+
+    def test_subscription_unknown_timezone(self):
+        """
+        Test that subscriptions fall back to local time for unknown timezones.
+        """
+        with open(WEATHER, 'r') as f:
+            weather = Forecast.from_json(json.load(f))
+        weather = weather.replace(timezone='Mars/Olympus_Mons')
+
+        bot = Bot()
+        bot.darksky.forecast = mock.MagicMock(return_value=weather)
+        bot.slack.api_call = mock.MagicMock()
+        bot.handle_message({
+            'ts': '1494357965.614957', 'channel': 'CTESTCHAN',
+            'text': '<@UTEST3210> subscribe to 20001',
+        })
+
+        self.assertIsNone(bot.subscriptions.channel('CTESTCHAN')[0].timezone)
+        bot.slack.api_call.assert_called_with(
+            'chat.postMessage', channel='CTESTCHAN', as_user=True,
+            text="I'll post the weather for 20001 here every day at 9:00.",
+        )
+
+    def test_subscription_invalid_time(self):
+        """
+        Test that invalid times of day are reported rather than subscribed.
+        """
+        with open(WEATHER, 'r') as f:
+            weather = Forecast.from_json(json.load(f))
+
+        bot = Bot()
+        bot.darksky.forecast = mock.MagicMock(return_value=weather)
+        bot.slack.api_call = mock.MagicMock()
+        bot.handle_message({
+            'ts': '1494357965.614957', 'channel': 'CTESTCHAN',
+            'text': '<@UTEST3210> subscribe to 20001 and subscribe to 20742 at 25:99',
+        })
+
+        self.assertEqual(bot.subscriptions.channel('CTESTCHAN'), [])
+        self.assertFalse(bot.darksky.forecast.called)
+        bot.slack.api_call.assert_called_once_with(
+            'chat.postMessage', channel='CTESTCHAN', as_user=True,
+            text="Sorry, there was a problem with your request: '25:99' is not a valid time of day",
+        )
+
+    def test_weather_notice_batches_fetches(self):
+        """
+        Test that due subscriptions fetch each unique zipcode once.
+        """
+        with open(WEATHER, 'r') as f:
+            weather = Forecast.from_json(json.load(f))
+
+        bot = Bot()
+        bot.darksky.forecast = mock.MagicMock(return_value=weather)
+        bot.slack.api_call = mock.MagicMock()
+
+        channels = ["C{:08d}".format(idx) for idx in range(200)]
+        for idx, channel in enumerate(channels):
+            bot.subscriptions.subscribe(channel, ("20001", "20742")[idx % 2])
+        bot.subscriptions.subscribe("CBADZIPCO", "00000")
+
+        # Make every subscription due
+        bot.subscriptions.timer = lambda: time.time() + 86400
+        bot.weather_notice()
+
+        self.assertEqual(bot.darksky.forecast.call_count, 2)
+        self.assertEqual(bot.slack.api_call.call_count, 200)
+        self.assertEqual(len(bot.yesterday), 200)
+
+        # Unchanged forecasts are not broadcast again the next day
+        bot.subscriptions.timer = lambda: time.time() + 2 * 86400
+        bot.weather_notice()
+        self.assertEqual(bot.darksky.forecast.call_count, 4)
+        self.assertEqual(bot.slack.api_call.call_count, 200)
+
+    def test_weather_notice_fetch_errors(self):
+        """
+        Test that a failed fetch does not stop broadcasts for other zipcodes.
+        """
+        with open(WEATHER, 'r') as f:
+            weather = Forecast.from_json(json.load(f))
+
+        bot = Bot()
+        failed = bot.zipdb.lookup("20742")
+
+        def forecast(lat, lon):
+            if (lat, lon) == failed:
+                raise DarkSkyException("no forecast")
+            return weather
+
+        bot.darksky.forecast = mock.MagicMock(side_effect=forecast)
+        bot.slack.api_call = mock.MagicMock()
+        bot.subscriptions.subscribe("CTESTCHAN", "20001")
+        bot.subscriptions.subscribe("CFAILCHAN", "20742")
+        bot.subscriptions.timer = lambda: time.time() + 86400
+
+        bot.weather_notice()
+        self.assertEqual(bot.darksky.forecast.call_count, 2)
+        self.assertEqual(bot.slack.api_call.call_count, 1)
+        self.assertEqual(list(bot.yesterday), [("CTESTCHAN", "20001")])
+
+    def test_weather_notice_in_background(self):
+        """
+        Test that broadcasts are fetched off the run loop while running.
+        """
+        with open(WEATHER, 'r') as f:
+            weather = Forecast.from_json(json.load(f))
+
+        fetching = threading.Event()
+        release = threading.Event()
+
+        def forecast(lat, lon):
+            fetching.set()
+            release.wait(5)
+            return weather
+
+        bot = Bot()
+        bot.darksky.forecast = mock.MagicMock(side_effect=forecast)
+        bot.slack.api_call = mock.MagicMock()
+        bot.dispatcher = mock.MagicMock()
+        bot.subscriptions.subscribe("CTESTCHAN", "20001")
+        bot.subscriptions.timer = lambda: time.time() + 86400
+
+        # The notice returns while the forecast is still being fetched
+        bot.weather_notice()
+        self.assertTrue(fetching.wait(5))
+        self.assertFalse(bot.slack.api_call.called)
+
+        # An overlapping broadcast does not replace the one in progress
+        bot.subscriptions.timer = time.time
+        bot.subscriptions.subscribe("COTHERCHAN", "20742")
+        bot.subscriptions.timer = lambda: time.time() + 86400
+        bot.weather_notice()
+        self.assertEqual(len(bot.broadcasters), 2)
+
+        release.set()
+        for broadcaster in bot.broadcasters:
+            broadcaster.join(5)
+        self.assertEqual(bot.slack.api_call.call_count, 2)
+
+    @mock.patch("hanish.bot.signal")
+    def test_run_shutdown(self, msignal):
+        """
+        Test that shutdown waits on every broadcast and closes the wakeup pipe.
+        """
+        with open(WEATHER, 'r') as f:
+            weather = Forecast.from_json(json.load(f))
+
+        bot = Bot()
+        bot.darksky.forecast = mock.MagicMock(return_value=weather)
+        bot.slack.rtm_connect = mock.MagicMock(return_value=True)
+        bot._botid = "UTEST3210"
+
+        # Stop the run loop the first time it waits
+        def wait(timeout):
+            self.assertIsNotNone(bot.wakeup)
+            bot.stop()
+            return False
+
+        bot.wait = mock.MagicMock(side_effect=wait)
+        broadcasters = [mock.MagicMock(), mock.MagicMock()]
+        bot.broadcasters = list(broadcasters)
+        bot.run()
+
+        for broadcaster in broadcasters:
+            broadcaster.join.assert_called_once_with(WAIT_TIMEOUT)
+        self.assertEqual(bot.broadcasters, [])
+
+        # Waking the stopped bot, e.g. by scheduling a job, does nothing
+        self.assertIsNone(bot.wakeup)
+        bot.interrupt()
+        bot.scheduler.every(1, mock.MagicMock())
+
+    def test_weather_notice_scheduled(self):
+        """
+        Test that the weather notice runs when the next subscription is due.
+        """
+        clock = Clock(localtime(6))
+        bot = Bot(prefetch=0)
+        bot.scheduler = Scheduler(timer=clock)
+        bot.subscriptions.timer = clock
+        bot.broadcast = mock.MagicMock()
+
+        bot.set_schedule()
+        self.assertEqual(len(bot.scheduler), 1)
+        self.assertEqual(bot.scheduler.next_time(), localtime(9))
+
+        # An earlier subscription moves the notice
+        bot.subscriptions.subscribe("CTESTCHAN", "20742", "7:30")
+        bot.schedule_notice()
+        self.assertEqual(len(bot.scheduler), 1)
+        self.assertEqual(bot.scheduler.next_time(), localtime(7, 30))
+
+        # Nothing runs until a subscription is due
+        clock.now = localtime(7)
+        self.assertEqual(bot.scheduler.run_pending(), 0)
+
+        clock.now = localtime(7, 30)
+        self.assertEqual(bot.scheduler.run_pending(), 1)
+        bot.broadcast.assert_called_once_with([
+            Subscription("CTESTCHAN", "20742", 7, 30),
+        ])
+        self.assertEqual(bot.scheduler.next_time(), localtime(9))
+
+        clock.now = localtime(9)
+        self.assertEqual(bot.scheduler.run_pending(), 1)
+        bot.broadcast.assert_called_with([
+            Subscription("#general", "20001", 9, 0),
+        ])
+        self.assertEqual(bot.scheduler.next_time(), localtime(7, 30, day=11))
@@ -0,0 +1,321 @@
+# tests.test_cache
+# Tests for the cache data structures.
+#
+# Author:   Benjamin Bengfort <benjamin@bengfort.com>
+# Created:  Sat Oct 17 11:24:51 2026 -0400
+#
+# Copyright (C) 2016 Bengfort.com
+# For license information, see LICENSE.txt
+#
+# ID: test_cache.py [] benjamin@bengfort.com $
+
+"""
+Tests for the cache data structures.
+"""
+
+##########################################################################
+## Imports
+##########################################################################
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from hanish.cache import *
+from hanish.exceptions import DatabaseError
+
+try:
+    # Python 3
+    from unittest import mock
+except ImportError:
+    # Python 2
+    import mock
+
+
+##########################################################################
+## TTLCache Tests
+##########################################################################
+
+class Clock(object):
+    """
+    A manually advanced timer for testing expiration.
+    """
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class TTLCacheTests(unittest.TestCase):
+
+    def test_dict_interface(self):
+        """
+        Test the dict interface of the cache
+        """
+        cache = TTLCache(maxsize=None, ttl=None)
+        cache["foo"] = "bar"
+        cache[(1.0, 2.0)] = {"a": 1}
+
+        self.assertEqual(len(cache), 2)
+        self.assertIn("foo", cache)
+        self.assertEqual(cache["foo"], "bar")
+        self.assertEqual(cache.get((1.0, 2.0)), {"a": 1})
+        self.assertIsNone(cache.get("baz"))
+
+        self.assertEqual(cache.pop("foo"), "bar")
+        self.assertIsNone(cache.pop("foo", None))
+        with self.assertRaises(KeyError):
+            cache.pop("foo")
+
+        del cache[(1.0, 2.0)]
+        with self.assertRaises(KeyError):
+            cache[(1.0, 2.0)]
+
+        self.assertEqual(len(cache), 0)
+
+    def test_expiration(self):
+        """
+        Test lazy expiration of entries after the ttl
+        """
+        clock = Clock()
+        cache = TTLCache(ttl=300, timer=clock)
+        cache["foo"] = "bar"
+
+        clock.now += 299
+        self.assertEqual(cache.get("foo"), "bar")
+        self.assertEqual(cache.get_with_age("foo"), ("bar", 299.0))
+
+        clock.now += 1
+        self.assertNotIn("foo", cache)
+        self.assertIsNone(cache.get("foo"))
+        self.assertEqual(cache.stats()["expired"], 1)
+
+    def test_set_with_age(self):
+        """
+        Test that entries set with an age expire after the rest of the ttl
+        """
+        clock = Clock()
+        cache = TTLCache(ttl=300, timer=clock)
+        cache.set("foo", "bar", age=200)
+        self.assertEqual(cache.get_with_age("foo"), ("bar", 200.0))
+
+        clock.now += 99
+        self.assertEqual(cache.get("foo"), "bar")
+
+        clock.now += 1
+        self.assertIsNone(cache.get("foo"))
+
+    def test_sweeping(self):
+        """
+        Test that expired entries are swept on writes
+        """
+        clock = Clock()
+        cache = TTLCache(ttl=100, sweep=60, timer=clock)
+        for idx in range(10):
+            cache[idx] = idx
+            clock.now += 10
+
+        # Overwriting moves the key to the end of the expiration order
+        cache[0] = 0
+
+        # Sweeps are not run until the interval has passed
+        clock.now = 1105.0
+        cache["foo"] = "bar"
+        self.assertEqual(len(cache.data), 12 - 1)
+
+        clock.now = 1165.0
+        cache["baz"] = "bar"
+        self.assertEqual(sorted(cache.data, key=str), [0, 7, 8, 9, "baz", "foo"])
+        self.assertEqual(cache.stats()["expired"], 6)
+
+    def test_peek(self):
+        """
+        Test peeking does not count stats, reorder or remove entries
+        """
+        clock = Clock()
+        cache = TTLCache(maxsize=2, ttl=300, timer=clock)
+        cache["a"] = 1
+        cache["b"] = 2
+
+        clock.now += 10
+        self.assertEqual(cache.peek("a"), (1, 10))
+        self.assertEqual(cache.peek("c"), (None, None))
+        self.assertEqual((cache.hits, cache.misses), (0, 0))
+
+        # Peeking did not make "a" the most recently used
+        cache["c"] = 3
+        self.assertNotIn("a", cache)
+
+        clock.now += 300
+        self.assertEqual(cache.peek("b", "expired"), ("expired", None))
+        self.assertEqual(len(cache.data), 2)
+
+    def test_lru_eviction(self):
+        """
+        Test that the least recently used entries are evicted
+        """
+        cache = TTLCache(maxsize=3, ttl=None)
+        for idx in range(3):
+            cache[idx] = idx
+
+        # Use the oldest so that the second oldest is evicted
+        self.assertEqual(cache[0], 0)
+        cache[3] = 3
+
+        self.assertEqual(len(cache), 3)
+        self.assertNotIn(1, cache)
+        for idx in (0, 2, 3):
+            self.assertIn(idx, cache)
+
+        self.assertEqual(cache.stats(), {
+            "size": 3, "hits": 1, "misses": 0, "evictions": 1, "expired": 0,
+        })
+
+
+##########################################################################
+## SqliteCache Tests
+##########################################################################
+
+class SqliteCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "cache.db")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_persistence(self):
+        """
+        Test that cached values survive closing and reopening the cache
+        """
+        cache = SqliteCache(self.path)
+        cache[(38.9, -77.0, ("minutely",), False, "en", "auto")] = {"a": [1, 2]}
+        cache["foo"] = "bar"
+        self.assertEqual(len(cache), 2)
+        cache.close()
+
+        with self.assertRaises(DatabaseError):
+            cache.get("foo")
+
+        cache = SqliteCache(self.path)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache[(38.9, -77.0, ("minutely",), False, "en", "auto")], {"a": [1, 2]})
+        self.assertEqual(cache.pop("foo"), "bar")
+        self.assertNotIn("foo", cache)
+        self.assertIsNone(cache.pop("foo", None))
+
+        with self.assertRaises(KeyError):
+            cache["foo"]
+
+    @mock.patch("hanish.cache.time")
+    def test_expiration(self, mtime):
+        """
+        Test that entries expire after the ttl
+        """
+        mtime.time.return_value = 1000.0
+        cache = SqliteCache(self.path, ttl=300)
+        cache["foo"] = "bar"
+
+        mtime.time.return_value = 1299.0
+        self.assertEqual(cache.get("foo"), "bar")
+        self.assertEqual(cache.get_with_age("foo"), ("bar", 299.0))
+        self.assertEqual(len(cache), 1)
+
+        mtime.time.return_value = 1300.0
+        self.assertEqual(cache.get_with_age("foo"), (None, None))
+        self.assertIsNone(cache.get("foo"))
+        self.assertEqual(len(cache), 0)
+
+    @mock.patch("hanish.cache.time")
+    def test_peek(self, mtime):
+        """
+        Test peeking does not count stats, touch or delete entries
+        """
+        mtime.time.return_value = 1000.0
+        cache = SqliteCache(self.path, ttl=300)
+        cache["foo"] = "bar"
+
+        def accessed():
+            return cache.execute("SELECT accessed FROM cache").fetchall()
+
+        mtime.time.return_value = 1100.0
+        self.assertEqual(cache.peek("foo"), ("bar", 100.0))
+        self.assertEqual(cache.peek("baz"), (None, None))
+        self.assertEqual(accessed(), [(1000.0,)])
+        self.assertEqual((cache.hits, cache.misses), (0, 0))
+
+        mtime.time.return_value = 1300.0
+        self.assertEqual(cache.peek("foo"), (None, None))
+        self.assertEqual(accessed(), [(1000.0,)])
+
+    @mock.patch("hanish.cache.time")
+    def test_unbounded_hits_do_not_write(self, mtime):
+        """
+        Test that hits only touch entries when eviction is enabled
+        """
+        mtime.time.return_value = 1000.0
+        unbounded = SqliteCache(self.path, ttl=300)
+        bounded = SqliteCache(":memory:", ttl=300, maxsize=3)
+
+        for cache in (unbounded, bounded):
+            cache["foo"] = "bar"
+
+        mtime.time.return_value = 1100.0
+        for cache in (unbounded, bounded):
+            self.assertEqual(cache.get("foo"), "bar")
+
+        sql = "SELECT accessed FROM cache"
+        self.assertEqual(unbounded.execute(sql).fetchall(), [(1000.0,)])
+        self.assertEqual(bounded.execute(sql).fetchall(), [(1100.0,)])
+
+    @mock.patch("hanish.cache.time")
+    def test_purging(self, mtime):
+        """
+        Test that expired entries are purged from disk on writes
+        """
+        mtime.time.return_value = 1000.0
+        cache = SqliteCache(self.path, ttl=300, sweep=60)
+        for idx in range(10):
+            cache[idx] = idx
+
+        def rows():
+            return cache.execute("SELECT count(key) FROM cache").fetchone()[0]
+
+        # Expired entries are not purged until the sweep interval passes
+        mtime.time.return_value = 1299.0
+        cache["foo"] = "bar"
+        mtime.time.return_value = 1300.0
+        cache["baz"] = "qux"
+        self.assertEqual(rows(), 12)
+        self.assertEqual(len(cache), 2)
+
+        mtime.time.return_value = 1359.0
+        cache["zap"] = "zip"
+        self.assertEqual(rows(), 3)
+        self.assertEqual(cache.stats()["expired"], 10)
+
+    @mock.patch("hanish.cache.time")
+    def test_size_bounded_eviction(self, mtime):
+        """
+        Test that the least recently accessed entries are evicted
+        """
+        cache = SqliteCache(self.path, ttl=None, maxsize=3)
+        for idx in range(3):
+            mtime.time.return_value = float(idx)
+            cache[idx] = idx
+
+        # Access the oldest so that the second oldest is evicted
+        mtime.time.return_value = 10.0
+        self.assertEqual(cache[0], 0)
+
+        mtime.time.return_value = 11.0
+        cache[3] = 3
+
+        self.assertEqual(len(cache), 3)
+        self.assertNotIn(1, cache)
+        for idx in (0, 2, 3):
+            self.assertIn(idx, cache)
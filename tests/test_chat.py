@@ -22,6 +22,7 @@ import json
 import unittest
 
 from hanish.chat import *
+from hanish.forecast import Forecast
 from .test_darksky import WEATHER
 
 
@@ -33,9 +34,9 @@ class ChatTests(unittest.TestCase):
 
     def setUp(self):
         with open(WEATHER, 'r') as f:
-            self.weather = json.load(f)
-            self.weather["zipcode"] = 90210
-            self.weather["api_calls"] = 15
+            self.weather = Forecast.from_json(
+                json.load(f), zipcode=90210, api_calls=15
+            )
 
     def tearDown(self):
         self.weather = None
@@ -52,6 +53,33 @@ class ChatTests(unittest.TestCase):
             weather_currently(self.weather), expected
         )
 
+    def test_weather_currently_rendered(self):
+        """
+        Test the rendered conditions of the forecast are used in the response
+        """
+        self.assertIsNotNone(self.weather.conditions)
+        other = self.weather.replace(zipcode="20001")
+        self.assertEqual(other.conditions, self.weather.conditions)
+        self.assertEqual(
+            weather_currently(other),
+            u"Currently in 20001" + self.weather.conditions,
+        )
+
+        # Copies share the conditions rendered by the original
+        self.assertIs(other.conditions, self.weather.conditions)
+
+        # Replacing the fields the conditions are rendered from renders them
+        warmer = self.weather.replace(temperature=72.0)
+        self.assertEqual(
+            weather_currently(warmer),
+            u"Currently in 90210 it is 72.0\u00b0F and mostly cloudy. "
+            u"It will be mostly cloudy throughout the day.",
+        )
+
+        # The conditions are derived, not set
+        with self.assertRaises(TypeError):
+            self.weather.replace(conditions=u" it is sunny.")
+
     def test_weather_tomorrow(self):
         """
         Test the response to weather tomorrow
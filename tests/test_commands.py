@@ -0,0 +1,127 @@
+# tests.test_commands
+# Tests for parsing commands from messages.
+#
+# Author:   Benjamin Bengfort <benjamin@bengfort.com>
+# Created:  Sat Oct 17 15:26:41 2026 -0400
+#
+# Copyright (C) 2016 Bengfort.com
+# For license information, see LICENSE.txt
+#
+# ID: test_commands.py [] benjamin@bengfort.com $
+
+"""
+Tests for parsing commands from messages.
+"""
+
+##########################################################################
+## Imports
+##########################################################################
+
+import unittest
+
+from hanish.commands import CommandRouter, Registry, registry
+
+
+##########################################################################
+## CommandRouter Tests
+##########################################################################
+
+class CommandRouterTests(unittest.TestCase):
+
+    def setUp(self):
+        self.router = CommandRouter([
+            ('weather', r'weather\s+(now|tomorrow)'),
+            ('location', r'weather\s+in\s+(\d{5})'),
+            ('forecast', r'forecast\s+(\d+)\s+(days|hours)'),
+            ('darksky', r'darksky\s+limit'),
+        ])
+
+    def test_scan(self):
+        """
+        Test all commands and their arguments are found in order
+        """
+        text = (
+            "<@U1234ABCD> darksky limit, Weather In 20742 and WEATHER NOW "
+            "then forecast 3 days and weather in 98021"
+        )
+
+        self.assertEqual(list(self.router.scan(text)), [
+            ('darksky', ()),
+            ('location', ('20742',)),
+            ('weather', ('NOW',)),
+            ('forecast', ('3', 'days')),
+            ('location', ('98021',)),
+        ])
+
+        self.assertEqual(list(self.router.scan("hello <@U1234ABCD>")), [])
+
+    def test_route(self):
+        """
+        Test commands are grouped by name in the order of the router
+        """
+        text = "weather in 20742 darksky limit weather now weather in 98021"
+        routes = self.router.route(text)
+
+        self.assertEqual(list(routes), ['weather', 'location', 'darksky'])
+        self.assertEqual(routes['weather'], [('now',)])
+        self.assertEqual(routes['location'], [('20742',), ('98021',)])
+        self.assertEqual(routes['darksky'], [()])
+
+    def test_commands(self):
+        """
+        Test the individual commands can be accessed by name
+        """
+        self.assertEqual(len(self.router), 4)
+        self.assertIn('location', self.router)
+        self.assertNotIn('unknown', self.router)
+        self.assertEqual(list(self.router), ['weather', 'location', 'forecast', 'darksky'])
+        self.assertEqual(
+            self.router['location'].search("weather in 20742").group(1), '20742'
+        )
+
+
+##########################################################################
+## Registry Tests
+##########################################################################
+
+class RegistryTests(unittest.TestCase):
+
+    def test_default_registry(self):
+        """
+        Test the bot commands are registered in order
+        """
+        names = ['weather', 'location', 'darksky', 'subscribe', 'unsubscribe']
+        self.assertEqual(list(registry), names)
+        self.assertEqual(list(registry.router), names)
+        self.assertEqual(registry['location'].metadata['help'], "weather in (zipcode)")
+
+    def test_register_and_dispatch(self):
+        """
+        Test commands are dispatched to handlers by priority
+        """
+        commands = Registry()
+
+        @commands.register('echo', r'echo\s+(\w+)')
+        def echo(bot, msg, matches):
+            return matches
+
+        @commands.register('ping', r'ping', priority=10, help="ping")
+        def ping(bot, msg, matches):
+            return "pong"
+
+        self.assertEqual(len(commands), 2)
+        self.assertEqual(commands['ping'].metadata, {'help': "ping"})
+        self.assertEqual(commands.dispatch("echo hello ping echo world"), [
+            (ping, 'ping', [()]),
+            (echo, 'echo', [('hello',), ('world',)]),
+        ])
+
+        # Registering a command with the same name replaces the command
+        router = commands.router
+        commands.add('echo', r'repeat\s+(\w+)', ping, priority=20)
+        self.assertIsNot(commands.router, router)
+        self.assertEqual(commands.dispatch("echo hello repeat world ping"), [
+            (ping, 'echo', [('world',)]),
+            (ping, 'ping', [()]),
+        ])
+        self.assertEqual(commands.dispatch("hello world"), [])
@@ -19,10 +19,20 @@ Tests for the Dark Sky API handlers.
 
 import os
 import json
+import shutil
+import tempfile
 import unittest
+import requests
+import threading
 import requests_mock
 
 from hanish.darksky import *
+from hanish.cache import SqliteCache, TTLCache
+from hanish.forecast import Forecast, FORECAST_FIELDS
+from hanish.stream import project
+from hanish.exceptions import QuotaExceeded, DarkSkyException
+from requests.packages.urllib3.response import HTTPResponse
+from requests.packages.urllib3.exceptions import ReadTimeoutError, ConnectTimeoutError
 
 try:
     # Python 3
@@ -53,6 +63,13 @@ def load_weather_json(request, context):
     return load_fixture(WEATHER)
 
 
+def mock_forecast_request(endpoint, exclude=None, **query):
+    data = load_fixture(WEATHER)
+    for block in (exclude or "").split(","):
+        data.pop(block, None)
+    return data
+
+
 ##########################################################################
 ## Dark Sky API Tests
 ##########################################################################
@@ -82,6 +99,99 @@ class DarkSkyTests(unittest.TestCase):
         self.assertEqual(api.n_api_calls, 42)
         self.assertEqual(len(data.keys()), 9)
 
+    def test_darksky_request_session(self, m):
+        """
+        Test that requests use the pooled session with timeouts and retries.
+        """
+        api = DarkSky(TEST_API_KEY, pool_size=4, timeout=(1, 2), retries=5)
+
+        # Check the connection pool configuration
+        adapter = api.session.get_adapter("https://api.darksky.net/forecast")
+        self.assertEqual(adapter._pool_maxsize, 4)
+        self.assertEqual(adapter.max_retries.total, 5)
+        self.assertIn(429, adapter.max_retries.status_forcelist)
+        self.assertIn(503, adapter.max_retries.status_forcelist)
+
+        # Make the request and check the timeout and headers
+        endpoint = "/forecast/0123456789abcdef9876543210fedcba/42.3601,-71.0589"
+        m.get("https://api.darksky.net" + endpoint, json=load_weather_json)
+        api.request(endpoint)
+
+        self.assertEqual(m.last_request.timeout, (1, 2))
+        self.assertEqual(m.last_request.headers["Accept-Encoding"], "gzip")
+
+        # Timeouts are raised as Dark Sky exceptions
+        m.get("https://api.darksky.net" + endpoint, exc=requests.exceptions.ReadTimeout)
+        with self.assertRaises(DarkSkyException):
+            api.request(endpoint)
+
+    def test_darksky_retry_after_capped(self, m):
+        """
+        Test that long Retry-After waits are capped.
+        """
+        api = DarkSky(TEST_API_KEY)
+        retry = api.session.get_adapter("https://api.darksky.net/forecast").max_retries
+
+        for value, expected in (("3600", MAX_RETRY_AFTER), ("2", 2)):
+            response = HTTPResponse(status=503, headers={"Retry-After": value})
+            self.assertEqual(retry.get_retry_after(response), expected)
+
+            with mock.patch("time.sleep") as sleep:
+                self.assertTrue(retry.sleep_for_retry(response))
+                sleep.assert_called_once_with(expected)
+
+        self.assertIsNone(retry.get_retry_after(HTTPResponse(status=503)))
+
+    def test_darksky_retries_counted(self, m):
+        """
+        Test that retries that reach the API are counted against the quota.
+        """
+        api = DarkSky(TEST_API_KEY, limit=3, retries=5)
+        retry = api.session.get_adapter("https://api.darksky.net/forecast").max_retries
+        self.assertIs(retry.quota, api.quota)
+
+        # Retries of responses and read errors are requests to the API
+        retry = retry.increment("GET", "/", response=HTTPResponse(status=503))
+        self.assertIs(retry.quota, api.quota)
+        retry = retry.increment("GET", "/", error=ReadTimeoutError(None, "/", "timed out"))
+        self.assertEqual(api.quota.used, 2)
+
+        # Connection errors never reach the API
+        retry = retry.increment("GET", "/", error=ConnectTimeoutError("timed out"))
+        self.assertEqual(api.quota.used, 2)
+
+        # Retries are refused once the quota is exceeded
+        retry = retry.increment("GET", "/", response=HTTPResponse(status=429))
+        with self.assertRaises(QuotaExceeded):
+            retry.increment("GET", "/", response=HTTPResponse(status=429))
+        self.assertEqual(api.quota.used, 3)
+
+        # Without a quota retries are not counted
+        retry = CappedRetry(total=1)
+        self.assertIsNone(retry.increment("GET", "/", response=HTTPResponse(status=503)).quota)
+
+    def test_darksky_request_projection(self, m):
+        """
+        Test that responses are projected to the fields, streaming or not.
+        """
+        endpoint = "/forecast/0123456789abcdef9876543210fedcba/42.3601,-71.0589"
+        url = "https://api.darksky.net" + endpoint
+        headers = {API_CALLS_HEADER: "42"}
+        m.get(url, json=load_weather_json, headers=headers, status_code=200)
+
+        expected = project(load_fixture(WEATHER), FORECAST_FIELDS)
+        for stream in (False, True):
+            api = DarkSky(TEST_API_KEY, fields=FORECAST_FIELDS, stream=stream)
+            self.assertEqual(api.request(endpoint), expected)
+            self.assertEqual(api.n_api_calls, 42)
+
+        # Malformed responses raise a Dark Sky exception
+        m.get(url, text='{"currently": {"time": 14', headers=headers, status_code=200)
+        for stream in (False, True):
+            api = DarkSky(TEST_API_KEY, fields=FORECAST_FIELDS, stream=stream)
+            with self.assertRaises(DarkSkyException):
+                api.request(endpoint)
+
     def test_darksky_limit_observed(self, m):
         """
         Assert that the Dark Sky API raises a limit reached error.
@@ -104,10 +214,35 @@ class DarkSkyTests(unittest.TestCase):
         self.assertEqual(api.n_api_calls, 42)
         self.assertIsNotNone(data)
 
-        # The second request should cause an exception
-        with self.assertRaises(DarkSkyException):
+        # The second request should be refused before it is sent
+        with self.assertRaises(QuotaExceeded):
             data = api.request(endpoint)
-            self.assertEqual(api.n_api_calls, 42)
+        self.assertEqual(api.n_api_calls, 42)
+        self.assertEqual(m.call_count, 1)
+
+    def test_darksky_limit_exact(self, m):
+        """
+        Assert that exactly the limit of requests can be made.
+        """
+        api = DarkSky(TEST_API_KEY, limit=3)
+
+        endpoint = "/forecast/0123456789abcdef9876543210fedcba/42.3601,-71.0589"
+        url = "https://api.darksky.net" + endpoint
+        m.get(url, json=load_weather_json, status_code=200)
+
+        for _ in range(3):
+            api.request(endpoint)
+
+        with self.assertRaises(QuotaExceeded):
+            api.request(endpoint)
+        self.assertEqual(m.call_count, 3)
+        self.assertEqual(api.quota.used, 3)
+
+        # Without a limit requests are never refused
+        api = DarkSky(TEST_API_KEY, limit=None)
+        self.assertIsNone(api.quota)
+        for _ in range(5):
+            api.request(endpoint)
 
     def test_forecast_method_with_cacheing(self, m):
         """
@@ -138,7 +273,7 @@ class DarkSkyTests(unittest.TestCase):
             self.assertEqual(1, len(api.request.mock_calls))
 
         # Clear the cache and ensure response is called
-        api.cache.pop((TEST_LATITUDE,TEST_LONGITUDE))
+        api.cache.pop(api.cache_key(TEST_LATITUDE, TEST_LONGITUDE))
         data = api.forecast(TEST_LATITUDE, TEST_LONGITUDE)
         self.assertEqual(2, len(api.request.mock_calls))
 
@@ -154,3 +289,281 @@ class DarkSkyTests(unittest.TestCase):
             data = api.forecast(TEST_LATITUDE, TEST_LONGITUDE)
             self.assertEqual(idx+1, len(api.request.mock_calls))
             self.assertEqual(len(api.cache), 0)
+
+    def test_forecast_method_with_grid_cacheing(self, m):
+        """
+        Test that nearby coordinates share a forecast on the cache grid
+        """
+        # Create the API and mock the request method
+        api = DarkSky(TEST_API_KEY, limit=10, cache=3000, grid=0.1)
+        api.request = mock.MagicMock(return_value=load_fixture(WEATHER))
+
+        # Coordinates in the same 0.1 degree cell as the test location
+        api.forecast(TEST_LATITUDE, TEST_LONGITUDE)
+        api.forecast(42.3712, -71.0801)
+        api.forecast(42.4123, -71.1302)
+
+        # Only the first request is made, for the center of the cell
+        endpoint = "/forecast/0123456789abcdef9876543210fedcba/42.4,-71.1"
+        api.request.assert_called_once_with(endpoint, lang="en", units="auto")
+        self.assertEqual(len(api.cache), 1)
+
+        # Coordinates in another cell make another request
+        api.forecast(42.2858, -71.0706)
+        self.assertEqual(len(api.request.mock_calls), 2)
+
+        # Hits and misses are totaled
+        self.assertEqual(api.cache_misses, 2)
+        self.assertEqual(api.cache_hits, 2)
+        self.assertEqual(api.cache_key(42.33, -71.02)[:2], (42.3, -71.0))
+
+    def test_forecast_cache_query_arguments(self, m):
+        """
+        Test that query arguments are part of the forecast cache key
+        """
+        # Create the API and mock the request method
+        api = DarkSky(TEST_API_KEY, limit=10, cache=3000)
+        api.request = mock.MagicMock(side_effect=mock_forecast_request)
+
+        # Different units and languages are cached separately
+        api.forecast(TEST_LATITUDE, TEST_LONGITUDE, units="si")
+        api.forecast(TEST_LATITUDE, TEST_LONGITUDE, units="us")
+        api.forecast(TEST_LATITUDE, TEST_LONGITUDE, units="SI")
+        api.forecast(TEST_LATITUDE, TEST_LONGITUDE, units="si", lang="de")
+        self.assertEqual(len(api.request.mock_calls), 3)
+
+        # Excluded blocks are normalized into the key
+        self.assertEqual(
+            api.cache_key(1.0, 2.0, exclude=["hourly", "Minutely", "hourly"]),
+            api.cache_key(1.0, 2.0, exclude=["minutely", "hourly"]),
+        )
+
+        with self.assertRaises(HanishValueError):
+            api.cache_key(1.0, 2.0, exclude=["weekly"])
+
+    def test_forecast_cache_derives_excluded_responses(self, m):
+        """
+        Test that excluded responses are derived from a cached superset
+        """
+        # Create the API and mock the request method
+        api = DarkSky(TEST_API_KEY, limit=10, cache=3000)
+        api.request = mock.MagicMock(side_effect=mock_forecast_request)
+
+        # A slimmed response cannot serve a request for everything
+        data = api.forecast(TEST_LATITUDE, TEST_LONGITUDE, exclude=["minutely"])
+        self.assertNotIn("minutely", data)
+        data = api.forecast(TEST_LATITUDE, TEST_LONGITUDE)
+        self.assertIn("minutely", data)
+        self.assertEqual(len(api.request.mock_calls), 2)
+
+        # Further exclusions are derived from cached responses
+        data = api.forecast(TEST_LATITUDE, TEST_LONGITUDE, exclude=["minutely", "hourly"])
+        self.assertEqual(len(api.request.mock_calls), 2)
+        self.assertNotIn("minutely", data)
+        self.assertNotIn("hourly", data)
+        self.assertIn("daily", data)
+
+        # The cached response is not modified by the derivation
+        self.assertIn("hourly", api.forecast(TEST_LATITUDE, TEST_LONGITUDE))
+
+        # Extended responses are not derived from unextended ones
+        api.forecast(TEST_LATITUDE, TEST_LONGITUDE, extend=True)
+        self.assertEqual(len(api.request.mock_calls), 3)
+
+    def test_forecast_cache_parsed_responses(self, m):
+        """
+        Test that responses are converted before they are cached
+        """
+        api = DarkSky(TEST_API_KEY, parse=Forecast.from_json)
+        api.request = mock.MagicMock(side_effect=mock_forecast_request)
+
+        data = api.forecast(TEST_LATITUDE, TEST_LONGITUDE)
+        self.assertIsInstance(data, Forecast)
+        self.assertIs(api.forecast(TEST_LATITUDE, TEST_LONGITUDE), data)
+        self.assertEqual(len(api.request.mock_calls), 1)
+
+        # Exclusions cannot be derived from converted responses
+        data = api.forecast(TEST_LATITUDE, TEST_LONGITUDE, exclude=["minutely"])
+        self.assertIsInstance(data, Forecast)
+        self.assertEqual(len(api.request.mock_calls), 2)
+
+    def test_forecast_persistent_cache_backend(self, m):
+        """
+        Test that a persistent cache backend survives restarts
+        """
+        tmpdir = tempfile.mkdtemp()
+        path = os.path.join(tmpdir, "forecasts.db")
+
+        try:
+            # The first process fetches the forecast
+            api = DarkSky(TEST_API_KEY, backend=SqliteCache(path))
+            api.request = mock.MagicMock(side_effect=mock_forecast_request)
+            data = api.forecast(TEST_LATITUDE, TEST_LONGITUDE)
+            self.assertEqual(len(api.request.mock_calls), 1)
+            api.cache.close()
+
+            # The second process is served from the cache
+            api = DarkSky(TEST_API_KEY, backend=SqliteCache(path))
+            api.request = mock.MagicMock(side_effect=mock_forecast_request)
+            self.assertEqual(api.forecast(TEST_LATITUDE, TEST_LONGITUDE), data)
+            self.assertEqual(len(api.request.mock_calls), 0)
+            api.cache.close()
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_forecast_persistent_cache_parsed_once(self, m):
+        """
+        Test that persisted responses are parsed once and held in memory
+        """
+        tmpdir = tempfile.mkdtemp()
+        path = os.path.join(tmpdir, "forecasts.db")
+
+        try:
+            # The first process persists the JSON and caches the forecast
+            parse = mock.MagicMock(side_effect=Forecast.from_json)
+            api = DarkSky(TEST_API_KEY, backend=SqliteCache(path), parse=parse)
+            api.request = mock.MagicMock(side_effect=mock_forecast_request)
+            data = api.forecast(TEST_LATITUDE, TEST_LONGITUDE)
+            self.assertIs(api.forecast(TEST_LATITUDE, TEST_LONGITUDE), data)
+            self.assertEqual(parse.call_count, 1)
+            key = api.cache_key(TEST_LATITUDE, TEST_LONGITUDE)
+            self.assertIsInstance(api.backend.peek(key)[0], dict)
+            api.backend.close()
+
+            # The second process parses the persisted response once
+            parse = mock.MagicMock(side_effect=Forecast.from_json)
+            api = DarkSky(TEST_API_KEY, backend=SqliteCache(path), parse=parse)
+            api.request = mock.MagicMock(side_effect=mock_forecast_request)
+            data = api.forecast(TEST_LATITUDE, TEST_LONGITUDE)
+            self.assertIsInstance(data, Forecast)
+            self.assertIs(api.forecast(TEST_LATITUDE, TEST_LONGITUDE), data)
+            self.assertEqual(parse.call_count, 1)
+            self.assertEqual(len(api.request.mock_calls), 0)
+
+            # The forecast is held in memory at its age in the backend
+            self.assertAlmostEqual(api.peek(key)[1], api.backend.peek(key)[1], delta=1)
+            api.backend.close()
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_forecast_stale_while_revalidate(self, m):
+        """
+        Test that stale forecasts are served while refreshed in the background
+        """
+        clock = [1000.0]
+        cache = TTLCache(ttl=900, timer=lambda: clock[0])
+
+        api = DarkSky(TEST_API_KEY, cache=300, stale=600, backend=cache)
+        api.request = mock.MagicMock(side_effect=mock_forecast_request)
+        api.forecast(TEST_LATITUDE, TEST_LONGITUDE)
+        self.assertEqual(len(api.request.mock_calls), 1)
+
+        # A stale forecast is returned and refreshed in the background
+        clock[0] += 400
+        key = api.cache_key(TEST_LATITUDE, TEST_LONGITUDE)
+        refreshed = threading.Event()
+        api.request.side_effect = lambda *a, **k: refreshed.wait(5) and mock_forecast_request(*a, **k)
+
+        self.assertIsNotNone(api.forecast(TEST_LATITUDE, TEST_LONGITUDE))
+        self.assertIsNotNone(api.forecast(TEST_LATITUDE, TEST_LONGITUDE))
+        self.assertIn(key, api.refreshing)
+
+        # Only one refresh per key is made
+        thread = api.refreshing[key]
+        refreshed.set()
+        thread.join(5)
+        self.assertEqual(len(api.request.mock_calls), 2)
+        self.assertNotIn(key, api.refreshing)
+        self.assertEqual(cache.get_with_age(key)[1], 0.0)
+
+        # Forecasts past the max staleness are fetched synchronously
+        clock[0] += 900
+        api.forecast(TEST_LATITUDE, TEST_LONGITUDE)
+        self.assertEqual(len(api.request.mock_calls), 3)
+        self.assertEqual(api.refreshing, {})
+
+    def test_forecast_request_coalescing(self, m):
+        """
+        Test that concurrent cache misses share a single request
+        """
+        api = DarkSky(TEST_API_KEY, cache=300)
+        release = threading.Event()
+        api.request = mock.MagicMock(
+            side_effect=lambda *a, **k: release.wait(5) and mock_forecast_request(*a, **k)
+        )
+
+        results = []
+        def lookup():
+            results.append(api.forecast(TEST_LATITUDE, TEST_LONGITUDE))
+
+        threads = [threading.Thread(target=lookup) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+
+        # Wait for the lookups to be collapsed into the first request
+        for _ in range(5000):
+            if api.flights.collapsed == 3: break
+            threading.Event().wait(0.001)
+
+        release.set()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(len(results), 4)
+        self.assertEqual(len(api.request.mock_calls), 1)
+        self.assertEqual(api.flights.collapsed, 3)
+
+    def test_forecast_many(self, m):
+        """
+        Test concurrent forecasts with a shared cache and failures
+        """
+        api = DarkSky(TEST_API_KEY, pool_size=4)
+        lock = threading.Lock()
+        inflight = [0, 0]
+
+        # Slow requests that track the maximum number in flight
+        def request(endpoint, **query):
+            with lock:
+                inflight[0] += 1
+                inflight[1] = max(inflight)
+            threading.Event().wait(0.05)
+            with lock:
+                inflight[0] -= 1
+            if endpoint.endswith("0.0,0.0"):
+                raise DarkSkyException("no forecast")
+            return mock_forecast_request(endpoint, **query)
+
+        api.request = mock.MagicMock(side_effect=request)
+
+        coords = [(float(idx), float(idx)) for idx in range(8)] + [(1.0, 1.0)]
+        forecasts, errors = api.forecast_many(coords)
+
+        # Requests were made concurrently but bounded by the pool size
+        self.assertEqual(inflight[1], 4)
+        self.assertEqual(len(api.request.mock_calls), 8)
+
+        # Failures are reported separately
+        self.assertEqual(list(errors), [(0.0, 0.0)])
+        self.assertIsInstance(errors[(0.0, 0.0)], DarkSkyException)
+        self.assertEqual(list(forecasts), coords[1:8])
+
+        # The cache is shared with single lookups
+        api.forecast(1.0, 1.0)
+        self.assertEqual(len(api.request.mock_calls), 8)
+        self.assertEqual(api.forecast_many([]), ({}, {}))
+
+    def test_forecast_many_quota(self, m):
+        """
+        Test that concurrent forecasts are counted against the quota
+        """
+        api = DarkSky(TEST_API_KEY, limit=3)
+        m.get(requests_mock.ANY, json=load_fixture(WEATHER))
+
+        forecasts, errors = api.forecast_many(
+            (float(idx), float(idx)) for idx in range(5)
+        )
+
+        self.assertEqual(len(forecasts), 3)
+        self.assertEqual(len(errors), 2)
+        for error in errors.values():
+            self.assertIsInstance(error, QuotaExceeded)
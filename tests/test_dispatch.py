@@ -0,0 +1,117 @@
+# tests.test_dispatch
+# Tests for the worker thread message dispatcher.
+#
+# Author:   Benjamin Bengfort <benjamin@bengfort.com>
+# Created:  Sat Oct 17 14:52:37 2026 -0400
+#
+# Copyright (C) 2016 Bengfort.com
+# For license information, see LICENSE.txt
+#
+# ID: test_dispatch.py [] benjamin@bengfort.com $
+
+"""
+Tests for the worker thread message dispatcher.
+"""
+
+##########################################################################
+## Imports
+##########################################################################
+
+import time
+import unittest
+import threading
+
+from hanish.dispatch import Dispatcher, Full
+
+
+##########################################################################
+## Dispatcher Tests
+##########################################################################
+
+class DispatcherTests(unittest.TestCase):
+
+    def test_ordering_and_drain(self):
+        """
+        Test items are handled in order per key and drained on stop
+        """
+        handled = []
+        lock = threading.Lock()
+
+        def handler(item):
+            time.sleep(0.001)
+            with lock:
+                handled.append(item)
+
+        dispatcher = Dispatcher(handler, workers=4)
+        dispatcher.start()
+
+        items = [(channel, idx) for idx in range(20) for channel in "ABCDEF"]
+        for item in items:
+            dispatcher.submit(item[0], item)
+        dispatcher.stop()
+
+        # Every item was handled, in order for each key
+        self.assertEqual(len(handled), len(items))
+        for channel in "ABCDEF":
+            self.assertEqual(
+                [idx for key, idx in handled if key == channel], list(range(20))
+            )
+
+    def test_concurrency_and_errors(self):
+        """
+        Test a slow or failing key does not block other keys
+        """
+        release = threading.Event()
+        handled = []
+
+        def handler(item):
+            if item == "slow":
+                release.wait(5)
+            if item == "error":
+                raise ValueError("could not handle item")
+            handled.append(item)
+
+        dispatcher = Dispatcher(handler, workers=2)
+        slow = "A"
+        fast = next(key for key in "BCDEFG" if dispatcher.shard(key) != dispatcher.shard(slow))
+
+        dispatcher.start()
+        dispatcher.submit(slow, "slow")
+        dispatcher.submit(fast, "error")
+        dispatcher.submit(fast, "fast")
+
+        # The fast key is handled while the slow key is still blocked
+        deadline = time.time() + 5
+        while "fast" not in handled and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(handled, ["fast"])
+
+        release.set()
+        dispatcher.stop()
+        self.assertEqual(handled, ["fast", "slow"])
+
+    def test_backpressure(self):
+        """
+        Test submit pushes back when a worker's queue is full
+        """
+        release = threading.Event()
+        dispatcher = Dispatcher(lambda item: release.wait(5), workers=1, maxsize=2)
+        dispatcher.start()
+
+        # One item is being handled and two are waiting
+        for idx in range(3):
+            dispatcher.submit("A", idx)
+
+        deadline = time.time() + 5
+        while len(dispatcher) > 2 and time.time() < deadline:
+            time.sleep(0.01)
+
+        with self.assertRaises(Full):
+            dispatcher.submit("A", 3, block=False)
+
+        with self.assertRaises(Full):
+            dispatcher.submit("A", 3, timeout=0.01)
+
+        release.set()
+        dispatcher.stop()
+        self.assertEqual(len(dispatcher), 0)
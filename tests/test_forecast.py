@@ -0,0 +1,115 @@
+# tests.test_forecast
+# Tests for the compact forecast representation.
+#
+# Author:   Benjamin Bengfort <benjamin@bengfort.com>
+# Created:  Sat Oct 17 17:31:58 2026 -0400
+#
+# Copyright (C) 2016 Bengfort.com
+# For license information, see LICENSE.txt
+#
+# ID: test_forecast.py [] benjamin@bengfort.com $
+
+"""
+Tests for the compact forecast representation.
+"""
+
+##########################################################################
+## Imports
+##########################################################################
+
+import json
+import math
+import unittest
+
+from hanish.forecast import *
+from .test_darksky import WEATHER
+
+
+##########################################################################
+## Forecast Tests
+##########################################################################
+
+class ForecastTests(unittest.TestCase):
+
+    def setUp(self):
+        with open(WEATHER, 'r') as f:
+            self.data = json.load(f)
+
+    def test_from_json(self):
+        """
+        Test the fields are extracted from the Dark Sky response
+        """
+        forecast = Forecast.from_json(self.data, zipcode="20001")
+        self.assertEqual(forecast.latitude, 42.3601)
+        self.assertEqual(forecast.time, self.data["currently"]["time"])
+        self.assertEqual(forecast.temperature, 54.42)
+        self.assertEqual(forecast.summary, "Mostly Cloudy")
+        self.assertEqual(forecast.hourly_summary, self.data["hourly"]["summary"])
+        self.assertEqual(forecast.daily_summary, self.data["daily"]["summary"])
+        self.assertEqual(forecast.zipcode, "20001")
+        self.assertIsNone(forecast.api_calls)
+        self.assertIsNone(forecast.hourly)
+        self.assertIsNone(forecast.daily)
+        self.assertTrue(forecast.conditions.startswith(u" it is 54.4"))
+
+        # Missing data blocks are missing fields
+        forecast = Forecast.from_json({"latitude": 42.3601, "longitude": -71.0589})
+        self.assertIsNone(forecast.time)
+        self.assertIsNone(forecast.daily_summary)
+        self.assertIsNone(forecast.conditions)
+
+    def test_series(self):
+        """
+        Test the hourly and daily data points are stored as columns
+        """
+        forecast = Forecast.from_json(self.data, series=True)
+        hourly = self.data["hourly"]["data"]
+
+        self.assertEqual(len(forecast.hourly), len(hourly))
+        self.assertEqual(forecast.hourly.fields, HOURLY_FIELDS)
+        self.assertEqual(list(forecast.hourly["temperature"]), [
+            point["temperature"] for point in hourly
+        ])
+        self.assertEqual(next(iter(forecast.daily)), tuple(
+            float(self.data["daily"]["data"][0][field]) for field in DAILY_FIELDS
+        ))
+
+        with self.assertRaises(KeyError):
+            forecast.hourly["unknown"]
+
+        # Missing values are NaN
+        series = Series.from_json({"data": [{"time": 1}]}, ("time", "temperature"))
+        self.assertTrue(math.isnan(series["temperature"][0]))
+
+        # Null values are NaN
+        series = Series.from_json({"data": [
+            {"time": 1, "temperature": None}, {"time": 2, "temperature": 54.4},
+        ]}, ("time", "temperature"))
+        self.assertTrue(math.isnan(series["temperature"][0]))
+        self.assertEqual(series["temperature"][1], 54.4)
+
+    def test_immutable(self):
+        """
+        Test forecasts cannot be modified but can be copied with replace
+        """
+        forecast = Forecast.from_json(self.data)
+
+        with self.assertRaises(AttributeError):
+            forecast.zipcode = "20001"
+
+        with self.assertRaises(AttributeError):
+            del forecast.summary
+
+        with self.assertRaises(AttributeError):
+            forecast.extra = True
+
+        other = forecast.replace(zipcode="20001", api_calls=42)
+        self.assertIsNone(forecast.zipcode)
+        self.assertEqual(other.zipcode, "20001")
+        self.assertEqual(other.api_calls, 42)
+        self.assertEqual(other.summary, forecast.summary)
+        self.assertNotEqual(other, forecast)
+        self.assertEqual(other.replace(zipcode=None, api_calls=None), forecast)
+
+        with self.assertRaises(TypeError):
+            forecast.replace(unknown=True)
@@ -0,0 +1,96 @@
+# tests.test_geo
+# Tests for the geographic distance helpers and spatial index.
+#
+# Author:   Benjamin Bengfort <benjamin@bengfort.com>
+# Created:  Sat Oct 17 10:31:02 2026 -0400
+#
+# Copyright (C) 2016 Bengfort.com
+# For license information, see LICENSE.txt
+#
+# ID: test_geo.py [] benjamin@bengfort.com $
+
+"""
+Tests for the geographic distance helpers and spatial index.
+"""
+
+##########################################################################
+## Imports
+##########################################################################
+
+import random
+import unittest
+
+from hanish.geo import *
+
+
+##########################################################################
+## Geo Tests
+##########################################################################
+
+class GeoTests(unittest.TestCase):
+
+    def test_haversine(self):
+        """
+        Test the great circle distance between known points
+        """
+        # Washington, DC to Boston, MA is about 393 miles
+        dist = haversine(38.910353, -77.017739, 42.3601, -71.0589)
+        self.assertAlmostEqual(dist, 393, delta=2)
+
+        self.assertEqual(haversine(42.3601, -71.0589, 42.3601, -71.0589), 0.0)
+
+    def test_grid_index_matches_brute_force(self):
+        """
+        Test nearest and within queries against a brute force scan
+        """
+        rng = random.Random(42)
+        lats = [rng.uniform(25, 49) for _ in range(2000)]
+        lons = [rng.uniform(-124, -67) for _ in range(2000)]
+        index = GridIndex(lats, lons, cell=0.5)
+
+        for _ in range(25):
+            lat, lon = rng.uniform(20, 55), rng.uniform(-130, -60)
+            brute = sorted(
+                (haversine(lat, lon, lats[idx], lons[idx]), idx)
+                for idx in range(len(lats))
+            )
+
+            nearest = index.nearest(lat, lon, 5)
+            self.assertEqual([idx for idx, _ in nearest], [idx for _, idx in brute[:5]])
+
+            within = index.within(lat, lon, 100)
+            self.assertEqual(
+                [idx for idx, _ in within], [idx for dist, idx in brute if dist <= 100]
+            )
+
+    def test_grid_index_far_and_wrapped_queries(self):
+        """
+        Test queries far from the data and across the antimeridian
+        """
+        rng = random.Random(7)
+        lats = [rng.uniform(50, 56) for _ in range(500)]
+        lons = [rng.uniform(170, 180) if idx % 2 else rng.uniform(-180, -165) for idx in range(500)]
+        index = GridIndex(lats, lons, cell=0.25)
+
+        queries = [(52.0, 179.9), (52.0, -179.9), (53.0, 180.0), (-40.0, 0.0), (90.0, 0.0)]
+        for lat, lon in queries:
+            brute = sorted(
+                (haversine(lat, lon, lats[idx], lons[idx]), idx)
+                for idx in range(len(lats))
+            )
+
+            nearest = index.nearest(lat, lon, 5)
+            self.assertEqual([idx for idx, _ in nearest], [idx for _, idx in brute[:5]])
+
+            within = index.within(lat, lon, 150)
+            self.assertEqual(
+                [idx for idx, _ in within], [idx for dist, idx in brute if dist <= 150]
+            )
+
+    def test_empty_grid_index(self):
+        """
+        Test queries against an empty grid index
+        """
+        index = GridIndex([], [])
+        self.assertEqual(index.nearest(38.9, -77.0, 3), [])
+        self.assertEqual(index.within(38.9, -77.0, 100), [])
@@ -0,0 +1,142 @@
+# tests.test_outbox
+# Tests for the outbound Slack message queue.
+#
+# Author:   Benjamin Bengfort <benjamin@bengfort.com>
+# Created:  Sat Oct 17 16:24:19 2026 -0400
+#
+# Copyright (C) 2016 Bengfort.com
+# For license information, see LICENSE.txt
+#
+# ID: test_outbox.py [] benjamin@bengfort.com $
+
+"""
+Tests for the outbound Slack message queue.
+"""
+
+##########################################################################
+## Imports
+##########################################################################
+
+import time
+import unittest
+import requests_mock
+
+from slackclient import SlackClient
+from hanish.outbox import Outbox, retry_after
+
+try:
+    # Python 3
+    from unittest import mock
+except ImportError:
+    # Python 2
+    import mock
+
+
+OK = {"ok": True}
+RATELIMITED = {
+    "ok": False, "error": "ratelimited", "headers": {"retry-after": "0.2"},
+}
+
+
+##########################################################################
+## Outbox Tests
+##########################################################################
+
+class OutboxTests(unittest.TestCase):
+
+    def test_retry_after(self):
+        """
+        Test rate limited responses are detected
+        """
+        self.assertIsNone(retry_after(OK))
+        self.assertIsNone(retry_after({"ok": False, "error": "channel_not_found"}))
+        self.assertEqual(retry_after(RATELIMITED), 0.2)
+        self.assertEqual(retry_after({
+            "ok": False, "error": "ratelimited", "headers": {"Retry-After": "30"},
+        }), 30)
+        self.assertEqual(retry_after({"ok": False, "error": "ratelimited"}), 1)
+
+    def test_retry_after_slack_response(self):
+        """
+        Test the Retry-After header is read from the Slack client response
+        """
+        slack = SlackClient("xoxb-test")
+        with requests_mock.Mocker() as m:
+            m.post(
+                "https://slack.com/api/chat.postMessage", status_code=429,
+                headers={"Retry-After": "30"},
+                json={"ok": False, "error": "ratelimited"},
+            )
+            response = slack.api_call(
+                "chat.postMessage", channel="CTESTCHAN", text="hello", as_user=True
+            )
+
+        self.assertEqual(retry_after(response), 30)
+
+    def test_coalesce(self):
+        """
+        Test messages to the same channel and thread are coalesced
+        """
+        send = mock.MagicMock(return_value=OK)
+        outbox = Outbox(send, linger=0.1)
+        outbox.start()
+
+        outbox.post("CTESTCHAN", "one")
+        outbox.post("COTHER", "hello")
+        outbox.post("CTESTCHAN", "two")
+        outbox.post("CTESTCHAN", "reply", thread="1494357965.614957")
+        outbox.post("CTESTCHAN", "three")
+        outbox.close(timeout=5)
+
+        self.assertEqual(send.mock_calls, [
+            mock.call("CTESTCHAN", "one\ntwo\nthree", None),
+            mock.call("COTHER", "hello", None),
+            mock.call("CTESTCHAN", "reply", "1494357965.614957"),
+        ])
+        self.assertEqual(outbox.posted, 5)
+        self.assertEqual(outbox.sent, 3)
+        self.assertEqual(len(outbox), 0)
+
+    def test_ratelimited(self):
+        """
+        Test sending waits for Retry-After and resends coalesced messages
+        """
+        outbox = None
+        sent = []
+
+        def send(channel, text, thread):
+            sent.append((time.time(), text))
+            if len(sent) == 1:
+                # Queue another message while rate limited
+                outbox.post(channel, "two")
+                return RATELIMITED
+            return OK
+
+        outbox = Outbox(send, linger=0)
+        outbox.start()
+        outbox.post("CTESTCHAN", "one")
+
+        deadline = time.time() + 5
+        while len(sent) < 2 and time.time() < deadline:
+            time.sleep(0.01)
+        outbox.close(timeout=5)
+
+        self.assertEqual([text for _, text in sent], ["one", "one\ntwo"])
+        self.assertGreaterEqual(sent[1][0] - sent[0][0], 0.2)
+        self.assertEqual(outbox.ratelimited, 1)
+        self.assertEqual(outbox.sent, 1)
+
+    def test_send_errors(self):
+        """
+        Test an exception sending one message does not stop the outbox
+        """
+        send = mock.MagicMock(side_effect=[Exception("timeout"), OK])
+        outbox = Outbox(send, linger=0)
+        outbox.start()
+        outbox.post("CTESTCHAN", "one")
+        outbox.post("COTHER", "two")
+        outbox.close(timeout=5)
+
+        self.assertEqual(send.call_count, 2)
+        self.assertEqual(outbox.failed, 1)
+        self.assertEqual(outbox.sent, 1)
@@ -0,0 +1,160 @@
+# tests.test_prefetch
+# Tests for prefetching the forecasts of popular locations.
+#
+# Author:   Benjamin Bengfort <benjamin@bengfort.com>
+# Created:  Sat Oct 17 20:31:12 2026 -0400
+#
+# Copyright (C) 2016 Bengfort.com
+# For license information, see LICENSE.txt
+#
+# ID: test_prefetch.py [] benjamin@bengfort.com $
+
+"""
+Tests for prefetching the forecasts of popular locations.
+"""
+
+##########################################################################
+## Imports
+##########################################################################
+
+import time
+import unittest
+
+from hanish.cache import TTLCache
+from hanish.darksky import DarkSky
+from hanish.prefetch import Prefetcher
+from .test_cache import Clock
+from .test_quota import MIDNIGHT
+from .test_darksky import TEST_API_KEY, mock_forecast_request
+
+try:
+    # Python 3
+    from unittest import mock
+except ImportError:
+    # Python 2
+    import mock
+
+
+LOCATIONS = {
+    "20001": (38.9101, -77.0147),
+    "20742": (38.9896, -76.9457),
+    "90210": (34.0901, -118.4065),
+    "58054": (46.4273, -97.6843),
+}
+
+
+##########################################################################
+## Prefetcher Tests
+##########################################################################
+
+class PrefetcherTests(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock(MIDNIGHT + 43200)
+        self.api = DarkSky(
+            TEST_API_KEY, limit=40, cache=300,
+            backend=TTLCache(ttl=300, timer=self.clock),
+        )
+        self.api.request = mock.MagicMock(side_effect=mock_forecast_request)
+
+    def record(self, prefetcher, *zipcodes):
+        for zipcode in zipcodes:
+            prefetcher.record(zipcode, LOCATIONS[zipcode])
+
+    def test_hottest(self):
+        """
+        Test the most requested zipcodes are tracked and decay
+        """
+        prefetcher = Prefetcher(self.api, top=2, halflife=3600, timer=self.clock)
+        self.record(prefetcher, "20001", "90210", "20001", "58054", "20001", "90210")
+        self.assertEqual(prefetcher.hottest(), [("20001", 3), ("90210", 2)])
+
+        self.clock.now += 3600
+        prefetcher.decay(self.clock())
+        self.assertEqual(prefetcher.hottest(), [("20001", 1), ("90210", 1)])
+        self.assertNotIn("58054", prefetcher.coords)
+
+    def test_tick(self):
+        """
+        Test the hottest forecasts are refreshed before they expire
+        """
+        prefetcher = Prefetcher(self.api, top=2, lead=60, timer=self.clock)
+        self.api.revalidate = mock.MagicMock()
+        self.record(prefetcher, "20001", "20001", "20742", "20742", "90210")
+
+        # Missing forecasts of the hottest zipcodes are fetched
+        self.assertEqual(prefetcher.tick(), ["20001", "20742"])
+        self.api.revalidate.assert_has_calls([
+            mock.call(self.api.cache_key(*LOCATIONS["20001"])),
+            mock.call(self.api.cache_key(*LOCATIONS["20742"])),
+        ])
+
+        # Fresh forecasts are not refreshed until they are about to expire
+        for zipcode in ("20001", "20742"):
+            self.api.forecast(*LOCATIONS[zipcode])
+
+        # Checking the cache does not count in its statistics
+        stats = self.api.cache.stats()
+        self.clock.now += 200
+        self.assertEqual(prefetcher.tick(), [])
+        self.assertEqual(self.api.cache.stats(), stats)
+
+        self.clock.now += 50
+        self.assertEqual(prefetcher.tick(), ["20001", "20742"])
+        self.assertEqual(prefetcher.spent, 4)
+
+    def test_budget(self):
+        """
+        Test prefetching spends its share of the daily limit over the day
+        """
+        prefetcher = Prefetcher(self.api, top=4, share=0.1, timer=self.clock)
+        self.api.revalidate = mock.MagicMock()
+        self.record(prefetcher, *LOCATIONS)
+
+        # Half of the share is released by noon
+        self.assertEqual(len(prefetcher.tick()), 2)
+        self.assertEqual(prefetcher.tick(), [])
+        self.assertEqual(prefetcher.budget(self.clock()), 0)
+
+        # The rest of the share is released as the day goes on
+        self.clock.now = MIDNIGHT + 64800
+        self.record(prefetcher, *LOCATIONS)
+        self.assertEqual(len(prefetcher.tick()), 1)
+        self.assertEqual(prefetcher.spent, 3)
+
+        # The budget resets at midnight UTC
+        self.clock.now = MIDNIGHT + 86400
+        self.assertEqual(prefetcher.budget(self.clock()), 0)
+        self.clock.now += 21600
+        self.record(prefetcher, *LOCATIONS)
+        self.assertEqual(len(prefetcher.tick()), 1)
+
+    def test_recent(self):
+        """
+        Test only recently requested zipcodes are refreshed
+        """
+        prefetcher = Prefetcher(self.api, top=2, recent=3, timer=self.clock)
+        self.api.revalidate = mock.MagicMock()
+        self.record(prefetcher, "20001", "20001", "20001")
+
+        # Zipcodes not requested within three cache timeouts are skipped
+        self.clock.now += 901
+        self.record(prefetcher, "90210")
+        self.assertEqual(prefetcher.hottest(), [("20001", 3), ("90210", 1)])
+        self.assertEqual(prefetcher.tick(), ["90210"])
+
+    def test_background_refresh(self):
+        """
+        Test prefetched forecasts are served from the cache
+        """
+        prefetcher = Prefetcher(self.api, timer=self.clock)
+        self.record(prefetcher, "20001")
+        self.assertEqual(prefetcher.tick(), ["20001"])
+
+        deadline = time.time() + 5
+        while self.api.refreshing and time.time() < deadline:
+            time.sleep(0.01)
+
+        self.api.forecast(*LOCATIONS["20001"])
+        self.assertEqual(self.api.request.call_count, 1)
+        self.assertEqual(self.api.cache_misses, 0)
@@ -0,0 +1,145 @@
+# tests.test_quota
+# Tests for the daily Dark Sky API quota.
+#
+# Author:   Benjamin Bengfort <benjamin@bengfort.com>
+# Created:  Sat Oct 17 19:40:33 2026 -0400
+#
+# Copyright (C) 2016 Bengfort.com
+# For license information, see LICENSE.txt
+#
+# ID: test_quota.py [] benjamin@bengfort.com $
+
+"""
+Tests for the daily Dark Sky API quota.
+"""
+
+##########################################################################
+## Imports
+##########################################################################
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from hanish.quota import Quota, DAY
+from hanish.exceptions import QuotaExceeded, DatabaseError
+from .test_cache import Clock
+
+
+# Midnight UTC on May 9, 2017
+MIDNIGHT = 1494288000.0
+
+
+##########################################################################
+## Quota Tests
+##########################################################################
+
+class QuotaTests(unittest.TestCase):
+
+    def test_daily_limit(self):
+        """
+        Test exactly the limit is allowed each UTC day
+        """
+        clock = Clock(MIDNIGHT + 3600)
+        quota = Quota(3, timer=clock)
+
+        for _ in range(3):
+            quota.acquire()
+        self.assertEqual(quota.used, 3)
+        self.assertEqual(quota.remaining, 0)
+
+        with self.assertRaises(QuotaExceeded):
+            quota.acquire()
+        self.assertEqual(quota.used, 3)
+
+        # The quota resets at midnight UTC
+        clock.now = MIDNIGHT + DAY - 1
+        with self.assertRaises(QuotaExceeded):
+            quota.acquire()
+
+        clock.now = MIDNIGHT + DAY
+        self.assertEqual(quota.used, 0)
+        quota.acquire()
+        self.assertEqual(quota.used, 1)
+
+        quota.close()
+        with self.assertRaises(DatabaseError):
+            quota.acquire()
+
+    def test_report(self):
+        """
+        Test the count reported by the API replaces a lower count
+        """
+        quota = Quota(10, timer=Clock(MIDNIGHT))
+        quota.acquire()
+        quota.report(1)
+        self.assertEqual(quota.used, 1)
+
+        quota.report(8)
+        self.assertEqual(quota.used, 8)
+        quota.report(5)
+        self.assertEqual(quota.used, 8)
+
+        quota.acquire()
+        quota.acquire()
+        with self.assertRaises(QuotaExceeded):
+            quota.acquire()
+
+    def test_shared_database(self):
+        """
+        Test processes that share a database share the quota
+        """
+        tmpdir = tempfile.mkdtemp()
+        path = os.path.join(tmpdir, "quota.db")
+
+        try:
+            clock = Clock(MIDNIGHT)
+            first = Quota(4, path=path, timer=clock)
+            second = Quota(4, path=path, timer=clock)
+
+            first.acquire()
+            second.acquire()
+            second.report(3)
+            first.acquire()
+
+            self.assertEqual(first.used, 4)
+            with self.assertRaises(QuotaExceeded):
+                second.acquire()
+
+            first.close()
+            second.close()
+
+            # The count survives restarts
+            self.assertEqual(Quota(4, path=path, timer=clock).used, 4)
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_token_bucket(self):
+        """
+        Test requests are spread over the rest of the day
+        """
+        clock = Clock(MIDNIGHT)
+        quota = Quota(DAY // 10 + 2, burst=2, timer=clock)
+
+        # The bucket starts full
+        quota.acquire()
+        quota.acquire()
+        with self.assertRaises(QuotaExceeded):
+            quota.acquire()
+
+        # The remaining quota refills one token every ten seconds
+        clock.now += 5
+        with self.assertRaises(QuotaExceeded):
+            quota.acquire()
+
+        clock.now += 5
+        quota.acquire()
+        self.assertEqual(quota.used, 3)
+
+        # The bucket holds at most burst tokens
+        clock.now += 3600
+        quota.acquire()
+        quota.acquire()
+        with self.assertRaises(QuotaExceeded):
+            quota.acquire()
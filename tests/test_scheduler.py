@@ -0,0 +1,213 @@
+# tests.test_scheduler
+# Tests for running timed tasks from the bot's event loop.
+#
+# Author:   Benjamin Bengfort <benjamin@bengfort.com>
+# Created:  Sat Oct 17 22:04:37 2026 -0400
+#
+# Copyright (C) 2016 Bengfort.com
+# For license information, see LICENSE.txt
+#
+# ID: test_scheduler.py [] benjamin@bengfort.com $
+
+"""
+Tests for running timed tasks from the bot's event loop.
+"""
+
+##########################################################################
+## Imports
+##########################################################################
+
+import unittest
+
+from datetime import datetime, timedelta
+from hanish.exceptions import HanishValueError
+from hanish.scheduler import Scheduler, parse_time, next_daily, zone
+from .test_cache import Clock
+from .test_quota import MIDNIGHT
+
+try:
+    # Python 3
+    from unittest import mock
+except ImportError:
+    # Python 2
+    import mock
+
+
+# Midnight UTC on Sun Mar 12, 2017, the day DST started in the US
+DST = 1489276800.0
+
+
+##########################################################################
+## Helper Tests
+##########################################################################
+
+class SchedulerHelperTests(unittest.TestCase):
+
+    def test_parse_time(self):
+        """
+        Test parsing times of day
+        """
+        self.assertEqual(parse_time("9:00"), (9, 0))
+        self.assertEqual(parse_time(" 17:30 "), (17, 30))
+
+        for at in ("24:00", "9:60", "9", "nine", "9:5"):
+            with self.assertRaises(HanishValueError):
+                parse_time(at)
+
+    def test_zone(self):
+        """
+        Test looking up timezones by name
+        """
+        self.assertIsNone(zone(None))
+        eastern = zone("America/New_York")
+        self.assertEqual(eastern.utcoffset(datetime(2017, 1, 10)), timedelta(hours=-5))
+        self.assertEqual(eastern.utcoffset(datetime(2017, 5, 10)), timedelta(hours=-4))
+
+        for name in ("Mars/Olympus_Mons", ""):
+            with self.assertRaises(HanishValueError):
+                zone(name)
+
+    def test_next_daily(self):
+        """
+        Test the next time of day in a timezone, across DST
+        """
+        tz = zone("America/New_York")
+
+        # 9:00 EDT on May 9, 2017 is 13:00 UTC
+        self.assertEqual(next_daily(9, 0, MIDNIGHT, tz), MIDNIGHT + 13 * 3600)
+        self.assertEqual(next_daily(9, 0, MIDNIGHT + 13 * 3600, tz), MIDNIGHT + 37 * 3600)
+
+        # 9:00 EST on Mar 11 is 14:00 UTC, but 9:00 EDT on Mar 12 is 13:00 UTC
+        self.assertEqual(next_daily(9, 0, DST - 86400, tz), DST - 86400 + 14 * 3600)
+        self.assertEqual(next_daily(9, 0, DST - 86400 + 14 * 3600, tz), DST + 13 * 3600)
+
+
+##########################################################################
+## Scheduler Tests
+##########################################################################
+
+class SchedulerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock(MIDNIGHT)
+        self.scheduler = Scheduler(timer=self.clock)
+
+    def test_every(self):
+        """
+        Test jobs run every interval without drift
+        """
+        func = mock.MagicMock()
+        self.scheduler.every(10, func)
+        self.assertEqual(self.scheduler.idle_seconds(), 10)
+        self.assertEqual(self.scheduler.run_pending(), 0)
+
+        # Running late does not delay the next run
+        self.clock.now += 12
+        self.assertEqual(self.scheduler.run_pending(), 1)
+        self.assertEqual(self.scheduler.idle_seconds(), 8)
+
+        # Running very late only runs the job once
+        self.clock.now += 100
+        self.assertEqual(self.scheduler.run_pending(), 1)
+        self.assertEqual(self.scheduler.idle_seconds(), 10)
+        self.assertEqual(func.call_count, 2)
+
+        with self.assertRaises(HanishValueError):
+            self.scheduler.every(0, func)
+
+    def test_daily(self):
+        """
+        Test jobs run daily at the time of day in their timezone
+        """
+        eastern = mock.MagicMock()
+        pacific = mock.MagicMock()
+        self.scheduler.daily("9:00", eastern, tz="America/New_York")
+        self.scheduler.daily("9:00", pacific, tz="America/Los_Angeles")
+        self.assertEqual(self.scheduler.next_time(), MIDNIGHT + 13 * 3600)
+
+        self.clock.now = MIDNIGHT + 13 * 3600
+        self.assertEqual(self.scheduler.run_pending(), 1)
+        self.assertEqual(self.scheduler.next_time(), MIDNIGHT + 16 * 3600)
+
+        self.clock.now = MIDNIGHT + 16 * 3600
+        self.assertEqual(self.scheduler.run_pending(), 1)
+        self.assertEqual(self.scheduler.next_time(), MIDNIGHT + 37 * 3600)
+        self.assertEqual((eastern.call_count, pacific.call_count), (1, 1))
+
+    def test_at(self):
+        """
+        Test jobs scheduled at a time run once
+        """
+        func = mock.MagicMock()
+        job = self.scheduler.at(MIDNIGHT + 60, func)
+        self.assertEqual(len(self.scheduler), 1)
+        self.assertEqual(self.scheduler.idle_seconds(), 60)
+
+        self.clock.now += 60
+        self.assertEqual(self.scheduler.run_pending(), 1)
+        self.assertEqual(self.scheduler.run_pending(), 0)
+        self.assertEqual(len(self.scheduler), 0)
+        self.assertIsNone(self.scheduler.next_time())
+        self.assertIsNone(job.due)
+
+        # A job can reschedule itself when it runs
+        def again():
+            func()
+            self.scheduler.at(self.clock() + 30, again)
+
+        self.scheduler.at(self.clock(), again)
+        self.assertEqual(self.scheduler.run_pending(), 1)
+        self.assertEqual(self.scheduler.idle_seconds(), 30)
+        self.assertEqual(len(self.scheduler), 1)
+        self.assertEqual(func.call_count, 2)
+
+    def test_jitter(self):
+        """
+        Test jitter delays jobs without accumulating
+        """
+        job = self.scheduler.every(10, mock.MagicMock(), jitter=5)
+        for _ in range(20):
+            self.assertGreaterEqual(job.due, job.base)
+            self.assertLessEqual(job.due, job.base + 5)
+            self.clock.now = job.due
+            self.scheduler.run_pending()
+
+        self.assertEqual(job.base, MIDNIGHT + 210)
+
+    def test_cancel_and_clear(self):
+        """
+        Test cancelled jobs do not run
+        """
+        func = mock.MagicMock()
+        first = self.scheduler.every(5, func)
+        self.scheduler.every(10, func)
+        self.assertEqual(len(self.scheduler), 2)
+
+        self.scheduler.cancel(first)
+        self.scheduler.cancel(first)
+        self.assertEqual(len(self.scheduler), 1)
+        self.assertEqual(self.scheduler.idle_seconds(), 10)
+
+        self.clock.now += 10
+        self.assertEqual(self.scheduler.run_pending(), 1)
+
+        self.scheduler.clear()
+        self.assertEqual(len(self.scheduler), 0)
+        self.assertIsNone(self.scheduler.idle_seconds())
+
+    def test_failures_and_wakeup(self):
+        """
+        Test failing jobs do not stop others and earlier jobs wake the loop
+        """
+        wakeup = mock.MagicMock()
+        scheduler = Scheduler(timer=self.clock, wakeup=wakeup)
+
+        func = mock.MagicMock()
+        scheduler.every(10, mock.MagicMock(side_effect=ValueError("bad")))
+        scheduler.every(20, func)
+        scheduler.every(5, func)
+        self.assertEqual(wakeup.call_count, 2)
+
+        self.clock.now += 20
+        self.assertEqual(scheduler.run_pending(), 3)
+        self.assertEqual(func.call_count, 2)
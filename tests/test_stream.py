@@ -0,0 +1,175 @@
+# tests.test_stream
+# Tests for parsing JSON responses with field projection.
+#
+# Author:   Benjamin Bengfort <benjamin@bengfort.com>
+# Created:  Sat Oct 17 18:44:50 2026 -0400
+#
+# Copyright (C) 2016 Bengfort.com
+# For license information, see LICENSE.txt
+#
+# ID: test_stream.py [] benjamin@bengfort.com $
+
+"""
+Tests for parsing JSON responses with field projection.
+"""
+
+##########################################################################
+## Imports
+##########################################################################
+
+import io
+import json
+import unittest
+
+from decimal import Decimal
+from hanish import stream
+from hanish.stream import fieldtree, project, parse, build
+from hanish.forecast import FORECAST_FIELDS, SERIES_FIELDS
+from .test_darksky import WEATHER
+
+try:
+    # Python 3
+    from unittest import mock
+except ImportError:
+    # Python 2
+    import mock
+
+
+##########################################################################
+## Helpers
+##########################################################################
+
+def basic_parse(data):
+    """
+    Yields the (event, value) ijson basic_parse events of the parsed JSON
+    data, e.g. so that building projections is tested without ijson.
+    """
+    if isinstance(data, dict):
+        yield "start_map", None
+        for key, value in data.items():
+            yield "map_key", key
+            for event in basic_parse(value):
+                yield event
+        yield "end_map", None
+    elif isinstance(data, list):
+        yield "start_array", None
+        for item in data:
+            for event in basic_parse(item):
+                yield event
+        yield "end_array", None
+    elif data is None:
+        yield "null", None
+    elif isinstance(data, bool):
+        yield "boolean", data
+    elif isinstance(data, float):
+        # ijson yields non-integer numbers as decimals
+        yield "number", Decimal(repr(data))
+    elif isinstance(data, int):
+        yield "number", data
+    else:
+        yield "string", data
+
+
+class FakeIJSON(object):
+    """
+    Stands in for the ijson library, parsing the stream in full.
+    """
+
+    JSONError = ValueError
+
+    @staticmethod
+    def basic_parse(stream, buf_size):
+        return basic_parse(json.loads(stream.read().decode("utf-8")))
+
+
+##########################################################################
+## Stream Tests
+##########################################################################
+
+class StreamTests(unittest.TestCase):
+
+    def setUp(self):
+        with open(WEATHER, 'rb') as f:
+            self.raw = f.read()
+        self.data = json.loads(self.raw.decode("utf-8"))
+
+    def test_fieldtree(self):
+        """
+        Test dotted paths are compiled into a tree
+        """
+        self.assertEqual(fieldtree(["a", "b.c", "b.d.e"]), {
+            "a": True, "b": {"c": True, "d": {"e": True}},
+        })
+
+        # Shorter paths select everything beneath them
+        self.assertEqual(fieldtree(["a.b", "a", "a.c"]), {"a": True})
+
+    def test_project(self):
+        """
+        Test the projection of parsed JSON
+        """
+        data = project(self.data, ["latitude", "currently.time", "hourly.data.temperature", "missing"])
+        self.assertEqual(data, {
+            "latitude": self.data["latitude"],
+            "currently": {"time": self.data["currently"]["time"]},
+            "hourly": {"data": [
+                {"temperature": point["temperature"]}
+                for point in self.data["hourly"]["data"]
+            ]},
+        })
+
+        self.assertEqual(project(self.data, ["minutely"]), {"minutely": self.data["minutely"]})
+        self.assertEqual(project([1, {"a": 2, "b": 3}], ["a"]), [1, {"a": 2}])
+
+    def test_build(self):
+        """
+        Test building projections from ijson events gives the same projection
+        """
+        for fields in (FORECAST_FIELDS, SERIES_FIELDS, ["daily"], ["unknown"]):
+            tree = fieldtree(fields)
+            self.assertEqual(
+                build(basic_parse(self.data), tree), project(self.data, fields)
+            )
+
+        # Nulls, booleans and nested arrays that are selected or skipped
+        data = {"a": [None, True, [1, 2.5]], "b": {"c": [{"d": None}]}, "e": "f"}
+        self.assertEqual(build(basic_parse(data), fieldtree(["a", "b.c.d"])), {
+            "a": [None, True, [1, 2.5]], "b": {"c": [{"d": None}]},
+        })
+
+        # Scalars and arrays at the root
+        data = [{"a": 1.5, "b": [2]}, 3]
+        self.assertEqual(build(basic_parse(data), fieldtree(["a"])), [{"a": 1.5}, 3])
+        self.assertEqual(build(basic_parse(42), fieldtree(["a"])), 42)
+
+    def test_parse(self):
+        """
+        Test parsing with or without ijson gives the same projection
+        """
+        for fields in (FORECAST_FIELDS, SERIES_FIELDS, ["daily"], ["unknown"]):
+            expected = project(self.data, fields)
+
+            # Incremental if ijson is installed, otherwise in full
+            for buf_size in (64, 4096):
+                self.assertEqual(parse(io.BytesIO(self.raw), fields, buf_size), expected)
+
+            with mock.patch.object(stream, "ijson", FakeIJSON):
+                self.assertEqual(parse(io.BytesIO(self.raw), fields), expected)
+
+            with mock.patch.object(stream, "ijson", None):
+                self.assertEqual(parse(io.BytesIO(self.raw), fields), expected)
+
+        # Scalars and arrays at the root
+        self.assertEqual(parse(io.BytesIO(b'[{"a": 1.5, "b": [2]}, 3]'), ["a"]), [{"a": 1.5}, 3])
+        self.assertEqual(parse(io.BytesIO(b'42'), ["a"]), 42)
+
+    def test_parse_errors(self):
+        """
+        Test malformed JSON raises a parse error
+        """
+        with self.assertRaises(stream.PARSE_ERRORS):
+            parse(io.BytesIO(self.raw[:-100]), FORECAST_FIELDS)
+
+        with mock.patch.object(stream, "ijson", None):
+            with self.assertRaises(stream.PARSE_ERRORS):
+                parse(io.BytesIO(self.raw[:-100]), FORECAST_FIELDS)
@@ -0,0 +1,201 @@
+# tests.test_subscriptions
+# Tests for channel subscriptions to scheduled weather broadcasts.
+#
+# Author:   Benjamin Bengfort <benjamin@bengfort.com>
+# Created:  Sat Oct 17 21:20:44 2026 -0400
+#
+# Copyright (C) 2016 Bengfort.com
+# For license information, see LICENSE.txt
+#
+# ID: test_subscriptions.py [] benjamin@bengfort.com $
+
+"""
+Tests for channel subscriptions to scheduled weather broadcasts.
+"""
+
+##########################################################################
+## Imports
+##########################################################################
+
+import os
+import time
+import shutil
+import tempfile
+import unittest
+
+from datetime import datetime
+from hanish.exceptions import HanishValueError, DatabaseError
+from hanish.subscriptions import Subscriptions, Subscription
+from .test_cache import Clock
+
+try:
+    # Python 3
+    from unittest import mock
+except ImportError:
+    # Python 2
+    import mock
+
+
+def localtime(hour, minute=0, day=10):
+    """
+    Returns the timestamp of a local time of day in May 2017.
+    """
+    return time.mktime(datetime(2017, 5, day, hour, minute).timetuple())
+
+
+##########################################################################
+## Subscriptions Tests
+##########################################################################
+
+class SubscriptionsTests(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock(localtime(8))
+        self.subs = Subscriptions(timer=self.clock)
+
+    def test_next_time(self):
+        """
+        Test subscriptions are next due today or tomorrow
+        """
+        sub = Subscription("#general", "20001", 9, 0)
+        self.assertEqual(self.subs.next_time(sub, localtime(8)), localtime(9))
+        self.assertEqual(self.subs.next_time(sub, localtime(9)), localtime(9, day=11))
+        self.assertEqual(self.subs.next_time(sub, localtime(10)), localtime(9, day=11))
+
+    def test_same_time_different_timezones(self):
+        """
+        Test subscriptions due at the same time are never compared
+        """
+        with mock.patch.object(Subscriptions, "next_time", return_value=localtime(9)):
+            self.subs.subscribe("#general", "20001", "9:00")
+            self.subs.subscribe("#general", "20001", "9:00", "America/New_York")
+            self.subs.subscribe("#general", "20001", "9:00")
+
+            self.clock.now = localtime(9)
+            self.assertEqual(self.subs.due(), [Subscription("#general", "20001", 9, 0)])
+
+    def test_timezone(self):
+        """
+        Test subscriptions are due at the time of day in their timezone
+        """
+        sub = self.subs.subscribe("#general", "90210", "9:00", "America/Los_Angeles")
+        self.assertEqual(sub.timezone, "America/Los_Angeles")
+
+        # 9:00 PDT on May 10, 2017 is 16:00 UTC
+        now = 1494403200.0 # 8:00 UTC
+        self.assertEqual(self.subs.next_time(sub, now), now + 8 * 3600)
+
+        with self.assertRaises(HanishValueError):
+            self.subs.subscribe("#general", "90210", "9:00", "Mars/Olympus_Mons")
+        self.assertEqual(self.subs.channel("#general"), [sub])
+
+    def test_due(self):
+        """
+        Test subscriptions are due once per day in order
+        """
+        self.subs.subscribe("#general", "20001", "9:00")
+        self.subs.subscribe("#random", "20001", "8:30")
+        self.subs.subscribe("#random", "90210", "12:00")
+        self.assertEqual(self.subs.next(), localtime(8, 30))
+        self.assertEqual(self.subs.due(), [])
+
+        self.clock.now = localtime(9)
+        self.assertEqual(self.subs.due(), [
+            Subscription("#random", "20001", 8, 30),
+            Subscription("#general", "20001", 9, 0),
+        ])
+        self.assertEqual(self.subs.due(), [])
+        self.assertEqual(self.subs.next(), localtime(12))
+
+        self.clock.now = localtime(9, day=11)
+        self.assertEqual(len(self.subs.due()), 3)
+        self.assertEqual(len(self.subs), 3)
+
+    def test_resubscribe_and_unsubscribe(self):
+        """
+        Test replaced and removed subscriptions are not due
+        """
+        self.subs.subscribe("#general", "20001", "9:00")
+        self.subs.subscribe("#general", "20001", "10:00")
+        self.subs.subscribe("#random", "20001", "9:00")
+        self.subs.unsubscribe("#random", "20001")
+
+        with self.assertRaises(HanishValueError):
+            self.subs.unsubscribe("#random", "20001")
+
+        self.assertEqual(self.subs.next(), localtime(10))
+        self.assertEqual(self.subs.channel("#general"), [
+            Subscription("#general", "20001", 10, 0),
+        ])
+
+        self.clock.now = localtime(11)
+        self.assertEqual(self.subs.due(), [Subscription("#general", "20001", 10, 0)])
+        self.assertEqual(len(self.subs.heap), 1)
+
+    def test_subscribe_default(self):
+        """
+        Test default subscriptions are only made once
+        """
+        self.assertEqual(
+            self.subs.subscribe_default("#general", "20001", "9:00"),
+            Subscription("#general", "20001", 9, 0),
+        )
+
+        # Changes to and removal of the default are kept
+        self.subs.subscribe("#general", "20001", "7:30")
+        self.assertIsNone(self.subs.subscribe_default("#general", "20001", "9:00"))
+        self.assertEqual(self.subs.channel("#general"), [
+            Subscription("#general", "20001", 7, 30),
+        ])
+
+        self.subs.unsubscribe("#general", "20001")
+        self.assertIsNone(self.subs.subscribe_default("#general", "20001", "9:00"))
+        self.assertEqual(len(self.subs), 0)
+
+        # Existing subscriptions are not replaced by a new default
+        self.subs.subscribe("#random", "90210", "8:30")
+        self.assertIsNone(self.subs.subscribe_default("#random", "90210", "9:00"))
+        self.assertEqual(self.subs.channel("#random"), [
+            Subscription("#random", "90210", 8, 30),
+        ])
+
+        # Invalid defaults are not recorded as made
+        with self.assertRaises(HanishValueError):
+            self.subs.subscribe_default("#weather", "20001", "9:00", "Mars/Olympus_Mons")
+        self.assertIsNotNone(self.subs.subscribe_default("#weather", "20001", "9:00"))
+
+    def test_persistence(self):
+        """
+        Test subscriptions survive restarts
+        """
+        tmpdir = tempfile.mkdtemp()
+        path = os.path.join(tmpdir, "subscriptions.db")
+
+        try:
+            subs = Subscriptions(path, timer=self.clock)
+            subs.subscribe("#general", "20001", "9:00")
+            subs.subscribe("#general", "20001", "10:00")
+            subs.subscribe("#random", "90210", "8:30")
+            subs.subscribe("#random", "20742", "12:00")
+            subs.unsubscribe("#random", "20742")
+            subs.close()
+
+            with self.assertRaises(DatabaseError):
+                subs.subscribe("#random", "20742", "12:00")
+
+            # The heap is rebuilt from the database
+            subs = Subscriptions(path, timer=self.clock)
+            self.assertEqual(len(subs), 2)
+            self.assertEqual(subs.channel("#general"), [
+                Subscription("#general", "20001", 10, 0),
+            ])
+            self.assertEqual(subs.next(), localtime(8, 30))
+
+            self.clock.now = localtime(11)
+            self.assertEqual(subs.due(), [
+                Subscription("#random", "90210", 8, 30),
+                Subscription("#general", "20001", 10, 0),
+            ])
+            subs.close()
+        finally:
+            shutil.rmtree(tmpdir)
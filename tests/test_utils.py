@@ -17,7 +17,9 @@ Testing the hanish utilities module
 ## Imports
 ##########################################################################
 
+import time
 import unittest
+import threading
 
 from hanish.utils import *
 
@@ -46,3 +48,82 @@ class DecoratorsTests(unittest.TestCase):
         self.assertFalse(hasattr(thing, '_attr'))
         self.assertEqual(thing.attr, 42)
         self.assertTrue(hasattr(thing, '_attr'))
+
+
+##########################################################################
+## Concurrency Tests
+##########################################################################
+
+class SingleFlightTests(unittest.TestCase):
+    """
+    Test deduplication of concurrent calls.
+    """
+
+    def run_concurrently(self, flights, func, n=5):
+        """
+        Runs n concurrent calls for the same key, waiting until the calls
+        that are not in flight are collapsed before releasing the first.
+        """
+        release = threading.Event()
+        results = []
+
+        def call():
+            try:
+                results.append(flights.do("key", func, release))
+            except Exception as e:
+                results.append(e)
+
+        threads = [threading.Thread(target=call) for _ in range(n)]
+        for thread in threads:
+            thread.start()
+
+        # Wait for all but the first call to be collapsed
+        deadline = time.time() + 5
+        while flights.collapsed < n - 1 and time.time() < deadline:
+            time.sleep(0.001)
+
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        return results
+
+    def test_collapsed_calls(self):
+        """
+        Test that concurrent calls for a key share one result
+        """
+        calls = []
+        def func(release):
+            calls.append(1)
+            release.wait(5)
+            return object()
+
+        flights = SingleFlight()
+        results = self.run_concurrently(flights, func)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(results), 5)
+        self.assertEqual(len(set(id(result) for result in results)), 1)
+        self.assertEqual((flights.calls, flights.collapsed), (1, 4))
+        self.assertEqual(flights.flights, {})
+
+        # Once completed, the next call is made again
+        release = threading.Event()
+        release.set()
+        flights.do("key", func, release)
+        self.assertEqual(len(calls), 2)
+
+    def test_shared_exceptions(self):
+        """
+        Test that concurrent calls for a key share one exception
+        """
+        def func(release):
+            release.wait(5)
+            raise ValueError("upstream failure")
+
+        flights = SingleFlight()
+        results = self.run_concurrently(flights, func)
+
+        self.assertEqual(len(results), 5)
+        for result in results:
+            self.assertIsInstance(result, ValueError)
+        self.assertEqual(flights.flights, {})
@@ -18,16 +18,50 @@ Test the zipcode to latitutide,longitude lookup database.
 ##########################################################################
 
 import os
+import shutil
+import tempfile
 import unittest
+import warnings
 
-from hanish.zipcode import ZipCodeDB
-from hanish.exceptions import HanishValueError
+from array import array
+from collections import OrderedDict
+from hanish.zipcode import ZipCodeDB, ArrayZipCodeDB, ZipCodeIndex, extend
+from hanish.exceptions import DatabaseError, HanishValueError
 
 
 FIXTURES = os.path.join(os.path.dirname(__file__), "..", "fixtures")
 ZIPCODES = os.path.join(FIXTURES, "ziplatlon.csv")
 
 
+##########################################################################
+## Helpers
+##########################################################################
+
+def assertLookupMany(test, zipdb):
+    """
+    Asserts the batch lookup behavior shared by zip code database backends.
+    """
+    zipcodes = ['20001', 'notazip', '58054', '99999', '20001', '02124']
+    coords, unknown = zipdb.lookup_many(zipcodes)
+
+    test.assertEqual(list(coords.keys()), ['20001', '58054', '02124'])
+    test.assertEqual(coords['20001'], (38.910353, -77.017739))
+    test.assertEqual(coords['58054'], (46.416876, -97.668726))
+    test.assertEqual(coords['02124'], (42.285805, -71.070571))
+    test.assertEqual(unknown, ['notazip', '99999'])
+
+    # Batches larger than a single query chunk
+    coords, unknown = zipdb.lookup_many(
+        "{:05d}".format(key) for key in range(20000, 21200)
+    )
+    test.assertEqual(len(coords) + len(unknown), 1200)
+    for zipcode, expected in coords.items():
+        test.assertEqual(zipdb.lookup(zipcode), expected)
+
+    # Empty batches
+    test.assertEqual(zipdb.lookup_many([]), (OrderedDict(), []))
+
+
 ##########################################################################
 ## ZipCodeDB Tests
 ##########################################################################
@@ -80,3 +114,199 @@ class ZipCodeDBTests(unittest.TestCase):
         """
         zipdb = ZipCodeDB.load(ZIPCODES)
         self.assertEqual(zipdb.count(), 33144)
+
+    def test_lookup_many(self):
+        """
+        Test batch lookups of zipcodes with unknown zipcodes
+        """
+        zipdb = ZipCodeDB.load(ZIPCODES)
+        assertLookupMany(self, zipdb)
+
+    def test_deprecated(self):
+        """
+        Test loading the sqlite zipcode database is deprecated
+        """
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            ZipCodeDB.load(ZIPCODES).close()
+
+        self.assertEqual(len(caught), 1)
+        self.assertIs(caught[0].category, DeprecationWarning)
+
+
+##########################################################################
+## ArrayZipCodeDB Tests
+##########################################################################
+
+class ArrayZipCodeDBTests(unittest.TestCase):
+
+    def test_database_loading_lookup_and_close(self):
+        """
+        Integration test for loading and looking up zipcodes in arrays
+        """
+        zipdb = ArrayZipCodeDB.load(ZIPCODES)
+
+        table = (
+            ('20001', (38.910353, -77.017739)),
+            ('58054', (46.416876, -97.668726)),
+            ('94020', (37.274612, -122.23242)),
+            ('20742', (38.989619, -76.945695)),
+            ('98201', (48.006311, -122.210044)),
+            ('10706', (40.989821, -73.867552)),
+            ('02124', (42.285805, -71.070571)),
+            ('00601', (18.180555, -66.749961)),
+        )
+
+        for zipcode, expected in table:
+            self.assertEqual(expected, zipdb.lookup(zipcode))
+
+        zipdb.close()
+        with self.assertRaises(DatabaseError):
+            zipdb.lookup('20001')
+
+    def test_unloaded_database_and_not_found(self):
+        """
+        Test array zipcode database behavior when not loaded or not found
+        """
+        zipdb = ArrayZipCodeDB()
+        self.assertEqual(zipdb.count(), 0)
+
+        for zipcode in ('20001', '58054', '00000', '99999', 'notazip', '2000', '200011'):
+            with self.assertRaises(HanishValueError):
+                zipdb.lookup(zipcode)
+
+    def test_non_ascii_digits(self):
+        """
+        Test zipcodes of non-ASCII digits are not found in the arrays
+        """
+        zipdb = ArrayZipCodeDB.load(ZIPCODES)
+        zipcode = u"\u00b9\u00b2\u00b3\u2074\u2075"
+
+        with self.assertRaises(HanishValueError):
+            zipdb.lookup(zipcode)
+
+        coords, unknown = zipdb.lookup_many([zipcode, "20001"])
+        self.assertEqual(list(coords), ["20001"])
+        self.assertEqual(unknown, [zipcode])
+
+    def test_database_count(self):
+        """
+        Test counting the number of zipcodes in the array database
+        """
+        zipdb = ArrayZipCodeDB.load(ZIPCODES)
+        self.assertEqual(zipdb.count(), 33144)
+
+    def test_lookup_many(self):
+        """
+        Test batch lookups of zipcodes in arrays with unknown zipcodes
+        """
+        zipdb = ArrayZipCodeDB.load(ZIPCODES)
+        assertLookupMany(self, zipdb)
+
+    def test_nearest_and_within(self):
+        """
+        Test reverse geocoding coordinates to the nearest zipcodes
+        """
+        zipdb = ArrayZipCodeDB.load(ZIPCODES)
+
+        # The nearest zipcode to a zipcode's coordinates is itself
+        for zipcode in ('20001', '58054', '02124', '00601'):
+            lat, lon = zipdb.lookup(zipcode)
+            nearest = zipdb.nearest(lat, lon)
+            self.assertEqual(nearest, [(zipcode, 0.0)])
+
+        # Nearest results are sorted by distance
+        nearest = zipdb.nearest(38.910353, -77.017739, k=10)
+        self.assertEqual(len(nearest), 10)
+        self.assertEqual(nearest, sorted(nearest, key=lambda z: z[1]))
+
+        # Within results are all inside the radius and include the nearest
+        within = zipdb.within(38.910353, -77.017739, 5)
+        self.assertEqual(within[0], ('20001', 0.0))
+        self.assertTrue(all(dist <= 5 for _, dist in within))
+        self.assertTrue(set(nearest[:3]) <= set(within))
+
+
+##########################################################################
+## ZipCodeIndex Tests
+##########################################################################
+
+class ZipCodeIndexTests(unittest.TestCase):
+
+    def setUp(self):
+        # Copy the zip codes fixture to a temporary directory
+        self.tmpdir = tempfile.mkdtemp()
+        self.source = os.path.join(self.tmpdir, "ziplatlon.csv")
+        shutil.copy(ZIPCODES, self.source)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_index_compile_and_lookup(self):
+        """
+        Test compiling the index and looking up zipcodes
+        """
+        index = ZipCodeIndex.open(self.source)
+        self.assertTrue(os.path.exists(self.source + ".idx"))
+        self.assertEqual(len(index), 33144)
+
+        self.assertEqual(index.lookup('20001'), (38.910353, -77.017739))
+        self.assertEqual(index.lookup('02124'), (42.285805, -71.070571))
+        self.assertIsNone(index.find('99999'))
+        self.assertIsNone(index.find('notazip'))
+
+        with self.assertRaises(HanishValueError):
+            index.lookup('notazip')
+
+        # Keys must be sorted for binary search
+        keys = list(index.keys)
+        self.assertEqual(keys, sorted(keys))
+        index.close()
+
+    def test_index_columns(self):
+        """
+        Test reading the columns of the memory mapped index on Python 2 and 3
+        """
+        index = ZipCodeIndex.open(self.source)
+        try:
+            self.assertEqual(len(index.keys), 33144)
+            self.assertEqual(len(index.latitudes), 33144)
+            self.assertEqual(len(index.longitudes), 33144)
+
+            idx = index.find('20001')
+            self.assertEqual(index.keys[idx], 20001)
+            self.assertEqual(index.latitudes[idx], 38.910353)
+            self.assertEqual(index.longitudes[idx], -77.017739)
+
+            # Copying the columns into arrays as the array database does
+            keys = array('I')
+            extend(keys, index.keys)
+            self.assertEqual(list(keys), list(index.keys))
+        finally:
+            index.close()
+
+        self.assertIsNone(index.keys)
+
+    def test_index_freshness(self):
+        """
+        Test that the index is only recompiled when the source changes
+        """
+        index = ZipCodeIndex.open(self.source)
+        index.close()
+        self.assertTrue(ZipCodeIndex.isfresh(self.source, index.path))
+
+        # Touching the source without changing it keeps the index fresh
+        stat = os.stat(self.source)
+        os.utime(self.source, (stat.st_atime, stat.st_mtime + 10))
+        self.assertTrue(ZipCodeIndex.isfresh(self.source, index.path))
+
+        # Changing the content of the source makes the index stale
+        with open(self.source, 'a') as f:
+            f.write("99999,10.000000, -10.000000\n")
+        self.assertFalse(ZipCodeIndex.isfresh(self.source, index.path))
+
+        # Opening the index recompiles it from the new source
+        index = ZipCodeIndex.open(self.source)
+        self.assertEqual(len(index), 33145)
+        self.assertEqual(index.lookup('99999'), (10.0, -10.0))
+        index.close()